@@ -1,32 +1,136 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, Response, current_app, render_template, request, redirect, url_for, flash, jsonify, session, abort
+from flask.cli import AppGroup
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
 from werkzeug.security import check_password_hash
-from models import db, Usuario, Post, Comentario, Like, Seguimiento
+from models import db, Usuario, Post, Comentario, Like, Seguimiento, Trabajo, grafo
 from forms import RegistroForm, LoginForm, PostForm, ComentarioForm, PerfilForm
+from loaders import pagina_feed, pagina_perfil, pagina_destacados
+from comments import pagina_comentarios, serializar, cursor_de
+from pagination import decodificar_cursor
+from counters import recalcular_contadores, COLUMNAS as COLUMNAS_CONTADORES
+from timeline import timelines
+from images import imagenes
+from search import buscador
+from recommendations import calcular_recomendaciones, sugerencias
+from user_cache import cache_usuarios
+from metrics import metricas
+from fragments import fragmentos
+from like_buffer import buffer_likes
+from events import eventos
+from assets import assets
+from ranking import ranking
+from archive import archivo
+from jobs import trabajos, serializar as serializar_trabajo, ESTADOS
+from database import aplicar_pragmas, configurar_base_de_datos, solo_lectura
+from conditional import condicional, version_feed, version_api_feed, version_perfil, version_plantillas
+from backup import exportar, importar
+from schema import actualizar_esquema
+from seed import sembrar
+from benchmark import ejecutar_benchmark, medir_arranque
+from load_test import ejecutar_prueba_carga, leer_mezcla, tabla_nivel, MEZCLA_POR_DEFECTO
+import click
+import json
 import os
+import time
 from datetime import datetime
-
-app = Flask(__name__)
-# Usar variables de entorno en producción, o valores por defecto en desarrollo
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'tu-clave-secreta-super-segura-cambiar-en-produccion')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///redsocial.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = 'static/uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
+from sqlalchemy.orm import configure_mappers
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
-db.init_app(app)
-
 login_manager = LoginManager()
-login_manager.init_app(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Por favor, inicia sesión para acceder a esta página.'
 
+# Las vistas y los comandos se declaran en el módulo y create_app los registra en la aplicación
+_rutas = []
+comandos = AppGroup('comandos')
+
+def ruta(regla, **opciones):
+    """Como @app.route, pero la vista se registra al crear la aplicación"""
+    def decorador(vista):
+        _rutas.append((regla, vista, opciones))
+        return vista
+    return decorador
+
+def create_app(configuracion=None):
+    """Crear la aplicación (gunicorn: "app:create_app()"; `flask --app app` la encuentra sola)
+
+    No hace E/S: las tablas y carpetas las crea `flask --app app preparar`
+    en la fase release del deploy, no cada worker al arrancar.
+    """
+    app = Flask(__name__)
+    # Usar variables de entorno en producción, o valores por defecto en desarrollo
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'tu-clave-secreta-super-segura-cambiar-en-produccion')
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///redsocial.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Réplica de solo lectura opcional para el feed, los perfiles y la búsqueda
+    app.config['SQLALCHEMY_REPLICA_URI'] = os.environ.get('DATABASE_REPLICA_URL')
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    app.config['UPLOAD_FOLDER'] = 'static/uploads'
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
+    # PERFILADOR=1 guarda perfiles cProfile de una muestra de peticiones lentas
+    app.config['METRICAS_PERFILADOR'] = os.environ.get('PERFILADOR') == '1'
+    # /metrics: desde fuera de la máquina hace falta `Authorization: Bearer $METRICAS_TOKEN`
+    app.config['METRICAS_TOKEN'] = os.environ.get('METRICAS_TOKEN')
+    app.config['METRICAS_IPS'] = tuple(os.environ.get('METRICAS_IPS', '127.0.0.1,::1').split(','))
+    # LIKES_DIFERIDOS=1 acumula los likes en memoria y los escribe por lotes (like_buffer.py)
+    app.config['LIKES_DIFERIDOS'] = os.environ.get('LIKES_DIFERIDOS') == '1'
+    # Con varios workers de gunicorn (WEB_CONCURRENCY, ver gunicorn.conf.py) los eventos en tiempo
+    # real tienen que pasar por la base ('sql'); 'memoria' solo sirve con un único proceso
+    workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+    app.config['EVENTOS_BACKEND'] = os.environ.get('EVENTOS_BACKEND', 'sql' if workers > 1 else 'memoria')
+    # Cada conexión SSE ocupa un thread: por defecto como mucho la mitad de los de cada worker
+    threads = int(os.environ.get('GUNICORN_THREADS', 16))
+    app.config['EVENTOS_CONEXIONES_MAX'] = int(os.environ.get('EVENTOS_CONEXIONES_MAX', max(1, threads // 2)))
+    # TRABAJOS_EN_PROCESO=1 atiende la cola en un hilo de cada worker web (sin proceso `trabajador`)
+    app.config['TRABAJOS_EN_PROCESO'] = os.environ.get('TRABAJOS_EN_PROCESO') == '1'
+    app.config.update(configuracion or {})
+
+    configurar_base_de_datos(app)
+    db.init_app(app)
+    with app.app_context():
+        aplicar_pragmas(app, db.engines.values())
+    metricas.init_app(app)
+    login_manager.init_app(app)
+
+    timelines.init_app(app)
+    imagenes.init_app(app)
+    buscador.init_app(app)
+    cache_usuarios.init_app(app)
+    fragmentos.init_app(app)
+    buffer_likes.init_app(app)
+    eventos.init_app(app)
+    trabajos.init_app(app)
+    assets.init_app(app)
+    ranking.init_app(app)
+    archivo.init_app(app)
+    app.add_template_global(cursor_de, 'cursor_comentarios')
+
+    for regla, vista, opciones in _rutas:
+        app.add_url_rule(regla, view_func=vista, **opciones)
+    app.register_error_handler(404, not_found)
+    for comando in comandos.commands.values():
+        app.cli.add_command(comando)
+    return app
+
+def precalentar(app):
+    """Hacer en el proceso maestro de gunicorn lo que cada worker haría en su primera petición
+
+    Con preload_app los workers heredan por fork los mappers de SQLAlchemy
+    configurados, las plantillas compiladas y el mapa de URLs.
+    """
+    configure_mappers()
+    app.url_map.update()
+    for nombre in app.jinja_env.list_templates():
+        app.jinja_env.get_template(nombre)
+    with app.app_context():
+        version_plantillas()
+
 @login_manager.user_loader
 def load_user(user_id):
-    return Usuario.query.get(int(user_id))
+    return cache_usuarios.cargar(int(user_id))
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -36,24 +140,262 @@ def save_uploaded_file(file):
         filename = secure_filename(file.filename)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
         filename = timestamp + filename
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
         file.save(filepath)
         return filename
     return None
 
+def leer_cursor(decodificar=decodificar_cursor):
+    """Cursor de paginación del query string (None para la primera página)"""
+    cursor = request.args.get('cursor')
+    if not cursor:
+        return None
+    try:
+        return decodificar(cursor)
+    except ValueError:
+        abort(400)
+
+def render_feed(vista, posts, siguiente, endpoint_pagina):
+    """Página completa del feed en una de sus vistas (recientes, destacados, tendencias)"""
+    return render_template('feed.html', vista=vista, posts=posts, siguiente=siguiente,
+                           url_pagina=url_for(endpoint_pagina),
+                           sugerencias=sugerencias(current_user),
+                           post_form=PostForm(), comentario_form=ComentarioForm())
+
+def render_pagina(posts, siguiente):
+    """Respuesta JSON del scroll infinito con las tarjetas de la página siguiente"""
+    html = render_template('_post_cards.html', posts=posts, comentario_form=ComentarioForm())
+    return jsonify({'html': html, 'siguiente': siguiente})
+
 def init_db():
-    """Inicializa la base de datos y crea las carpetas necesarias"""
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-    with app.app_context():
-        db.create_all()
+    """Inicializa la base de datos y crea las carpetas necesarias (dentro de un contexto de la app)
+
+    Devuelve las columnas que se agregaron a tablas existentes.
+    """
+    os.makedirs(current_app.config['UPLOAD_FOLDER'], exist_ok=True)
+    agregadas = actualizar_esquema()
+    # La tabla del índice de búsqueda no es un modelo: create_all no la crea
+    if buscador.crear_indice():
+        buscador.reindexar()
+    return agregadas
+
+@comandos.command('preparar')
+def preparar_command():
+    """Crear o completar las tablas y carpetas que falten (fase release del deploy, una vez por versión)"""
+    agregadas = init_db()
+    for columna in sorted(agregadas):
+        click.echo(f'Columna agregada: {columna}')
+    if agregadas & COLUMNAS_CONTADORES:
+        posts, usuarios = recalcular_contadores()
+        click.echo(f'Contadores rellenados: {posts} publicaciones, {usuarios} usuarios')
+    if 'post.puntaje' in agregadas:
+        ranking.recalcular()
+        click.echo('Puntajes de "Destacados" y "Tendencias" calculados')
+    click.echo('Base de datos y carpetas listas')
+
+@comandos.command('recalcular-contadores')
+def recalcular_contadores_command():
+    """Reconstruir los contadores de likes, comentarios y seguidores"""
+    posts, usuarios = recalcular_contadores()
+    click.echo(f'Contadores corregidos: {posts} publicaciones, {usuarios} usuarios')
+
+@comandos.command('reconstruir-timelines')
+def reconstruir_timelines_command():
+    """Regenerar los timelines materializados del feed"""
+    usuarios = timelines.reconstruir()
+    click.echo(f'Timelines reconstruidos: {usuarios} usuarios')
+
+@comandos.command('recortar-timelines')
+def recortar_timelines_command():
+    """Eliminar las entradas que exceden TIMELINE_MAX en cada timeline"""
+    eliminadas = timelines.store.recortar()
+    db.session.commit()
+    click.echo(f'Entradas eliminadas: {eliminadas}')
+
+@comandos.command('reindexar-busqueda')
+def reindexar_busqueda_command():
+    """Reconstruir el índice de búsqueda de usuarios"""
+    total = buscador.reindexar()
+    click.echo(f'Usuarios indexados: {total}')
+
+@comandos.command('calcular-recomendaciones')
+@click.option('--top-k', default=10, help='Sugerencias guardadas por usuario')
+@click.option('--lote', default=1000, help='Usuarios procesados por transacción')
+def calcular_recomendaciones_command(top_k, lote):
+    """Recalcular las sugerencias "personas que quizás conozcas" (tarea periódica)"""
+    total = calcular_recomendaciones(top_k=top_k, lote=lote)
+    click.echo(f'Sugerencias guardadas: {total}')
+
+@comandos.command('construir-assets')
+def construir_assets_command():
+    """Minificar, agregar hash al nombre y precomprimir los archivos de static/ (en el build)"""
+    manifiesto = assets.construir()
+    click.echo(f'Assets generados: {len(manifiesto["rutas"])} archivos, {manifiesto["bytes"]} bytes '
+               f'(versión {manifiesto["version"]})')
+
+@comandos.command('trabajador')
+@click.option('--hasta-vaciar', is_flag=True, help='Salir cuando no queden trabajos disponibles')
+def trabajador_command(hasta_vaciar):
+    """Ejecutar los trabajos en segundo plano de la cola (proceso `worker` del Procfile)"""
+    ejecutados = trabajos.trabajador(hasta_vaciar=hasta_vaciar)
+    click.echo(f'Trabajos ejecutados: {ejecutados}')
+
+@comandos.command('trabajos')
+@click.option('--reintentar', is_flag=True, help='Volver a encolar los trabajos fallidos')
+def trabajos_command(reintentar):
+    """Mostrar cuántos trabajos hay por tipo y estado, y los últimos fallidos"""
+    if reintentar:
+        click.echo(f'Trabajos reencolados: {trabajos.reintentar_fallidos()}')
+    resumen = trabajos.resumen()
+    for tipo in sorted({tipo for tipo, _ in resumen}):
+        conteos = ', '.join(f'{estado}={resumen[(tipo, estado)]}' for estado in ESTADOS if (tipo, estado) in resumen)
+        click.echo(f'{tipo}: {conteos}')
+    for trabajo in Trabajo.query.filter_by(estado='fallido').order_by(Trabajo.id.desc()).limit(10):
+        ultima_linea = (trabajo.error or '').strip().splitlines()[-1:] or ['']
+        click.echo(f'  #{trabajo.id} {trabajo.tipo} ({trabajo.intentos} intentos): {ultima_linea[0]}')
+
+@comandos.command('decaer-ranking')
+def decaer_ranking_command():
+    """Aplicar el decaimiento a los puntajes de los destacados (tarea periódica, cada ~10 minutos)"""
+    activos, enfriados = ranking.decaer()
+    click.echo(f'Puntajes decaídos: {activos} posts activos, {enfriados} pasaron a 0')
+
+@comandos.command('recalcular-ranking')
+def recalcular_ranking_command():
+    """Recalcular desde cero los puntajes de los destacados a partir de likes y comentarios"""
+    click.echo(f'Posts con puntaje: {ranking.recalcular()}')
+
+@comandos.command('archivar')
+@click.option('--dias', type=int, help='Edad mínima de los posts a archivar (por defecto ARCHIVO_EDAD_DIAS)')
+@click.option('--lote', type=int, help='Posts movidos por transacción (por defecto ARCHIVO_LOTE)')
+def archivar_command(dias, lote):
+    """Mover los posts viejos, con sus comentarios y likes, a las tablas de archivo (tarea periódica)"""
+    inicio = time.perf_counter()
+    movidas = archivo.archivar(edad_dias=dias, lote=lote)
+    click.echo(f'Filas archivadas: {movidas} ({time.perf_counter() - inicio:.1f}s)')
+    for tabla, (calientes, archivadas) in archivo.resumen().items():
+        click.echo(f'  {tabla}: {calientes} en caliente, {archivadas} archivadas')
+
+@comandos.command('recuperar-likes')
+def recuperar_likes_command():
+    """Aplicar los diarios de likes diferidos que dejaron workers caídos"""
+    total = buffer_likes.recuperar()
+    click.echo(f'Diarios aplicados: {total}')
+
+@comandos.command('exportar')
+@click.argument('directorio', type=click.Path(file_okay=False))
+def exportar_command(directorio):
+    """Respaldar usuarios, posts, comentarios, likes y seguimientos en NDJSON comprimido"""
+    inicio = time.perf_counter()
+    filas = exportar(directorio)
+    click.echo(f'Filas exportadas: {filas} ({time.perf_counter() - inicio:.1f}s)')
 
-@app.route('/')
+@comandos.command('importar')
+@click.argument('directorio', type=click.Path(exists=True, file_okay=False))
+@click.option('--lote', default=5000, help='Filas por transacción')
+def importar_command(directorio, lote):
+    """Cargar un respaldo de `exportar` (si se corta, volver a ejecutar continúa)"""
+    init_db()
+    inicio = time.perf_counter()
+    filas = importar(directorio, lote=lote)
+    click.echo(f'Filas importadas: {filas} ({time.perf_counter() - inicio:.1f}s)')
+
+    # Tablas derivadas: timelines, índice de búsqueda, sugerencias y destacados
+    timelines.reconstruir()
+    buscador.reindexar()
+    calcular_recomendaciones()
+    ranking.recalcular()
+    click.echo(f'Datos derivados listos ({time.perf_counter() - inicio:.1f}s)')
+
+@comandos.command('sembrar')
+@click.option('--usuarios', default=1000)
+@click.option('--posts', default=10000)
+@click.option('--comentarios', default=20000)
+@click.option('--likes', default=50000)
+@click.option('--seguimientos', default=20000)
+@click.option('--semilla', default=42, help='Misma semilla, mismos datos')
+def sembrar_command(usuarios, posts, comentarios, likes, seguimientos, semilla):
+    """Poblar la base de datos con datos sintéticos reproducibles"""
+    init_db()
+    inicio = time.perf_counter()
+    filas = sembrar(usuarios=usuarios, posts=posts, comentarios=comentarios,
+                    likes=likes, seguimientos=seguimientos, semilla=semilla)
+    click.echo(f'Filas insertadas: {filas} ({time.perf_counter() - inicio:.1f}s)')
+
+    # Tablas derivadas: contadores, timelines, índice de búsqueda, sugerencias y destacados
+    recalcular_contadores()
+    timelines.reconstruir()
+    buscador.reindexar()
+    calcular_recomendaciones()
+    ranking.recalcular()
+    click.echo(f'Datos derivados listos ({time.perf_counter() - inicio:.1f}s)')
+
+@comandos.command('benchmark')
+@click.option('--repeticiones', default=50, help='Peticiones medidas por ruta')
+@click.option('--semilla', default=42)
+@click.option('--salida', type=click.Path(dir_okay=False), help='Guardar el reporte JSON en un archivo')
+def benchmark_command(repeticiones, semilla, salida):
+    """Medir latencia y consultas SQL de las rutas principales"""
+    reporte = ejecutar_benchmark(current_app, repeticiones=repeticiones, semilla=semilla)
+    texto = json.dumps(reporte, indent=2)
+    if salida:
+        with open(salida, 'w') as archivo:
+            archivo.write(texto)
+    click.echo(texto)
+
+@comandos.command('benchmark-arranque')
+@click.option('--repeticiones', default=10, help='Procesos nuevos medidos')
+@click.option('--ruta', 'ruta_medida', default='/login', help='Ruta de la primera petición')
+@click.option('--salida', type=click.Path(dir_okay=False), help='Guardar el reporte JSON en un archivo')
+def benchmark_arranque_command(repeticiones, ruta_medida, salida):
+    """Medir el import, create_app y la primera petición de un worker nuevo (con y sin preload)"""
+    reporte = medir_arranque(current_app.root_path, repeticiones=repeticiones, ruta=ruta_medida)
+    texto = json.dumps(reporte, indent=2)
+    if salida:
+        with open(salida, 'w') as archivo:
+            archivo.write(texto)
+    click.echo(texto)
+
+@comandos.command('prueba-carga')
+@click.option('--concurrencias', default='1,8,32', help='Usuarios simultáneos de cada nivel, separados por comas')
+@click.option('--workers', 'lista_workers', default='2', help='Workers de gunicorn a probar, separados por comas')
+@click.option('--threads', default=16, help='Threads por worker')
+@click.option('--duracion', default=20.0, help='Segundos medidos por nivel')
+@click.option('--calentamiento', default=5.0, help='Segundos sin medir al empezar cada nivel')
+@click.option('--mezcla', default=','.join(f'{accion}={peso}' for accion, peso in MEZCLA_POR_DEFECTO.items()),
+              help='Pesos de las acciones (feed, perfil, like, comentario, seguir, publicar, login)')
+@click.option('--pausa-ms', default=0.0, help='Pausa media entre acciones de cada usuario')
+@click.option('--url', help='Usar un servidor ya levantado en vez de arrancar gunicorn')
+@click.option('--semilla', default=42)
+@click.option('--salida', type=click.Path(dir_okay=False), help='Guardar el reporte JSON en un archivo')
+def prueba_carga_command(concurrencias, lista_workers, threads, duracion, calentamiento, mezcla, pausa_ms,
+                         url, semilla, salida):
+    """Tráfico mixto concurrente contra gunicorn: throughput, latencia y errores por acción"""
+    try:
+        mezcla = leer_mezcla(mezcla)
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint='--mezcla')
+    reporte = ejecutar_prueba_carga(
+        current_app,
+        concurrencias=[int(valor) for valor in concurrencias.split(',')],
+        workers=[int(valor) for valor in lista_workers.split(',')],
+        threads=threads, duracion=duracion, calentamiento=calentamiento, mezcla=mezcla,
+        pausa=pausa_ms / 1000, url=url, semilla=semilla,
+        al_terminar_nivel=lambda resultado: click.echo(tabla_nivel(resultado), err=True)
+    )
+    texto = json.dumps(reporte, indent=2)
+    if salida:
+        with open(salida, 'w') as archivo:
+            archivo.write(texto)
+    click.echo(texto)
+
+@ruta('/')
 def index():
     if current_user.is_authenticated:
         return redirect(url_for('feed'))
     return render_template('index.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@ruta('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
         return redirect(url_for('feed'))
@@ -68,6 +410,8 @@ def register():
         usuario.set_password(form.password.data)
         
         db.session.add(usuario)
+        db.session.flush()
+        buscador.indexar(usuario)
         db.session.commit()
         
         flash('¡Registro exitoso! Ahora puedes iniciar sesión.', 'success')
@@ -75,7 +419,7 @@ def register():
     
     return render_template('register.html', form=form)
 
-@app.route('/login', methods=['GET', 'POST'])
+@ruta('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('feed'))
@@ -93,30 +437,58 @@ def login():
     
     return render_template('login.html', form=form)
 
-@app.route('/logout')
+@ruta('/logout')
 @login_required
 def logout():
     logout_user()
     flash('Has cerrado sesión correctamente.', 'info')
     return redirect(url_for('index'))
 
-@app.route('/feed')
+@ruta('/feed')
 @login_required
+@solo_lectura
+@condicional(version_feed)
 def feed():
-    # Obtener posts de usuarios seguidos y del usuario actual
-    seguidos_ids = [s.seguido_id for s in Seguimiento.query.filter_by(seguidor_id=current_user.id).all()]
-    seguidos_ids.append(current_user.id)
+    # Obtener posts de usuarios seguidos y del usuario actual (timeline precalculado)
+    posts, siguiente = pagina_feed(current_user)
     
-    posts = Post.query.filter(Post.usuario_id.in_(seguidos_ids))\
-                      .order_by(Post.fecha_creacion.desc())\
-                      .limit(50).all()
-    
-    form = PostForm()
-    comentario_form = ComentarioForm()
-    
-    return render_template('feed.html', posts=posts, post_form=form, comentario_form=comentario_form)
+    return render_feed('recientes', posts, siguiente, 'api_feed')
+
+@ruta('/api/feed')
+@login_required
+@solo_lectura
+@condicional(version_api_feed)
+def api_feed():
+    return render_pagina(*pagina_feed(current_user, leer_cursor()))
+
+# Destacados y tendencias cambian de orden con cada like, así que no usan 304
+@ruta('/feed/destacados')
+@login_required
+@solo_lectura
+def feed_destacados():
+    posts, siguiente = pagina_destacados(current_user.id)
+    return render_feed('destacados', posts, siguiente, 'api_feed_destacados')
+
+@ruta('/api/feed/destacados')
+@login_required
+@solo_lectura
+def api_feed_destacados():
+    return render_pagina(*pagina_destacados(current_user.id, leer_cursor(ranking.decodificar_cursor)))
+
+@ruta('/tendencias')
+@login_required
+@solo_lectura
+def tendencias():
+    posts, siguiente = pagina_destacados(current_user.id, todos=True)
+    return render_feed('tendencias', posts, siguiente, 'api_tendencias')
+
+@ruta('/api/tendencias')
+@login_required
+@solo_lectura
+def api_tendencias():
+    return render_pagina(*pagina_destacados(current_user.id, leer_cursor(ranking.decodificar_cursor), todos=True))
 
-@app.route('/post/crear', methods=['POST'])
+@ruta('/post/crear', methods=['POST'])
 @login_required
 def crear_post():
     form = PostForm()
@@ -130,86 +502,155 @@ def crear_post():
         post = Post(
             contenido=form.contenido.data,
             imagen=imagen_filename,
-            usuario_id=current_user.id
+            usuario_id=current_user.id,
+            puntaje=ranking.puntaje_inicial()
         )
         
         db.session.add(post)
+        current_user.posts_count = Usuario.posts_count + 1
+        db.session.flush()
+        timelines.publicar(post, current_user)
+        imagenes.procesar_post(post)
         db.session.commit()
+        cache_usuarios.invalidar(current_user.id)
+        eventos.publicar('post', post_id=post.id, autor_id=current_user.id)
         
         flash('¡Publicación creada exitosamente!', 'success')
     
     return redirect(url_for('feed'))
 
-@app.route('/post/<int:post_id>/like', methods=['POST'])
+@ruta('/post/<int:post_id>/like', methods=['POST'])
 @login_required
 def toggle_like(post_id):
     post = Post.query.get_or_404(post_id)
+    if buffer_likes.activo:
+        le_gusta, cantidad = buffer_likes.alternar(current_user.id, post)
+        eventos.publicar('like', post_id=post.id, autor_id=post.usuario_id, cantidad_likes=cantidad)
+        return jsonify({
+            'accion': 'liked' if le_gusta else 'unliked',
+            'cantidad_likes': cantidad
+        })
+
     like = Like.query.filter_by(usuario_id=current_user.id, post_id=post_id).first()
     
     if like:
         db.session.delete(like)
+        post.likes_count = Post.likes_count - 1
+        ranking.al_quitar_like(post_id, like.fecha_creacion)
         accion = 'unliked'
     else:
         like = Like(usuario_id=current_user.id, post_id=post_id)
         db.session.add(like)
+        post.likes_count = Post.likes_count + 1
+        ranking.al_dar_like(post_id)
         accion = 'liked'
     
     db.session.commit()
+    cantidad = post.cantidad_likes()
+    eventos.publicar('like', post_id=post.id, autor_id=post.usuario_id, cantidad_likes=cantidad)
     
     return jsonify({
         'accion': accion,
-        'cantidad_likes': post.cantidad_likes()
+        'cantidad_likes': cantidad
     })
 
-@app.route('/post/<int:post_id>/comentario', methods=['POST'])
+@ruta('/post/<int:post_id>/comentario', methods=['POST'])
 @login_required
 def crear_comentario(post_id):
     form = ComentarioForm()
     post = Post.query.get_or_404(post_id)
     
-    if form.validate_on_submit():
-        comentario = Comentario(
-            contenido=form.contenido.data,
-            usuario_id=current_user.id,
-            post_id=post_id
-        )
-        
-        db.session.add(comentario)
-        db.session.commit()
-        
-        flash('Comentario agregado.', 'success')
-    else:
-        # Si la validación falla, mostrar errores
-        if form.errors:
-            for field, errors in form.errors.items():
-                for error in errors:
-                    flash(f'Error en {field}: {error}', 'error')
+    if not form.validate_on_submit():
+        return jsonify({'errores': form.errors}), 400
     
-    return redirect(url_for('feed'))
+    comentario = Comentario(
+        contenido=form.contenido.data,
+        usuario_id=current_user.id,
+        post_id=post_id
+    )
 
-@app.route('/usuario/<username>')
+    db.session.add(comentario)
+    post.comentarios_count = Post.comentarios_count + 1
+    ranking.al_comentar(post_id)
+    db.session.commit()
+    fragmentos.invalidar_post(post_id)
+
+    datos = {
+        'comentario': serializar(comentario),
+        'cantidad_comentarios': post.cantidad_comentarios()
+    }
+    eventos.publicar('comentario', post_id=post.id, autor_id=post.usuario_id, **datos)
+    return jsonify(datos), 201
+
+@ruta('/api/post/<int:post_id>/comentarios')
 @login_required
+@solo_lectura
+def api_comentarios(post_id):
+    post = Post.query.get_or_404(post_id)
+    comentarios, siguiente = pagina_comentarios(post.id, leer_cursor())
+    return jsonify({
+        'comentarios': [serializar(comentario) for comentario in comentarios],
+        'siguiente': siguiente
+    })
+
+@ruta('/api/eventos')
+@login_required
+def api_eventos():
+    conexion = eventos.suscribir(current_user.id)
+    if conexion is None:
+        # Worker sin threads libres para otro stream: feed.html reintenta después de `espera`
+        cuerpo, espera = eventos.rechazo()
+        respuesta = Response(cuerpo, status=503, mimetype='text/event-stream')
+        respuesta.headers['Retry-After'] = str(espera)
+        return respuesta
+    respuesta = Response(eventos.transmitir(conexion), mimetype='text/event-stream')
+    # Si el cliente se va antes del primer evento el generador nunca arranca ni libera su lugar
+    respuesta.call_on_close(lambda: eventos.desuscribir(conexion))
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    respuesta.headers['X-Accel-Buffering'] = 'no'  # nginx: no acumular el stream
+    return respuesta
+
+@ruta('/api/trabajos/<int:trabajo_id>')
+@login_required
+def api_trabajo(trabajo_id):
+    trabajo = Trabajo.query.filter_by(id=trabajo_id, usuario_id=current_user.id).first_or_404()
+    return jsonify(serializar_trabajo(trabajo))
+
+@ruta('/usuario/<username>')
+@login_required
+@solo_lectura
+@condicional(version_perfil)
 def perfil(username):
     usuario = Usuario.query.filter_by(username=username).first_or_404()
-    posts = Post.query.filter_by(usuario_id=usuario.id)\
-                      .order_by(Post.fecha_creacion.desc()).all()
+    posts, siguiente = pagina_perfil(usuario, current_user.id)
     
-    # Estadísticas
-    cantidad_seguidores = Seguimiento.query.filter_by(seguido_id=usuario.id).count()
-    cantidad_seguidos = Seguimiento.query.filter_by(seguidor_id=usuario.id).count()
     es_seguido = False
+    te_sigue = False
     
     if current_user.is_authenticated and current_user.id != usuario.id:
         es_seguido = current_user.esta_siguiendo(usuario)
+        te_sigue = grafo.sigue_a(usuario.id, current_user.id)
     
     return render_template('profile.html', 
                          usuario=usuario, 
                          posts=posts,
-                         cantidad_seguidores=cantidad_seguidores,
-                         cantidad_seguidos=cantidad_seguidos,
-                         es_seguido=es_seguido)
+                         siguiente=siguiente,
+                         cantidad_seguidores=usuario.seguidores_count,
+                         cantidad_seguidos=usuario.seguidos_count,
+                         es_seguido=es_seguido,
+                         te_sigue=te_sigue)
 
-@app.route('/usuario/<username>/seguir', methods=['POST'])
+@ruta('/api/usuario/<username>/posts')
+@login_required
+@solo_lectura
+@condicional(version_perfil)
+def api_perfil_posts(username):
+    usuario = Usuario.query.filter_by(username=username).first_or_404()
+    posts, siguiente = pagina_perfil(usuario, current_user.id, leer_cursor())
+    html = render_template('_post_thumbnails.html', posts=posts)
+    return jsonify({'html': html, 'siguiente': siguiente})
+
+@ruta('/usuario/<username>/seguir', methods=['POST'])
 @login_required
 def seguir_usuario(username):
     usuario = Usuario.query.filter_by(username=username).first_or_404()
@@ -219,19 +660,23 @@ def seguir_usuario(username):
     
     if current_user.esta_siguiendo(usuario):
         current_user.dejar_de_seguir(usuario)
+        timelines.dejar_de_seguir(current_user, usuario)
         accion = 'unfollowed'
     else:
         current_user.seguir(usuario)
+        timelines.seguir(current_user, usuario)
         accion = 'followed'
-    
-    cantidad_seguidores = Seguimiento.query.filter_by(seguido_id=usuario.id).count()
+    db.session.commit()
+    cache_usuarios.invalidar(current_user.id, usuario.id)
+    eventos.publicar('seguir', seguidor_id=current_user.id, seguido_id=usuario.id, accion=accion,
+                     cantidad_seguidores=usuario.seguidores_count)
     
     return jsonify({
         'accion': accion,
-        'cantidad_seguidores': cantidad_seguidores
+        'cantidad_seguidores': usuario.seguidores_count
     })
 
-@app.route('/profile/edit', methods=['GET', 'POST'])
+@ruta('/profile/edit', methods=['GET', 'POST'])
 @login_required
 def editar_perfil():
     form = PerfilForm(obj=current_user)
@@ -240,45 +685,70 @@ def editar_perfil():
         current_user.nombre = form.nombre.data
         current_user.biografia = form.biografia.data
         
+        avatar_nuevo = False
         if 'avatar' in request.files:
             archivo = request.files['avatar']
             if archivo.filename:
                 avatar_filename = save_uploaded_file(archivo)
                 if avatar_filename:
                     current_user.avatar = avatar_filename
+                    current_user.avatar_variantes = None
+                    current_user.avatar_placeholder = None
+                    avatar_nuevo = True
         
+        buscador.indexar(current_user)
+        if avatar_nuevo:
+            imagenes.procesar_avatar(current_user)
         db.session.commit()
+        cache_usuarios.invalidar(current_user.id)
+        fragmentos.invalidar_usuario(current_user.id)
         flash('Perfil actualizado exitosamente.', 'success')
         return redirect(url_for('perfil', username=current_user.username))
     
     return render_template('edit_profile.html', form=form)
 
-@app.route('/usuarios')
+@ruta('/usuarios')
 @login_required
+@solo_lectura
 def usuarios():
     query = request.args.get('q', '')
-    usuarios = Usuario.query.filter(
-        Usuario.username.contains(query) | 
-        Usuario.nombre.contains(query)
-    ).limit(20).all()
+    usuarios = buscador.buscar(query, limite=20)
+    seguidos = grafo.cuales_sigue(current_user.id, [usuario.id for usuario in usuarios])
     
-    return render_template('usuarios.html', usuarios=usuarios, query=query)
+    return render_template('usuarios.html', usuarios=usuarios, query=query, seguidos=seguidos)
+
+@ruta('/api/usuarios/buscar')
+@login_required
+@solo_lectura
+def api_buscar_usuarios():
+    usuarios = buscador.buscar(request.args.get('q', ''), limite=8)
+    return jsonify({'usuarios': [
+        {
+            'username': usuario.username,
+            'nombre': usuario.nombre or usuario.username,
+            'url': url_for('perfil', username=usuario.username),
+        }
+        for usuario in usuarios
+    ]})
 
-@app.route('/manifest.json')
+@ruta('/manifest.json')
 def manifest():
-    return app.send_file('static/manifest.json', mimetype='application/json')
+    return assets.servir_fijo('manifest.json')
 
-@app.route('/sw.js')
+@ruta('/sw.js')
 def service_worker():
-    return app.send_file('static/sw.js', mimetype='application/javascript')
+    return assets.servir_fijo('sw.js')
 
-@app.errorhandler(404)
 def not_found(error):
     return render_template('404.html'), 404
 
 if __name__ == '__main__':
+    # Sin proceso trabajador aparte, la cola se atiende en un hilo del servidor de desarrollo
+    app = create_app({'TRABAJOS_EN_PROCESO': os.environ.get('TRABAJOS_EN_PROCESO', '1') == '1',
+                      'EVENTOS_BACKEND': os.environ.get('EVENTOS_BACKEND', 'memoria')})
     # Inicializar base de datos y carpetas al iniciar la aplicación
-    init_db()
+    with app.app_context():
+        init_db()
     # Usar debug solo en desarrollo, no en producción
     debug_mode = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
     port = int(os.environ.get('PORT', 5000))
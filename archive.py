@@ -0,0 +1,132 @@
+"""
+Archivo de posts viejos (datos calientes y fríos)
+Los posts con más de ARCHIVO_EDAD_DIAS días pasan, junto con sus
+comentarios y likes, a tablas de archivo con las mismas columnas; las
+tablas que leen el feed y los perfiles (y sus índices) quedan acotadas a
+la actividad reciente
+"""
+
+from datetime import datetime, timedelta
+from sqlalchemy.orm import joinedload
+from models import (db, Usuario, Post, Comentario, Like, EntradaTimeline,
+                    PostArchivado, ComentarioArchivado, LikeArchivado)
+from pagination import anteriores_a
+
+# (tabla caliente, tabla de archivo, columna con el id del post)
+TABLAS = (
+    (Post.__table__, PostArchivado.__table__, 'id'),
+    (Comentario.__table__, ComentarioArchivado.__table__, 'post_id'),
+    (Like.__table__, LikeArchivado.__table__, 'post_id'),
+)
+
+
+def _copiar(origen, destino, columna_post, post_ids):
+    """INSERT ... SELECT de las filas de `post_ids` con las columnas que tienen en común"""
+    columnas = [columna.name for columna in destino.columns if columna.name in origen.c]
+    db.session.execute(
+        db.insert(destino).from_select(
+            columnas,
+            db.select(*[origen.c[nombre] for nombre in columnas]).where(origen.c[columna_post].in_(post_ids))
+        )
+    )
+
+
+class Archivo:
+    """Extensión de Flask que mueve los posts viejos a las tablas de archivo
+
+    El perfil lee primero la tabla caliente y solo cuando se termina (y el
+    autor tiene posts archivados) consulta también el archivo con el mismo
+    cursor (fecha_creacion, id).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ARCHIVO_EDAD_DIAS', 180)
+        app.config.setdefault('ARCHIVO_LOTE', 500)
+        app.extensions['archivo'] = self
+        self.app = app
+
+    def _protegidos(self):
+        """Posts dueños del id más alto de `post`, `comentario` y `like`
+
+        Quedan en caliente: SQLite (sin AUTOINCREMENT) reutilizaría ids ya
+        archivados si una tabla se quedara sin sus filas más nuevas.
+        """
+        maximos = (
+            db.session.query(db.func.max(Post.id)).scalar_subquery(),
+            db.session.query(Comentario.post_id)
+                      .filter(Comentario.id == db.session.query(db.func.max(Comentario.id)).scalar_subquery())
+                      .scalar_subquery(),
+            db.session.query(Like.post_id)
+                      .filter(Like.id == db.session.query(db.func.max(Like.id)).scalar_subquery())
+                      .scalar_subquery(),
+        )
+        return {post_id for post_id in db.session.execute(db.select(*maximos)).one() if post_id is not None}
+
+    def archivar(self, edad_dias=None, lote=None):
+        """Mover los posts anteriores al corte por lotes; devuelve las filas movidas por tabla
+
+        Cada lote (posts, comentarios, likes, entradas de timeline y
+        contadores de los autores) es una transacción: si se corta, lo ya
+        movido queda consistente y volver a ejecutar sigue desde ahí.
+        """
+        config = self.app.config
+        edad_dias = config['ARCHIVO_EDAD_DIAS'] if edad_dias is None else edad_dias
+        lote = lote or config['ARCHIVO_LOTE']
+        corte = datetime.utcnow() - timedelta(days=edad_dias)
+        protegidos = self._protegidos()
+
+        movidas = {origen.name: 0 for origen, _, _ in TABLAS}
+        while True:
+            filas = db.session.query(Post.id, Post.usuario_id)\
+                              .filter(Post.fecha_creacion < corte, Post.id.notin_(protegidos))\
+                              .order_by(Post.fecha_creacion, Post.id)\
+                              .limit(lote).all()
+            if not filas:
+                break
+            post_ids = [post_id for post_id, _ in filas]
+
+            for origen, destino, columna_post in TABLAS:
+                _copiar(origen, destino, columna_post, post_ids)
+            # Al revés del orden de claves foráneas: primero las entradas de
+            # timeline, likes y comentarios que apuntan a los posts
+            EntradaTimeline.query.filter(EntradaTimeline.post_id.in_(post_ids))\
+                                 .delete(synchronize_session=False)
+            for origen, _, columna_post in reversed(TABLAS):
+                movidas[origen.name] += db.session.execute(
+                    db.delete(origen).where(origen.c[columna_post].in_(post_ids))
+                ).rowcount
+
+            por_autor = {}
+            for _, usuario_id in filas:
+                por_autor[usuario_id] = por_autor.get(usuario_id, 0) + 1
+            for usuario_id, cantidad in por_autor.items():
+                Usuario.query.filter_by(id=usuario_id).update(
+                    {'posts_archivados_count': Usuario.posts_archivados_count + cantidad},
+                    synchronize_session=False
+                )
+            db.session.commit()
+        return movidas
+
+    def pagina_perfil(self, autor_id, cursor=None, limite=20):
+        """Posts archivados de un autor anteriores a `cursor`, del más nuevo al más viejo"""
+        query = PostArchivado.query.options(joinedload(PostArchivado.usuario))\
+                                   .filter(PostArchivado.usuario_id == autor_id)
+        if cursor is not None:
+            query = query.filter(anteriores_a(cursor, PostArchivado.fecha_creacion, PostArchivado.id))
+        return query.order_by(PostArchivado.fecha_creacion.desc(), PostArchivado.id.desc()).limit(limite).all()
+
+    def resumen(self):
+        """Filas en cada tabla caliente y en su archivo"""
+        return {
+            origen.name: (db.session.query(db.func.count()).select_from(origen).scalar(),
+                          db.session.query(db.func.count()).select_from(destino).scalar())
+            for origen, destino, _ in TABLAS
+        }
+
+
+archivo = Archivo()
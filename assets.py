@@ -0,0 +1,257 @@
+"""
+Assets estáticos con el hash del contenido en el nombre
+`flask --app app construir-assets` minifica CSS y JS, copia cada archivo de
+static/ a static/dist/ como `nombre.<hash>.ext` junto con versiones .gz/.br,
+y genera la lista de precache de sw.js; url_for('static', ...) apunta a
+esas copias, que se sirven con caché immutable
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # sin brotli solo se generan las versiones .gz
+    brotli = None
+
+CARPETA = 'dist'
+MANIFIESTO = 'assets.json'
+# Contenido subido por usuarios y la propia salida del build
+EXCLUIDOS = {'uploads', CARPETA}
+# Se sirven con nombre fijo desde /sw.js y /manifest.json
+FIJOS = {'sw.js': 'application/javascript', 'manifest.json': 'application/manifest+json'}
+COMPRIMIBLES = {'.css', '.js', '.json', '.svg', '.txt', '.html', '.map'}
+TAMANO_MINIMO_COMPRESION = 256
+INMUTABLE = 'public, max-age=31536000, immutable'
+# Codificaciones en orden de preferencia y la extensión de su archivo
+CODIFICACIONES = (('br', '.br'), ('gzip', '.gz'))
+
+_CADENAS = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')''')
+_COMENTARIOS_CSS = re.compile(r'/\*.*?\*/', re.S)
+
+
+def minificar_css(texto):
+    """Quitar comentarios y espacios sobrantes sin tocar el contenido de las cadenas"""
+    partes = _CADENAS.split(_COMENTARIOS_CSS.sub('', texto))
+    for indice in range(0, len(partes), 2):
+        parte = re.sub(r'\s+', ' ', partes[indice])
+        parte = re.sub(r'\s*([{};,>])\s*', r'\1', parte)
+        partes[indice] = re.sub(r':\s+', ':', parte).replace(';}', '}')
+    return ''.join(partes).strip()
+
+
+def minificar_js(texto):
+    """Minificación conservadora: sangría, líneas vacías y comentarios de línea completa
+
+    No reescribe expresiones (haría falta un parser de JS); las líneas dentro
+    de template literals multilínea se dejan como están.
+    """
+    lineas = []
+    en_template = False
+    for linea in texto.splitlines():
+        limpia = linea.strip()
+        if not en_template and (not limpia or limpia.startswith('//')):
+            continue
+        lineas.append(linea if en_template else limpia)
+        if (linea.count('`') - linea.count('\\`')) % 2:
+            en_template = not en_template
+    return '\n'.join(lineas) + '\n'
+
+
+def minificar_json(texto):
+    return json.dumps(json.loads(texto), ensure_ascii=False, separators=(',', ':'))
+
+
+MINIFICADORES = {'.css': minificar_css, '.js': minificar_js, '.json': minificar_json}
+
+
+def _escribir(ruta, contenido):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = ruta + '.tmp'
+    with open(temporal, 'wb') as archivo:
+        archivo.write(contenido)
+    os.replace(temporal, ruta)
+
+
+def _escribir_comprimidos(ruta, contenido):
+    """Guardar las versiones precomprimidas y devolver las codificaciones generadas"""
+    if os.path.splitext(ruta)[1] not in COMPRIMIBLES or len(contenido) < TAMANO_MINIMO_COMPRESION:
+        return []
+    codificaciones = ['gzip']
+    _escribir(ruta + '.gz', gzip.compress(contenido, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _escribir(ruta + '.br', brotli.compress(contenido, quality=11))
+        codificaciones.insert(0, 'br')
+    return codificaciones
+
+
+def _leer(ruta):
+    with open(ruta, 'rb') as archivo:
+        contenido = archivo.read()
+    minificar = MINIFICADORES.get(os.path.splitext(ruta)[1])
+    if minificar is not None:
+        contenido = minificar(contenido.decode('utf-8')).encode('utf-8')
+    return contenido
+
+
+def _service_worker(fuente, version, precache):
+    """Completar la versión y la lista de precache en el sw.js de origen"""
+    texto = fuente.decode('utf-8')
+    texto, cambios_version = re.subn(r"^const ASSETS_VERSION = .*;$",
+                                     f'const ASSETS_VERSION = {json.dumps(version)};', texto, flags=re.M)
+    texto, cambios_lista = re.subn(r"^const PRECACHE_ASSETS = .*;$",
+                                   f'const PRECACHE_ASSETS = {json.dumps(precache)};', texto, flags=re.M)
+    if not (cambios_version and cambios_lista):
+        raise ValueError('sw.js tiene que declarar ASSETS_VERSION y PRECACHE_ASSETS en una línea cada una')
+    return minificar_js(texto).encode('utf-8')
+
+
+def construir(carpeta_static):
+    """Generar static/dist/ y su manifiesto; devuelve el manifiesto
+
+    Los archivos con hash de builds anteriores se conservan: los workers
+    que siguen corriendo con el manifiesto viejo los pueden seguir sirviendo.
+    """
+    destino = os.path.join(carpeta_static, CARPETA)
+    rutas, comprimidos, bytes_totales = {}, {}, 0
+    for raiz, carpetas, archivos in os.walk(carpeta_static):
+        if raiz == carpeta_static:
+            carpetas[:] = [carpeta for carpeta in carpetas if carpeta not in EXCLUIDOS]
+        carpetas.sort()
+        for nombre in sorted(archivos):
+            relativo = os.path.relpath(os.path.join(raiz, nombre), carpeta_static).replace(os.sep, '/')
+            if relativo in FIJOS:
+                continue
+            contenido = _leer(os.path.join(raiz, nombre))
+            huella = hashlib.sha256(contenido).hexdigest()[:12]
+            base, extension = os.path.splitext(relativo)
+            con_hash = f'{base}.{huella}{extension}'
+            ruta = os.path.join(destino, con_hash)
+            _escribir(ruta, contenido)
+            comprimidos[con_hash] = _escribir_comprimidos(ruta, contenido)
+            rutas[relativo] = con_hash
+            bytes_totales += len(contenido)
+
+    version = hashlib.sha256(json.dumps(rutas, sort_keys=True).encode()).hexdigest()[:12]
+    precache = [f'/static/{CARPETA}/{con_hash}' for con_hash in sorted(rutas.values())]
+    for nombre in FIJOS:
+        fuente = os.path.join(carpeta_static, nombre)
+        if not os.path.exists(fuente):
+            continue
+        if nombre == 'sw.js':
+            with open(fuente, 'rb') as archivo:
+                contenido = _service_worker(archivo.read(), version, precache)
+        else:
+            contenido = _leer(fuente)
+        ruta = os.path.join(destino, nombre)
+        _escribir(ruta, contenido)
+        comprimidos[nombre] = _escribir_comprimidos(ruta, contenido)
+
+    manifiesto = {'version': version, 'rutas': rutas, 'comprimidos': comprimidos, 'bytes': bytes_totales}
+    _escribir(os.path.join(destino, MANIFIESTO), json.dumps(manifiesto, indent=2, sort_keys=True).encode())
+    return manifiesto
+
+
+class Assets:
+    """Extensión de Flask que usa los assets de static/dist/ si existe el manifiesto
+
+    En modo debug se sirven siempre los archivos de origen, para que los
+    cambios se vean sin volver a construir.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.version = 'dev'
+        self._rutas = {}
+        self._comprimidos = {}
+        self._fijos = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ASSETS_HABILITADOS', True)
+        self.app = app
+        self.cargar()
+        app.url_defaults(self._reescribir)
+        app.view_functions['static'] = self._servir_static
+        app.extensions['assets'] = self
+
+    @property
+    def _destino(self):
+        return os.path.join(self.app.static_folder, CARPETA)
+
+    def cargar(self):
+        """Leer el manifiesto del último build (si no hay, todo se sirve con el nombre original)"""
+        self._fijos = {}
+        ruta = os.path.join(self._destino, MANIFIESTO)
+        if not self.app.config['ASSETS_HABILITADOS'] or not os.path.exists(ruta):
+            self.version, self._rutas, self._comprimidos = 'dev', {}, {}
+            return
+        with open(ruta) as archivo:
+            manifiesto = json.load(archivo)
+        self.version = manifiesto['version']
+        self._rutas = manifiesto['rutas']
+        self._comprimidos = manifiesto['comprimidos']
+
+    def construir(self):
+        """Ejecutar el build sobre la carpeta static de la app y recargar el manifiesto"""
+        manifiesto = construir(self.app.static_folder)
+        self.cargar()
+        return manifiesto
+
+    @property
+    def _activo(self):
+        return bool(self._rutas) and not current_app.debug
+
+    def _reescribir(self, endpoint, valores):
+        if endpoint == 'static' and self._activo:
+            con_hash = self._rutas.get(valores.get('filename'))
+            if con_hash is not None:
+                valores['filename'] = f'{CARPETA}/{con_hash}'
+
+    def _enviar(self, nombre, mimetype):
+        """Enviar un archivo de dist/ en la mejor codificación que acepte el cliente"""
+        for codificacion, extension in CODIFICACIONES:
+            if codificacion in self._comprimidos.get(nombre, ()) and request.accept_encodings[codificacion]:
+                respuesta = send_from_directory(self._destino, nombre + extension, mimetype=mimetype)
+                respuesta.headers['Content-Encoding'] = codificacion
+                break
+        else:
+            respuesta = send_from_directory(self._destino, nombre, mimetype=mimetype)
+        respuesta.vary.add('Accept-Encoding')
+        return respuesta
+
+    def _servir_static(self, filename):
+        prefijo = CARPETA + '/'
+        if not filename.startswith(prefijo):
+            return self.app.send_static_file(filename)
+        nombre = filename[len(prefijo):]
+        respuesta = self._enviar(nombre, mimetypes.guess_type(nombre)[0] or 'application/octet-stream')
+        # El nombre cambia con el contenido: el navegador no necesita revalidar nunca
+        respuesta.headers['Cache-Control'] = INMUTABLE
+        return respuesta
+
+    def servir_fijo(self, nombre):
+        """Respuesta para /sw.js y /manifest.json: nombre fijo, siempre revalidada con ETag"""
+        mimetype = FIJOS[nombre]
+        if self._activo:
+            respuesta = self._enviar(nombre, mimetype)
+        else:
+            if nombre not in self._fijos or current_app.debug:
+                with open(os.path.join(self.app.static_folder, nombre), 'rb') as archivo:
+                    contenido = archivo.read()
+                self._fijos[nombre] = (contenido, hashlib.sha1(contenido).hexdigest())
+            contenido, etag = self._fijos[nombre]
+            respuesta = self.app.response_class(contenido, mimetype=mimetype)
+            respuesta.set_etag(etag)
+            respuesta.make_conditional(request)
+        respuesta.headers['Cache-Control'] = 'no-cache'
+        return respuesta
+
+
+assets = Assets()
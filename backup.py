@@ -0,0 +1,142 @@
+"""
+Exportación e importación de los datos en NDJSON comprimido
+Un archivo `<tabla>.ndjson.gz` por tabla, escrito y leído en streaming (memoria
+constante) para respaldos y migraciones de SQLite a Postgres
+"""
+
+import gzip
+import itertools
+import json
+import os
+from datetime import datetime
+from models import (db, Usuario, Post, Comentario, Like, Seguimiento,
+                    PostArchivado, ComentarioArchivado, LikeArchivado)
+
+# Tablas base en orden de claves foráneas (las derivadas se reconstruyen)
+TABLAS = (Usuario.__table__, Post.__table__, Comentario.__table__, Like.__table__, Seguimiento.__table__,
+          PostArchivado.__table__, ComentarioArchivado.__table__, LikeArchivado.__table__)
+
+VERSION_FORMATO = 1
+MANIFIESTO = 'manifiesto.json'
+PUNTO_CONTROL = '.importacion.json'
+
+
+def _archivo(directorio, tabla):
+    return os.path.join(directorio, f'{tabla.name}.ndjson.gz')
+
+
+def _serializar(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return valor
+
+
+def _escribir_json(ruta, datos):
+    """Escritura atómica: un corte a mitad deja el archivo anterior intacto"""
+    temporal = ruta + '.tmp'
+    with open(temporal, 'w') as archivo:
+        json.dump(datos, archivo, indent=2)
+    os.replace(temporal, ruta)
+
+
+def exportar(directorio, lote=1000):
+    """Volcar cada tabla a NDJSON comprimido y devolver las filas por tabla
+
+    Las filas se leen por id con `yield_per` (cursor del lado del servidor
+    en Postgres), así que nunca hay más de `lote` filas en memoria.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    conteos = {}
+    for tabla in TABLAS:
+        columnas = [columna.name for columna in tabla.columns]
+        resultado = db.session.execute(
+            db.select(tabla).order_by(tabla.c.id)
+                            .execution_options(yield_per=lote, stream_results=True)
+        )
+        total = 0
+        with gzip.open(_archivo(directorio, tabla), 'wt', encoding='utf-8') as archivo:
+            for fila in resultado:
+                datos = {columna: _serializar(valor) for columna, valor in zip(columnas, fila)}
+                archivo.write(json.dumps(datos, ensure_ascii=False, separators=(',', ':')) + '\n')
+                total += 1
+        conteos[tabla.name] = total
+
+    _escribir_json(os.path.join(directorio, MANIFIESTO), {
+        'version': VERSION_FORMATO,
+        'fecha': datetime.utcnow().isoformat(),
+        'tablas': conteos,
+    })
+    return conteos
+
+
+def _convertidores(tabla):
+    """Funciones que devuelven cada columna DateTime a su tipo desde el texto ISO"""
+    return {columna.name: datetime.fromisoformat
+            for columna in tabla.columns if isinstance(columna.type, db.DateTime)}
+
+
+def _insertar_ignorando(tabla, filas):
+    """INSERT que ignora filas cuyo id ya existe: repetir un lote no falla"""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    db.session.execute(insert(tabla).on_conflict_do_nothing(), filas)
+
+
+def _ajustar_secuencia(tabla):
+    """En Postgres, llevar la secuencia del id más allá de los ids importados"""
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(db.text(
+            f"SELECT setval(pg_get_serial_sequence('\"{tabla.name}\"', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM \"{tabla.name}\"), 1))"
+        ))
+
+
+def importar(directorio, lote=5000):
+    """Cargar un respaldo de `exportar` y devolver las filas leídas por tabla
+
+    Cada lote se inserta con un único executemany y se confirma; el punto de
+    control en `directorio` registra cuántas líneas de cada tabla ya se
+    aplicaron, así que si se corta se puede volver a ejecutar y continúa.
+    """
+    with open(os.path.join(directorio, MANIFIESTO)) as archivo:
+        manifiesto = json.load(archivo)
+    if manifiesto.get('version') != VERSION_FORMATO:
+        raise ValueError(f'Formato de respaldo no soportado: {manifiesto.get("version")}')
+
+    ruta_control = os.path.join(directorio, PUNTO_CONTROL)
+    control = {}
+    if os.path.exists(ruta_control):
+        with open(ruta_control) as archivo:
+            control = json.load(archivo)
+
+    conteos = {}
+    for tabla in TABLAS:
+        if tabla.name not in manifiesto['tablas']:
+            continue  # respaldo anterior a la tabla (p. ej. sin archivo)
+        convertidores = _convertidores(tabla)
+        aplicadas = control.get(tabla.name, 0)
+        with gzip.open(_archivo(directorio, tabla), 'rt', encoding='utf-8') as archivo:
+            lineas = itertools.islice(archivo, aplicadas, None)
+            while True:
+                filas = [json.loads(linea) for linea in itertools.islice(lineas, lote)]
+                if not filas:
+                    break
+                for fila in filas:
+                    for columna, convertir in convertidores.items():
+                        if fila.get(columna) is not None:
+                            fila[columna] = convertir(fila[columna])
+                _insertar_ignorando(tabla, filas)
+                db.session.commit()
+                aplicadas += len(filas)
+                control[tabla.name] = aplicadas
+                _escribir_json(ruta_control, control)
+
+        _ajustar_secuencia(tabla)
+        db.session.commit()
+        conteos[tabla.name] = aplicadas
+
+    if os.path.exists(ruta_control):
+        os.remove(ruta_control)
+    return conteos
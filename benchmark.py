@@ -0,0 +1,181 @@
+"""
+Benchmark de las rutas principales con el test client de Flask
+Mide latencia (percentiles) y cantidad de consultas SQL por ruta sobre una
+base poblada con seed.py, y devuelve un reporte JSON comparable entre corridas;
+también mide el arranque de un worker (import, create_app, primera petición)
+"""
+
+import json
+import math
+import random
+import statistics
+import subprocess
+import sys
+import time
+from sqlalchemy import event
+from models import db, Usuario, Post
+from seed import PASSWORD
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano de una lista ya ordenada"""
+    if not valores:
+        return None
+    indice = max(0, math.ceil(p / 100 * len(valores)) - 1)
+    return valores[indice]
+
+
+class _ContadorConsultas:
+    """Cuenta las sentencias SQL que ejecuta el engine mientras está activo"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.total = 0
+
+    def _contar(self, *args):
+        self.total += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._contar)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._contar)
+
+
+def resumen_latencias(valores):
+    """Percentiles de una lista de milisegundos"""
+    valores = sorted(valores)
+    return {
+        'p50': round(percentil(valores, 50), 3),
+        'p90': round(percentil(valores, 90), 3),
+        'p99': round(percentil(valores, 99), 3),
+        'media': round(statistics.fmean(valores), 3),
+        'max': round(valores[-1], 3),
+    }
+
+
+def _rutas(rng, usernames, post_ids):
+    """Generadores de (método, url) para cada ruta medida"""
+    consultas = ['usu', 'usuario1', 'hola', 'usuario00', 'u']
+    return {
+        'feed': lambda: ('GET', '/feed'),
+        'perfil': lambda: ('GET', f'/usuario/{rng.choice(usernames)}'),
+        'usuarios': lambda: ('GET', f'/usuarios?q={rng.choice(consultas)}'),
+        'like': lambda: ('POST', f'/post/{rng.choice(post_ids)}/like'),
+        'seguir': lambda: ('POST', f'/usuario/{rng.choice(usernames)}/seguir'),
+    }
+
+
+def ejecutar_benchmark(app, repeticiones=50, calentamiento=5, semilla=42, muestra_usuarios=200):
+    """Medir cada ruta `repeticiones` veces y devolver el reporte como dict"""
+    rng = random.Random(semilla)
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    with app.app_context():
+        engine = db.engine
+        usernames = [username for username, in db.session.query(Usuario.username)
+                                                          .order_by(Usuario.id).limit(muestra_usuarios)]
+        post_ids = [post_id for post_id, in db.session.query(Post.id).order_by(Post.id.desc()).limit(1000)]
+    if not usernames or not post_ids:
+        raise RuntimeError('La base de datos está vacía: ejecuta primero `flask sembrar`')
+
+    cliente = app.test_client()
+    respuesta = cliente.post('/login', data={'username': usernames[0], 'password': PASSWORD})
+    if respuesta.status_code != 302:
+        raise RuntimeError(f'No se pudo iniciar sesión como {usernames[0]}')
+
+    reporte = {'repeticiones': repeticiones, 'semilla': semilla, 'rutas': {}}
+    for nombre, siguiente in _rutas(rng, usernames[1:] or usernames, post_ids).items():
+        latencias = []
+        consultas = []
+        errores = 0
+        for i in range(calentamiento + repeticiones):
+            metodo, url = siguiente()
+            with _ContadorConsultas(engine) as contador:
+                inicio = time.perf_counter()
+                respuesta = cliente.open(url, method=metodo)
+                duracion = (time.perf_counter() - inicio) * 1000
+            if i < calentamiento:
+                continue
+            if respuesta.status_code >= 400:
+                errores += 1
+            latencias.append(duracion)
+            consultas.append(contador.total)
+
+        reporte['rutas'][nombre] = {
+            'latencia_ms': resumen_latencias(latencias),
+            'consultas_sql': {
+                'media': round(statistics.fmean(consultas), 2),
+                'max': max(consultas),
+            },
+            'errores': errores,
+        }
+    return reporte
+
+
+# Corre en un intérprete nuevo e imprime los tiempos (ms) de cada fase en JSON.
+# Con 'preload' el proceso hace de maestro de gunicorn: crea y precalienta la
+# app, y la primera petición la atiende un hijo creado con fork
+_SCRIPT_ARRANQUE = r"""
+import json, os, sys, time
+inicio = time.perf_counter()
+import app as modulo
+importado = time.perf_counter()
+aplicacion = modulo.create_app()
+creada = time.perf_counter()
+ruta, modo = sys.argv[1], sys.argv[2]
+
+def primeras_peticiones():
+    cliente = aplicacion.test_client()
+    antes = time.perf_counter()
+    estado = cliente.get(ruta).status_code
+    primera = time.perf_counter()
+    cliente.get(ruta)
+    segunda = time.perf_counter()
+    return estado, (primera - antes) * 1000, (segunda - primera) * 1000
+
+if modo == 'preload':
+    modulo.precalentar(aplicacion)
+    lectura, escritura = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.write(escritura, json.dumps(primeras_peticiones()).encode())
+        os._exit(0)
+    os.close(escritura)
+    estado, primera, segunda = json.loads(os.read(lectura, 4096))
+    os.waitpid(pid, 0)
+else:
+    estado, primera, segunda = primeras_peticiones()
+
+print(json.dumps({'estado': estado, 'import': (importado - inicio) * 1000,
+                  'create_app': (creada - importado) * 1000,
+                  'primera_peticion': primera, 'segunda_peticion': segunda}))
+"""
+
+
+def medir_arranque(directorio, repeticiones=10, ruta='/login'):
+    """Medir en procesos nuevos cuánto tarda un worker en atender su primera petición
+
+    Sin preload cada worker paga import + create_app + primera petición;
+    con preload_app el maestro hace lo primero una sola vez y el worker
+    solo la primera petición después del fork (`arranque_worker`).
+    """
+    reporte = {'repeticiones': repeticiones, 'ruta': ruta, 'modos': {}}
+    for modo in ('sin_preload', 'preload'):
+        fases = {}
+        for _ in range(repeticiones):
+            proceso = subprocess.run([sys.executable, '-c', _SCRIPT_ARRANQUE, ruta, modo],
+                                     cwd=directorio, capture_output=True, text=True)
+            if proceso.returncode != 0:
+                raise RuntimeError(f'Falló la medición ({modo}):\n{proceso.stderr}')
+            medicion = json.loads(proceso.stdout.strip().splitlines()[-1])
+            if medicion.pop('estado') >= 400:
+                raise RuntimeError(f'La ruta {ruta} respondió con error')
+            medicion['arranque_worker'] = medicion['primera_peticion']
+            if modo == 'sin_preload':
+                medicion['arranque_worker'] += medicion['import'] + medicion['create_app']
+            for fase, valor in medicion.items():
+                fases.setdefault(fase, []).append(valor)
+        reporte['modos'][modo] = {fase: resumen_latencias(valores) for fase, valores in fases.items()}
+    return reporte
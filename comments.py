@@ -0,0 +1,70 @@
+"""
+Comentarios de las publicaciones
+El feed muestra solo los últimos comentarios de cada post (una consulta con
+ROW_NUMBER para toda la página); los anteriores se piden por cursor a la API
+"""
+
+from sqlalchemy.orm import joinedload
+from models import db, Comentario
+from pagination import codificar_cursor, anteriores_a
+
+# Cantidad de comentarios que se muestran por publicación en el feed
+COMENTARIOS_POR_POST = 5
+
+# Comentarios por página en /api/post/<id>/comentarios
+COMENTARIOS_POR_PAGINA = 20
+
+
+def cargar_recientes(post_ids, limite=COMENTARIOS_POR_POST):
+    """Los últimos `limite` comentarios de cada post, en una sola consulta
+
+    Se devuelven agrupados por post y en orden cronológico, como se muestran.
+    """
+    posicion = db.func.row_number().over(
+        partition_by=Comentario.post_id,
+        order_by=(Comentario.fecha_creacion.desc(), Comentario.id.desc())
+    ).label('posicion')
+    ranking = db.session.query(Comentario.id.label('id'), posicion)\
+                        .filter(Comentario.post_id.in_(post_ids))\
+                        .subquery()
+
+    return Comentario.query.join(ranking, Comentario.id == ranking.c.id)\
+                           .filter(ranking.c.posicion <= limite)\
+                           .options(joinedload(Comentario.usuario))\
+                           .order_by(Comentario.post_id, Comentario.fecha_creacion, Comentario.id)\
+                           .all()
+
+
+def cursor_de(comentario):
+    """Cursor que apunta a los comentarios anteriores a `comentario`"""
+    return codificar_cursor(comentario.fecha_creacion, comentario.id)
+
+
+def pagina_comentarios(post_id, cursor=None, limite=COMENTARIOS_POR_PAGINA):
+    """Comentarios de un post anteriores a `cursor` (cronológicos) y el cursor siguiente"""
+    query = Comentario.query.options(joinedload(Comentario.usuario))\
+                            .filter(Comentario.post_id == post_id)
+    if cursor is not None:
+        query = query.filter(anteriores_a(cursor, Comentario.fecha_creacion, Comentario.id))
+    comentarios = query.order_by(Comentario.fecha_creacion.desc(), Comentario.id.desc())\
+                       .limit(limite + 1).all()
+
+    siguiente = None
+    if len(comentarios) > limite:
+        comentarios = comentarios[:limite]
+        siguiente = cursor_de(comentarios[-1])
+    comentarios.reverse()
+    return comentarios, siguiente
+
+
+def serializar(comentario):
+    """Representación JSON de un comentario para la API"""
+    return {
+        'id': comentario.id,
+        'contenido': comentario.contenido,
+        'fecha_creacion': comentario.fecha_creacion.isoformat(),
+        'usuario': {
+            'username': comentario.usuario.username,
+            'nombre': comentario.usuario.nombre or comentario.usuario.username,
+        },
+    }
@@ -0,0 +1,129 @@
+"""
+Respuestas condicionales (ETag / Last-Modified) para el feed, los perfiles y sus APIs
+La versión de cada página sale de una consulta barata sobre las columnas
+fecha_actualizacion; si el cliente ya tiene esa versión se responde 304
+sin cargar los posts ni renderizar
+"""
+
+import functools
+import hashlib
+import os
+import time
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+from models import db, Post, Usuario, Recomendacion
+from loaders import POSTS_POR_PAGINA, leer_timeline
+from pagination import decodificar_cursor, anteriores_a
+from assets import assets
+
+_version_plantillas = None
+
+
+def version_plantillas():
+    """Huella del contenido de templates/: un deploy con cambios invalida todo"""
+    global _version_plantillas
+    if _version_plantillas is None:
+        huella = hashlib.sha1()
+        carpeta = os.path.join(current_app.root_path, current_app.template_folder)
+        for raiz, _, archivos in sorted(os.walk(carpeta)):
+            for nombre in sorted(archivos):
+                huella.update(nombre.encode())
+                with open(os.path.join(raiz, nombre), 'rb') as archivo:
+                    huella.update(archivo.read())
+        _version_plantillas = huella.hexdigest()
+    return _version_plantillas
+
+
+def _partes_comunes():
+    """Lo que afecta a cualquier página del usuario actual
+
+    Incluye el token CSRF de la sesión y una ventana de la mitad de su
+    vigencia, para que un 304 nunca deje en pantalla un token vencido.
+    """
+    vigencia = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+    ventana = int(time.time() // (vigencia / 2)) if vigencia else 0
+    return (version_plantillas(), current_user.id, current_user.fecha_actualizacion,
+            session.get('csrf_token'), ventana)
+
+
+def _cursor():
+    """Cursor del query string; un cursor inválido desactiva el 304 (la vista responde 400)"""
+    cursor = request.args.get('cursor')
+    return decodificar_cursor(cursor) if cursor else None
+
+
+def version_feed():
+    """Versión de la primera página del feed (posts, autores y sugerencias)"""
+    partes, modificado = version_api_feed()
+    calculo = db.session.query(db.func.max(Recomendacion.fecha_calculo))\
+                        .filter(Recomendacion.usuario_id == current_user.id).scalar()
+    return partes + (calculo,), max(filter(None, (modificado, calculo)), default=None)
+
+
+def version_api_feed():
+    """Versión de una página del feed: ids del timeline y última modificación de posts y autores
+
+    Si hay que responder, la vista reutiliza los ids ya leídos (leer_timeline).
+    """
+    post_ids = leer_timeline(current_user, _cursor())
+    posts, autores = db.session.query(db.func.max(Post.fecha_actualizacion), db.func.max(Usuario.fecha_actualizacion))\
+                               .join(Usuario, Usuario.id == Post.usuario_id)\
+                               .filter(Post.id.in_(post_ids)).one()
+    fechas = (posts, autores, current_user.fecha_actualizacion)
+    return _partes_comunes() + (tuple(post_ids),) + fechas, max(filter(None, fechas), default=None)
+
+
+def version_perfil(username):
+    """Versión de una página del perfil: datos del autor y última modificación de sus posts"""
+    autor = db.session.query(Usuario.id, Usuario.fecha_actualizacion).filter_by(username=username).first()
+    if autor is None:
+        return None
+    query = db.session.query(Post.fecha_actualizacion).filter(Post.usuario_id == autor.id)
+    cursor = _cursor()
+    if cursor is not None:
+        query = query.filter(anteriores_a(cursor))
+    pagina = query.order_by(Post.fecha_creacion.desc(), Post.id.desc()).limit(POSTS_POR_PAGINA + 1).subquery()
+    posts = db.session.query(db.func.max(pagina.c.fecha_actualizacion)).scalar()
+    fechas = (autor.fecha_actualizacion, posts, current_user.fecha_actualizacion)
+    return _partes_comunes() + (autor.id, cursor) + fechas, max(filter(None, fechas), default=None)
+
+
+def condicional(version):
+    """Decorador: responder 304 Not Modified si la versión de la página no cambió
+
+    `version` recibe los argumentos de la vista y devuelve (partes, fecha),
+    o None para atender la petición sin condicionales. Las respuestas son
+    privadas y se revalidan siempre (`no-cache`), también desde sw.js.
+    """
+    def decorador(vista):
+        @functools.wraps(vista)
+        def envoltura(*args, **kwargs):
+            resultado = None
+            if not current_app.debug and '_flashes' not in session:
+                try:
+                    resultado = version(*args, **kwargs)
+                except ValueError:
+                    resultado = None
+            if resultado is None:
+                return vista(*args, **kwargs)
+
+            partes, modificado = resultado
+            # Un build de assets nuevo cambia las URLs con hash de la página
+            etag = hashlib.sha1(repr((request.path, assets.version) + partes).encode()).hexdigest()
+            if is_resource_modified(request.environ, etag=etag, last_modified=modificado):
+                respuesta = make_response(vista(*args, **kwargs))
+                if respuesta.status_code != 200:
+                    return respuesta
+            else:
+                respuesta = current_app.response_class(status=304)
+
+            respuesta.set_etag(etag)
+            if modificado is not None:
+                respuesta.last_modified = modificado
+            respuesta.cache_control.private = True
+            respuesta.cache_control.no_cache = True
+            respuesta.vary.add('Cookie')
+            return respuesta
+        return envoltura
+    return decorador
@@ -0,0 +1,54 @@
+"""
+Contadores desnormalizados de publicaciones y usuarios
+Las rutas los mantienen al día; este módulo los reconstruye desde las tablas base
+"""
+
+from models import db, Usuario, Post, Comentario, Like, Seguimiento, PostArchivado
+
+# Columnas de contadores: si `flask preparar` las agrega a una base existente hay que rellenarlas
+COLUMNAS = {
+    'post.likes_count', 'post.comentarios_count',
+    'usuario.seguidores_count', 'usuario.seguidos_count', 'usuario.posts_count', 'usuario.posts_archivados_count',
+}
+
+
+def _conteo(columna_id, columna_fk, referencia):
+    """Subconsulta correlacionada con el COUNT(*) de una tabla base"""
+    return db.select(db.func.count(columna_id))\
+             .where(columna_fk == referencia)\
+             .scalar_subquery()
+
+
+def recalcular_contadores():
+    """Reconstruir todos los contadores a partir de las tablas base
+
+    Solo actualiza las filas cuyo contador no coincide y devuelve cuántos
+    posts y usuarios se corrigieron.
+    """
+    likes = _conteo(Like.id, Like.post_id, Post.id)
+    comentarios = _conteo(Comentario.id, Comentario.post_id, Post.id)
+    resultado_posts = db.session.execute(
+        db.update(Post)
+          .where((Post.likes_count != likes) | (Post.comentarios_count != comentarios))
+          .values(likes_count=likes, comentarios_count=comentarios)
+          .execution_options(synchronize_session=False)
+    )
+
+    seguidores = _conteo(Seguimiento.id, Seguimiento.seguido_id, Usuario.id)
+    seguidos = _conteo(Seguimiento.id, Seguimiento.seguidor_id, Usuario.id)
+    # Los posts archivados siguen contando para el perfil
+    archivados = _conteo(PostArchivado.id, PostArchivado.usuario_id, Usuario.id)
+    posts = _conteo(Post.id, Post.usuario_id, Usuario.id) + archivados
+    resultado_usuarios = db.session.execute(
+        db.update(Usuario)
+          .where((Usuario.seguidores_count != seguidores) |
+                 (Usuario.seguidos_count != seguidos) |
+                 (Usuario.posts_count != posts) |
+                 (Usuario.posts_archivados_count != archivados))
+          .values(seguidores_count=seguidores, seguidos_count=seguidos, posts_count=posts,
+                  posts_archivados_count=archivados)
+          .execution_options(synchronize_session=False)
+    )
+
+    db.session.commit()
+    return resultado_posts.rowcount, resultado_usuarios.rowcount
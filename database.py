@@ -0,0 +1,123 @@
+"""
+Configuración del motor de base de datos para producción
+SQLite: pragmas para varios workers (WAL, busy_timeout, caché, mmap).
+Postgres: tamaño del pool y pre-ping. Opcionalmente envía las lecturas de
+las vistas de solo lectura a una réplica
+"""
+
+import time
+from functools import partial
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+
+# Pragmas que se aplican a cada conexión SQLite nueva
+PRAGMAS_SQLITE = {
+    'journal_mode': 'WAL',         # lectores y un escritor en paralelo
+    'synchronous': 'NORMAL',       # seguro con WAL y mucho más rápido que FULL
+    'busy_timeout': 5000,          # esperar el lock hasta 5 s en vez de fallar con "database is locked"
+    'cache_size': -20000,          # ~20 MB de caché de páginas por conexión
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+def _aplicar_pragmas(pragmas, conexion_dbapi, registro):
+    cursor = conexion_dbapi.cursor()
+    for nombre, valor in pragmas.items():
+        cursor.execute(f'PRAGMA {nombre} = {valor}')
+    cursor.close()
+
+
+def _normalizar_url(url):
+    """Render y Heroku entregan postgres://, que SQLAlchemy 2 ya no acepta"""
+    if url and url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def _opciones_motor(url, config):
+    if url.startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+
+
+def configurar_base_de_datos(app):
+    """Completar la configuración de Flask-SQLAlchemy (llamar antes de db.init_app)
+
+    Con SQLALCHEMY_REPLICA_URI definida, las consultas SELECT de las vistas
+    marcadas con @solo_lectura van a la réplica, salvo durante
+    DB_REPLICA_PEGAJOSA segundos después de que el usuario escribió algo
+    (así ve sus propios cambios aunque la réplica vaya atrasada).
+    """
+    config = app.config
+    config.setdefault('DB_POOL_SIZE', 5)
+    config.setdefault('DB_MAX_OVERFLOW', 10)
+    config.setdefault('DB_POOL_TIMEOUT', 30)
+    config.setdefault('DB_POOL_RECYCLE', 1800)
+    config.setdefault('DB_REPLICA_PEGAJOSA', 5)
+    config.setdefault('SQLALCHEMY_REPLICA_URI', None)
+    config['SQLITE_PRAGMAS'] = dict(PRAGMAS_SQLITE, **config.get('SQLITE_PRAGMAS', {}))
+
+    url = config['SQLALCHEMY_DATABASE_URI'] = _normalizar_url(config['SQLALCHEMY_DATABASE_URI'])
+    opciones = _opciones_motor(url, config)
+    opciones.update(config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = opciones
+
+    replica = _normalizar_url(config['SQLALCHEMY_REPLICA_URI'])
+    if replica:
+        config.setdefault('SQLALCHEMY_BINDS', {})['replica'] = dict(_opciones_motor(replica, config), url=replica)
+        app.before_request(_elegir_motor)
+        app.after_request(_recordar_escritura)
+
+
+def aplicar_pragmas(app, engines):
+    """Aplicar SQLITE_PRAGMAS de `app` a cada conexión nueva de sus motores SQLite
+
+    Llamar después de db.init_app: cada app registra sus propios pragmas en
+    sus motores, sin afectar a otras apps del mismo proceso.
+    """
+    for engine in engines:
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', partial(_aplicar_pragmas, dict(app.config['SQLITE_PRAGMAS'])))
+
+
+def solo_lectura(vista):
+    """Marcar una vista cuyas consultas pueden ir a la réplica de lectura"""
+    vista.solo_lectura = True
+    return vista
+
+
+def _elegir_motor():
+    vista = current_app.view_functions.get(request.endpoint)
+    reciente = time.time() - session.get('ultima_escritura', 0) < current_app.config['DB_REPLICA_PEGAJOSA']
+    g._usar_replica = getattr(vista, 'solo_lectura', False) and not reciente
+
+
+def _recordar_escritura(response):
+    if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+        session['ultima_escritura'] = time.time()
+    return response
+
+
+class SesionEnrutada(Session):
+    """Sesión que manda los SELECT a la réplica cuando la vista lo permite
+
+    Los flush, los INSERT/UPDATE/DELETE y el SQL de texto siempre van al
+    primario.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and isinstance(clause, Select)
+                and has_request_context() and g.get('_usar_replica')):
+            replica = self._db.engines.get('replica')
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,359 @@
+"""
+Actualizaciones en tiempo real con Server-Sent Events
+Las vistas publican eventos (likes, comentarios, posts, seguimientos) en un
+bus; cada conexión abierta en /api/eventos recibe solo los de los autores
+que ve en su feed, sin volver a pedir la página
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from models import db, Evento, grafo
+from jobs import trabajos
+
+# Eventos que se pueden reemplazar por uno más nuevo con la misma clave
+COALESCIBLES = {'like'}
+
+
+def _clave(tipo, datos):
+    if tipo in COALESCIBLES:
+        return (tipo, datos['post_id'])
+    return None
+
+
+class BusMemoria:
+    """Bus dentro del proceso: cada evento se entrega en el momento
+
+    Solo llega a las conexiones del mismo worker; con varios workers
+    hay que usar el backend 'sql'.
+    """
+
+    def __init__(self, app):
+        self._despachar = None
+
+    def iniciar(self, despachar):
+        self._despachar = despachar
+
+    def publicar(self, tipo, datos):
+        self._despachar(tipo, datos)
+
+
+class BusBaseDeDatos:
+    """Bus compartido entre workers a través de la tabla `evento`
+
+    Publicar no escribe en la base: el evento queda en memoria (los likes
+    del mismo post se fusionan) y un hilo de cada proceso inserta lo
+    acumulado en un solo INSERT cada EVENTOS_INTERVALO_MS. El mismo hilo,
+    si hay conexiones SSE en el proceso, lee los eventos nuevos. Las filas
+    viejas las borra la tarea periódica `eventos.podar` de la cola.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._despachar = None
+        self._pid = None
+        self._leyendo = False
+        self._salientes = OrderedDict()
+        self._secuencia = 0
+        # Ids ya entregados por encima de `_piso` (ver leer)
+        self._piso = 0
+        self._entregados = set()
+        self._lock = threading.Lock()
+
+    def iniciar(self, despachar):
+        self._despachar = despachar
+
+    def publicar(self, tipo, datos):
+        self._asegurar_hilo()
+        with self._lock:
+            clave = _clave(tipo, datos)
+            if clave is None:
+                self._secuencia += 1
+                clave = (tipo, self._secuencia)
+            self._salientes.pop(clave, None)
+            self._salientes[clave] = (tipo, datos)
+
+    def _asegurar_hilo(self):
+        """Arrancar el hilo del bus en este proceso (después del fork de gunicorn)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._salientes = OrderedDict()
+            self._leyendo = False
+            threading.Thread(target=self._bucle, name='bus-eventos', daemon=True).start()
+
+    def asegurar_lector(self):
+        """Empezar a leer los eventos de todos los procesos a partir de ahora"""
+        self._asegurar_hilo()
+        with self._lock:
+            if self._leyendo:
+                return
+            with self.app.app_context():
+                self._piso = db.session.query(db.func.coalesce(db.func.max(Evento.id), 0)).scalar()
+            self._entregados = set()
+            self._leyendo = True
+
+    def _bucle(self):
+        intervalo = self.app.config['EVENTOS_INTERVALO_MS'] / 1000
+        while True:
+            time.sleep(intervalo)
+            try:
+                with self.app.app_context():
+                    self.enviar()
+                    if self._leyendo:
+                        self.leer()
+            except Exception:
+                self.app.logger.exception('No se pudieron enviar o leer los eventos')
+
+    def enviar(self):
+        """Insertar los eventos acumulados en un solo INSERT; devuelve cuántos"""
+        with self._lock:
+            salientes, self._salientes = list(self._salientes.values()), OrderedDict()
+        if salientes:
+            # Conexión propia: no confirma ni ensucia la sesión de la petición
+            with db.engine.begin() as conexion:
+                conexion.execute(db.insert(Evento), [{'tipo': tipo, 'datos': json.dumps(datos)}
+                                                     for tipo, datos in salientes])
+        return len(salientes)
+
+    def leer(self):
+        """Entregar los eventos nuevos de la tabla
+
+        Los ids se asignan al insertar pero las filas aparecen al confirmar,
+        que puede ser en otro orden (en Postgres una transacción con un id
+        menor puede confirmar después). Por eso no se lee desde el último id
+        visto, sino desde `_piso`: el último id de una fila con más de
+        EVENTOS_VENTANA_MS de antigüedad. Las filas más nuevas se releen en
+        cada pasada y `_entregados` evita repetirlas.
+        """
+        asentado = datetime.utcnow() - timedelta(milliseconds=self.app.config['EVENTOS_VENTANA_MS'])
+        piso = self._piso
+        with db.engine.connect() as conexion:
+            while True:
+                filas = conexion.execute(
+                    db.select(Evento.id, Evento.tipo, Evento.datos, Evento.fecha_creacion)
+                      .where(Evento.id > piso).order_by(Evento.id).limit(1000)
+                ).all()
+                for id_evento, tipo, datos, fecha in filas:
+                    if id_evento not in self._entregados:
+                        self._entregados.add(id_evento)
+                        self._despachar(tipo, json.loads(datos))
+                    if fecha < asentado:
+                        self._piso = id_evento
+                if len(filas) < 1000:
+                    break
+                piso = filas[-1][0]
+        self._entregados = {id_evento for id_evento in self._entregados if id_evento > self._piso}
+
+
+BACKENDS = {
+    'memoria': BusMemoria,
+    'sql': BusBaseDeDatos,
+}
+
+
+class Conexion:
+    """Cola de eventos pendientes de un cliente conectado
+
+    Los likes del mismo post se fusionan (solo importa el último contador).
+    Si el cliente no lee y la cola llega a EVENTOS_COLA_MAX se descarta
+    todo y se le manda un único 'recargar'.
+    """
+
+    def __init__(self, usuario_id, seguidos, maximo):
+        self.usuario_id = usuario_id
+        self.seguidos = set(seguidos)
+        self.maximo = maximo
+        self.cerrada = False
+        self._pendientes = OrderedDict()
+        self._secuencia = 0
+        self._desbordada = False
+        self._condicion = threading.Condition()
+
+    def entregar(self, tipo, datos):
+        with self._condicion:
+            if self._desbordada:
+                return
+            clave = _clave(tipo, datos)
+            if clave is None:
+                self._secuencia += 1
+                clave = (tipo, self._secuencia)
+            elif clave in self._pendientes:
+                self._pendientes[clave] = (tipo, datos)
+                return
+            if len(self._pendientes) >= self.maximo:
+                self._pendientes.clear()
+                self._desbordada = True
+            else:
+                self._pendientes[clave] = (tipo, datos)
+            self._condicion.notify()
+
+    def esperar(self, timeout):
+        """Sacar los eventos pendientes, esperando hasta `timeout` segundos"""
+        with self._condicion:
+            if not self._pendientes and not self._desbordada:
+                self._condicion.wait(timeout)
+            if self._desbordada:
+                self._desbordada = False
+                return [('recargar', {})]
+            eventos = list(self._pendientes.values())
+            self._pendientes.clear()
+            return eventos
+
+
+def _formatear(tipo, datos):
+    return f'event: {tipo}\ndata: {json.dumps(datos, separators=(",", ":"))}\n\n'
+
+
+class Eventos:
+    """Extensión de Flask con el bus de eventos y las conexiones SSE del proceso
+
+    Las conexiones se indexan por autor (el propio usuario y cada cuenta
+    que sigue), así publicar cuesta lo mismo que la cantidad de
+    interesados y no la de conectados. Cada conexión ocupa un thread del
+    worker mientras está abierta: pasadas EVENTOS_CONEXIONES_MAX se
+    rechazan las nuevas para que queden threads para el resto de las
+    peticiones.
+    """
+
+    def __init__(self, app=None):
+        self.bus = None
+        self.config = None
+        self._interesados = {}
+        self._abiertas = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('EVENTOS_BACKEND', 'memoria')
+        app.config.setdefault('EVENTOS_COLA_MAX', 100)
+        app.config.setdefault('EVENTOS_HEARTBEAT', 15)
+        app.config.setdefault('EVENTOS_DURACION_MAX', 300)
+        app.config.setdefault('EVENTOS_INTERVALO_MS', 500)
+        app.config.setdefault('EVENTOS_VENTANA_MS', 2000)
+        app.config.setdefault('EVENTOS_RETENCION', 60)
+        app.config.setdefault('EVENTOS_PODA_CADA', 60)
+        app.config.setdefault('EVENTOS_CONEXIONES_MAX', 8)
+        app.config.setdefault('EVENTOS_REINTENTO_LLENO', 30)
+
+        self.bus = BACKENDS[app.config['EVENTOS_BACKEND']](app)
+        self.bus.iniciar(self._despachar)
+        self.config = app.config
+        app.extensions['eventos'] = self
+
+    # --- Publicación ------------------------------------------------------
+
+    def publicar(self, tipo, **datos):
+        """Publicar un evento (llamar después del commit)"""
+        self.bus.publicar(tipo, datos)
+
+    def _indexar(self, conexion, autor_id):
+        self._interesados.setdefault(autor_id, set()).add(conexion)
+
+    def _desindexar(self, conexion, autor_id):
+        conexiones = self._interesados.get(autor_id)
+        if conexiones is not None:
+            conexiones.discard(conexion)
+            if not conexiones:
+                del self._interesados[autor_id]
+
+    def _despachar(self, tipo, datos):
+        with self._lock:
+            if tipo == 'seguir':
+                destinatarios = self._seguir(datos)
+            else:
+                destinatarios = list(self._interesados.get(datos['autor_id'], ()))
+        for conexion in destinatarios:
+            conexion.entregar(tipo, datos)
+
+    def _seguir(self, datos):
+        """Actualizar el índice de quien siguió o dejó de seguir; avisar a ambos"""
+        seguidor_id, seguido_id = datos['seguidor_id'], datos['seguido_id']
+        seguidores = [c for c in self._interesados.get(seguidor_id, ()) if c.usuario_id == seguidor_id]
+        for conexion in seguidores:
+            if datos['accion'] == 'followed':
+                conexion.seguidos.add(seguido_id)
+                self._indexar(conexion, seguido_id)
+            elif seguido_id in conexion.seguidos:
+                conexion.seguidos.discard(seguido_id)
+                self._desindexar(conexion, seguido_id)
+        seguidos = [c for c in self._interesados.get(seguido_id, ()) if c.usuario_id == seguido_id]
+        return seguidores + seguidos
+
+    # --- Conexiones -------------------------------------------------------
+
+    def suscribir(self, usuario_id):
+        """Registrar una conexión nueva de `usuario_id`; None si este proceso ya no tiene lugar"""
+        with self._lock:
+            if self._abiertas >= self.config['EVENTOS_CONEXIONES_MAX']:
+                return None
+            self._abiertas += 1
+        if hasattr(self.bus, 'asegurar_lector'):
+            self.bus.asegurar_lector()
+        conexion = Conexion(usuario_id, grafo.seguidos(usuario_id), self.config['EVENTOS_COLA_MAX'])
+        with self._lock:
+            for autor_id in conexion.seguidos | {usuario_id}:
+                self._indexar(conexion, autor_id)
+        return conexion
+
+    def desuscribir(self, conexion):
+        """Liberar la conexión (se puede llamar más de una vez)"""
+        with self._lock:
+            if conexion.cerrada:
+                return
+            conexion.cerrada = True
+            self._abiertas -= 1
+            for autor_id in conexion.seguidos | {conexion.usuario_id}:
+                self._desindexar(conexion, autor_id)
+
+    def podar(self):
+        """Borrar de la tabla `evento` las filas más viejas que EVENTOS_RETENCION; devuelve cuántas"""
+        limite = datetime.utcnow() - timedelta(seconds=self.config['EVENTOS_RETENCION'])
+        borrados = Evento.query.filter(Evento.fecha_creacion < limite).delete(synchronize_session=False)
+        db.session.commit()
+        return borrados
+
+    def conectados(self):
+        """Cantidad de conexiones abiertas en este proceso"""
+        with self._lock:
+            return self._abiertas
+
+    def rechazo(self):
+        """Cuerpo y segundos de espera de la respuesta 503 cuando no hay lugar"""
+        espera = self.config['EVENTOS_REINTENTO_LLENO']
+        return f'retry: {espera * 1000}\n\n', espera
+
+    def transmitir(self, conexion):
+        """Generador con el cuerpo de la respuesta text/event-stream
+
+        Manda un comentario cada EVENTOS_HEARTBEAT segundos (mantiene viva
+        la conexión en proxies y detecta clientes que se fueron) y corta a
+        los EVENTOS_DURACION_MAX segundos; el navegador reconecta solo.
+        """
+        heartbeat = self.config['EVENTOS_HEARTBEAT']
+        fin = time.monotonic() + self.config['EVENTOS_DURACION_MAX']
+        try:
+            yield 'retry: 3000\n\n'
+            while time.monotonic() < fin:
+                eventos = conexion.esperar(min(heartbeat, fin - time.monotonic()))
+                if eventos:
+                    yield ''.join(_formatear(tipo, datos) for tipo, datos in eventos)
+                else:
+                    yield ': ping\n\n'
+        finally:
+            self.desuscribir(conexion)
+
+
+eventos = Eventos()
+
+
+@trabajos.periodica('eventos.podar', 'EVENTOS_PODA_CADA')
+def _tarea_podar():
+    eventos.podar()
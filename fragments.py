@@ -0,0 +1,132 @@
+"""
+Caché del HTML ya renderizado de cada tarjeta de post
+La tarjeta es igual para todos los usuarios salvo el estado del like, el
+contador de likes y el token CSRF, que se completan después de leerla
+"""
+
+import secrets
+import sys
+import threading
+from collections import OrderedDict
+from flask_wtf.csrf import generate_csrf
+from jinja2 import pass_context
+from markupsafe import Markup
+
+# Marcadores aleatorios (no adivinables desde el contenido de un post) que se
+# reemplazan por los datos del usuario que ve la tarjeta
+_MARCA_CLASE_LIKE = Markup(secrets.token_hex(12))
+_MARCA_CANTIDAD_LIKES = Markup(secrets.token_hex(12))
+_MARCA_TOKEN_CSRF = Markup(secrets.token_hex(12))
+
+
+def version_post(post):
+    """Huella de los datos que se ven en la tarjeta (fuera de los likes)
+
+    Si cambia (nuevo comentario, variantes de imagen listas, autor que editó
+    su perfil) el fragmento guardado deja de servir, incluso si el cambio se
+    hizo en otro worker.
+    """
+    autor = post.usuario
+    return hash((
+        post.comentarios_count, post.imagen_variantes, post.imagen_placeholder,
+        autor.username, autor.nombre, autor.avatar, autor.avatar_variantes, autor.avatar_placeholder,
+        tuple((comentario.id, comentario.usuario.username, comentario.usuario.nombre)
+              for comentario in post.comentarios_recientes),
+    ))
+
+
+def _usuarios(post):
+    """Usuarios cuyos datos aparecen en la tarjeta (autor y comentaristas)"""
+    return frozenset([post.usuario_id] + [comentario.usuario_id for comentario in post.comentarios_recientes])
+
+
+class CacheFragmentos:
+    """LRU de tarjetas de post renderizadas, acotado por memoria
+
+    Guarda una entrada por post con su versión; una versión distinta cuenta
+    como fallo y se reemplaza.
+    """
+
+    def __init__(self, app=None):
+        self.habilitado = True
+        self.max_bytes = 16 * 1024 * 1024
+        self.aciertos = 0
+        self.fallos = 0
+        self._bytes = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FRAGMENTOS_HABILITADOS', True)
+        app.config.setdefault('FRAGMENTOS_MAX_BYTES', 16 * 1024 * 1024)
+        self.habilitado = app.config['FRAGMENTOS_HABILITADOS']
+        self.max_bytes = app.config['FRAGMENTOS_MAX_BYTES']
+        app.add_template_global(self.tarjeta_post, 'tarjeta_post')
+        app.extensions['fragmentos'] = self
+
+    @pass_context
+    def tarjeta_post(self, contexto, post):
+        """HTML de la tarjeta de `post` para el usuario actual (desde la caché si se puede)"""
+        if not self.habilitado:
+            return Markup(self._renderizar(contexto, post, ' liked' if post.le_gusta else '',
+                                           post.cantidad_likes(), generate_csrf()))
+
+        version = version_post(post)
+        html = self._leer(post.id, version)
+        if html is None:
+            html = self._renderizar(contexto, post, _MARCA_CLASE_LIKE, _MARCA_CANTIDAD_LIKES, _MARCA_TOKEN_CSRF)
+            self._guardar(post.id, version, html, _usuarios(post))
+
+        return Markup(html.replace(_MARCA_CLASE_LIKE, ' liked' if post.le_gusta else '')
+                          .replace(_MARCA_CANTIDAD_LIKES, str(post.cantidad_likes()))
+                          .replace(_MARCA_TOKEN_CSRF, generate_csrf()))
+
+    def _renderizar(self, contexto, post, clase_like, cantidad_likes, token_csrf):
+        plantilla = contexto.environment.get_template('_post_card.html')
+        return plantilla.render(post=post, comentario_form=contexto.get('comentario_form'),
+                                clase_like=clase_like, cantidad_likes=cantidad_likes, token_csrf=token_csrf)
+
+    def _leer(self, post_id, version):
+        with self._lock:
+            entrada = self._entradas.get(post_id)
+            if entrada is not None and entrada[0] == version:
+                self._entradas.move_to_end(post_id)
+                self.aciertos += 1
+                return entrada[1]
+            self.fallos += 1
+            return None
+
+    def _guardar(self, post_id, version, html, usuarios):
+        tamano = sys.getsizeof(html)
+        with self._lock:
+            anterior = self._entradas.pop(post_id, None)
+            if anterior is not None:
+                self._bytes -= anterior[3]
+            self._entradas[post_id] = (version, html, usuarios, tamano)
+            self._bytes += tamano
+            while self._bytes > self.max_bytes and self._entradas:
+                self._bytes -= self._entradas.popitem(last=False)[1][3]
+
+    def invalidar_post(self, post_id):
+        """Descartar la tarjeta de un post (p. ej. tras un nuevo comentario)"""
+        with self._lock:
+            entrada = self._entradas.pop(post_id, None)
+            if entrada is not None:
+                self._bytes -= entrada[3]
+
+    def invalidar_usuario(self, usuario_id):
+        """Descartar las tarjetas donde aparece un usuario (tras editar su perfil)"""
+        with self._lock:
+            for post_id in [post_id for post_id, entrada in self._entradas.items() if usuario_id in entrada[2]]:
+                self._bytes -= self._entradas.pop(post_id)[3]
+
+    def estadisticas(self):
+        """Aciertos, fallos, tarjetas guardadas y memoria usada"""
+        with self._lock:
+            return {'aciertos': self.aciertos, 'fallos': self.fallos,
+                    'tarjetas': len(self._entradas), 'bytes': self._bytes}
+
+
+fragmentos = CacheFragmentos()
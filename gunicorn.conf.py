@@ -0,0 +1,41 @@
+"""
+Configuración de gunicorn (la lee sola desde el directorio de la app)
+Con preload_app el proceso maestro importa, crea y precalienta la aplicación
+una sola vez; cada worker la hereda por fork (copy-on-write) y arranca sin
+volver a importar nada
+"""
+
+import gc
+import os
+
+wsgi_app = 'app:create_app()'
+bind = f'0.0.0.0:{os.environ.get("PORT", 8000)}'
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+preload_app = True
+
+
+def when_ready(server):
+    """En el maestro, ya con la app cargada y antes de crear los workers"""
+    from app import precalentar
+    app = server.app.wsgi()
+    precalentar(app)
+    # create_app elige el backend de eventos según WEB_CONCURRENCY; `--workers` no lo cambia
+    if server.cfg.workers > 1 and app.config['EVENTOS_BACKEND'] == 'memoria':
+        server.log.warning('EVENTOS_BACKEND=memoria con %d workers: los eventos en tiempo real '
+                           'no llegarán a los clientes de los otros workers', server.cfg.workers)
+    # La carpeta de subidas vive en el disco de cada máquina, no en la base de datos
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    # Lo creado hasta aquí queda fuera del GC: recorrerlo en cada worker
+    # escribiría en esas páginas y dejarían de estar compartidas
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """En cada worker: no reutilizar conexiones que se hayan abierto en el maestro"""
+    from models import db
+    with server.app.wsgi().app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
@@ -0,0 +1,161 @@
+"""
+Procesamiento de imágenes subidas (posts y avatares)
+Genera variantes JPEG/WebP redimensionadas y un placeholder borroso en la
+cola de trabajos (jobs.py), fuera del hilo que atiende la petición
+"""
+
+import base64
+import io
+import os
+from flask import url_for
+from models import db, Post, Usuario
+from jobs import trabajos
+
+# Anchos (px) de las variantes que se generan para cada imagen
+ANCHOS = (96, 240, 480, 960)
+FORMATOS = ('jpg', 'webp')
+ANCHO_PLACEHOLDER = 16
+
+# Modelos con imágenes, por nombre de tabla (los trabajos guardan solo texto e ids)
+MODELOS = {modelo.__tablename__: modelo for modelo in (Post, Usuario)}
+
+
+def nombre_variante(nombre, ancho, formato):
+    """Nombre de archivo de una variante: foto.png -> foto_480.webp"""
+    base = os.path.splitext(nombre)[0]
+    return f'{base}_{ancho}.{formato}'
+
+
+def _a_rgb(imagen):
+    """Convertir a RGB aplanando la transparencia sobre fondo blanco"""
+    from PIL import Image
+    if imagen.mode == 'RGB':
+        return imagen
+    imagen = imagen.convert('RGBA')
+    fondo = Image.new('RGB', imagen.size, (255, 255, 255))
+    fondo.paste(imagen, mask=imagen.getchannel('A'))
+    return fondo
+
+
+def procesar_imagen(ruta, anchos=ANCHOS, calidad=82):
+    """Quitar metadatos, corregir orientación y generar variantes de una imagen
+
+    Devuelve (variantes, placeholder): los anchos generados separados por
+    comas y un data URI JPEG diminuto. Las imágenes animadas se dejan tal
+    cual y devuelven None.
+    """
+    # Pillow se importa recién aquí: solo lo usa el trabajador de la cola, no los workers web
+    from PIL import Image, ImageFilter, ImageOps
+    carpeta, nombre = os.path.split(ruta)
+    with Image.open(ruta) as original:
+        if getattr(original, 'is_animated', False):
+            return None
+        formato = original.format
+        imagen = ImageOps.exif_transpose(original)
+        imagen.load()
+
+    # Reescribir el original sin EXIF (ubicación GPS, cámara, etc.)
+    if formato == 'JPEG':
+        _a_rgb(imagen).save(ruta, 'JPEG', quality=90, optimize=True)
+    else:
+        imagen.save(ruta, formato)
+
+    imagen = _a_rgb(imagen)
+    variantes = []
+    for ancho in sorted(anchos):
+        if ancho > imagen.width and variantes:
+            break
+        alto = max(1, round(imagen.height * ancho / imagen.width))
+        copia = imagen.resize((ancho, alto), Image.LANCZOS)
+        copia.save(os.path.join(carpeta, nombre_variante(nombre, ancho, 'jpg')),
+                   'JPEG', quality=calidad, optimize=True, progressive=True)
+        copia.save(os.path.join(carpeta, nombre_variante(nombre, ancho, 'webp')),
+                   'WEBP', quality=calidad, method=4)
+        variantes.append(ancho)
+
+    alto = max(1, round(imagen.height * ANCHO_PLACEHOLDER / imagen.width))
+    miniatura = imagen.resize((ANCHO_PLACEHOLDER, alto)).filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    miniatura.save(buffer, 'JPEG', quality=40)
+    placeholder = 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+    return ','.join(str(ancho) for ancho in variantes), placeholder
+
+
+def variante_url(nombre, variantes, formato='jpg', ancho=None):
+    """URL de la variante más chica que cubre `ancho` (o la más grande)"""
+    disponibles = [int(valor) for valor in variantes.split(',')]
+    elegido = disponibles[-1]
+    if ancho is not None:
+        elegido = next((valor for valor in disponibles if valor >= ancho), elegido)
+    return url_for('static', filename='uploads/' + nombre_variante(nombre, elegido, formato))
+
+
+def srcset(nombre, variantes, formato='jpg'):
+    """Atributo srcset con todas las variantes de una imagen en un formato"""
+    return ', '.join(
+        f"{url_for('static', filename='uploads/' + nombre_variante(nombre, int(ancho), formato))} {ancho}w"
+        for ancho in variantes.split(',')
+    )
+
+
+class Imagenes:
+    """Extensión de Flask que procesa las imágenes subidas en segundo plano"""
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('IMAGENES_ANCHOS', ANCHOS)
+        app.config.setdefault('IMAGENES_ASINCRONAS', True)
+
+        app.add_template_global(srcset)
+        app.add_template_global(variante_url)
+        app.extensions['imagenes'] = self
+        self.app = app
+
+    def procesar_post(self, post):
+        """Generar las variantes de la imagen de un post (encola antes del commit)"""
+        if post.imagen:
+            self._procesar(Post, post.id, 'imagen', post.imagen, post.usuario_id)
+
+    def procesar_avatar(self, usuario):
+        """Generar las variantes del avatar de un usuario (encola antes del commit)"""
+        if usuario.avatar:
+            self._procesar(Usuario, usuario.id, 'avatar', usuario.avatar, usuario.id)
+
+    def _procesar(self, modelo, objeto_id, campo, nombre, usuario_id):
+        if self.app.config['IMAGENES_ASINCRONAS']:
+            trabajos.encolar('imagenes.procesar', usuario_id=usuario_id, modelo=modelo.__tablename__,
+                             objeto_id=objeto_id, campo=campo, nombre=nombre)
+        else:
+            self.procesar_ahora(modelo, objeto_id, campo, nombre)
+
+    def procesar_ahora(self, modelo, objeto_id, campo, nombre):
+        """Generar las variantes en este proceso y registrarlas"""
+        ruta = os.path.join(self.app.config['UPLOAD_FOLDER'], nombre)
+        resultado = procesar_imagen(ruta, self.app.config['IMAGENES_ANCHOS'])
+        self._registrar(modelo, objeto_id, campo, nombre, resultado)
+
+    def _registrar(self, modelo, objeto_id, campo, nombre, resultado):
+        """Marcar las variantes como listas (si la imagen no cambió mientras tanto)"""
+        if resultado is None:
+            return
+        variantes, placeholder = resultado
+        db.session.execute(
+            db.update(modelo)
+              .where(modelo.id == objeto_id, getattr(modelo, campo) == nombre)
+              .values({f'{campo}_variantes': variantes, f'{campo}_placeholder': placeholder})
+              .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+
+imagenes = Imagenes()
+
+
+@trabajos.tarea('imagenes.procesar')
+def _tarea_procesar(modelo, objeto_id, campo, nombre):
+    imagenes.procesar_ahora(MODELOS[modelo], objeto_id, campo, nombre)
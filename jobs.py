@@ -0,0 +1,265 @@
+"""
+Cola de trabajos en segundo plano guardada en la base de datos
+Las vistas encolan el trabajo lento (variantes de imágenes, fan-out de
+timelines) en la misma transacción que los datos y responden enseguida;
+uno o más trabajadores (`flask --app app trabajador`) lo ejecutan
+"""
+
+import json
+import os
+import random
+import signal
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+from models import db, Trabajo
+
+ESTADOS = ('pendiente', 'en_curso', 'hecho', 'fallido')
+
+
+def serializar(trabajo):
+    """Representación JSON del estado de un trabajo para la API"""
+    return {
+        'id': trabajo.id,
+        'tipo': trabajo.tipo,
+        'estado': trabajo.estado,
+        'intentos': trabajo.intentos,
+        'disponible_en': trabajo.disponible_en.isoformat(),
+        'fecha_creacion': trabajo.fecha_creacion.isoformat(),
+    }
+
+
+class ColaTrabajos:
+    """Extensión de Flask con el registro de tareas y la cola en la tabla `trabajo`
+
+    Un trabajador toma el próximo pendiente con SELECT ... FOR UPDATE SKIP
+    LOCKED en Postgres; en SQLite (que ignora FOR UPDATE) alcanza con el
+    UPDATE condicional sobre `estado`, porque las escrituras se serializan.
+    Si falla se reintenta con espera exponencial hasta `max_intentos`.
+
+    Las tareas periódicas (mantenimiento de otras extensiones) las encolan
+    los mismos trabajadores: ninguna instancia necesita un cron aparte.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._tareas = {}
+        self._periodicas = {}
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TRABAJOS_INTERVALO', 1.0)
+        app.config.setdefault('TRABAJOS_REINTENTOS', 5)
+        app.config.setdefault('TRABAJOS_ESPERA_BASE', 5)
+        app.config.setdefault('TRABAJOS_ESPERA_MAX', 600)
+        app.config.setdefault('TRABAJOS_TIEMPO_MAX', 600)
+        app.config.setdefault('TRABAJOS_RETENCION', 24 * 3600)
+        app.config.setdefault('TRABAJOS_EN_PROCESO', False)
+        app.config.setdefault('TRABAJOS_PERIODICOS', True)
+
+        app.before_request(self._asegurar_hilo)
+        app.extensions['trabajos'] = self
+        self.app = app
+
+    def tarea(self, nombre):
+        """Decorador: registrar una función como tarea encolable con `nombre`"""
+        def decorador(funcion):
+            self._tareas[nombre] = funcion
+            return funcion
+        return decorador
+
+    def periodica(self, nombre, clave_intervalo):
+        """Decorador: registrar una tarea sin argumentos que se encola cada `config[clave_intervalo]` segundos
+
+        Con el intervalo en None la tarea no se programa (se puede seguir
+        encolando a mano).
+        """
+        def decorador(funcion):
+            self.tarea(nombre)(funcion)
+            self._periodicas[nombre] = clave_intervalo
+            return funcion
+        return decorador
+
+    def encolar(self, tipo, usuario_id=None, **argumentos):
+        """Agregar un trabajo de la tarea `tipo` a la sesión actual; se publica con el próximo commit
+
+        Los argumentos tienen que ser serializables a JSON (ids, no objetos).
+        """
+        if tipo not in self._tareas:
+            raise LookupError(f'Tarea desconocida: {tipo}')
+        trabajo = Trabajo(tipo=tipo, argumentos=json.dumps(argumentos), usuario_id=usuario_id,
+                          max_intentos=self.app.config['TRABAJOS_REINTENTOS'])
+        db.session.add(trabajo)
+        return trabajo
+
+    # --- Ejecución --------------------------------------------------------
+
+    def tomar(self, trabajador):
+        """Reservar el próximo trabajo disponible para `trabajador` (o None)"""
+        ahora = datetime.utcnow()
+        candidatos = db.session.query(Trabajo.id)\
+                               .filter(Trabajo.estado == 'pendiente', Trabajo.disponible_en <= ahora)\
+                               .order_by(Trabajo.disponible_en, Trabajo.id)\
+                               .limit(10).with_for_update(skip_locked=True).all()
+        for trabajo_id, in candidatos:
+            tomado = db.session.execute(
+                db.update(Trabajo)
+                  .where(Trabajo.id == trabajo_id, Trabajo.estado == 'pendiente')
+                  .values(estado='en_curso', tomado_por=trabajador, tomado_en=ahora,
+                          intentos=Trabajo.intentos + 1, fecha_actualizacion=ahora)
+                  .execution_options(synchronize_session=False)
+            ).rowcount
+            if tomado:
+                db.session.commit()
+                return db.session.get(Trabajo, trabajo_id)
+        db.session.commit()
+        return None
+
+    def _espera(self, intentos):
+        base = self.app.config['TRABAJOS_ESPERA_BASE'] * 2 ** (intentos - 1)
+        return min(self.app.config['TRABAJOS_ESPERA_MAX'], base) * random.uniform(0.5, 1.0)
+
+    def ejecutar(self, trabajo):
+        """Correr un trabajo ya tomado y registrar el resultado; True si terminó bien
+
+        Si la tarea no confirma por su cuenta, sus cambios se guardan en la
+        misma transacción que marca el trabajo como hecho.
+        """
+        trabajo_id = trabajo.id
+        try:
+            funcion = self._tareas.get(trabajo.tipo)
+            if funcion is None:
+                raise LookupError(f'Tarea desconocida: {trabajo.tipo}')
+            funcion(**json.loads(trabajo.argumentos))
+            trabajo.estado = 'hecho'
+            trabajo.error = None
+            db.session.commit()
+            return True
+        except Exception:
+            detalle = traceback.format_exc()
+            db.session.rollback()
+            trabajo = db.session.get(Trabajo, trabajo_id)
+            self.app.logger.error('Falló el trabajo %s (%s), intento %d de %d:\n%s', trabajo.id,
+                                  trabajo.tipo, trabajo.intentos, trabajo.max_intentos, detalle)
+            trabajo.error = detalle[-4000:]
+            if trabajo.intentos >= trabajo.max_intentos:
+                trabajo.estado = 'fallido'
+            else:
+                trabajo.estado = 'pendiente'
+                trabajo.disponible_en = datetime.utcnow() + timedelta(seconds=self._espera(trabajo.intentos))
+            db.session.commit()
+            return False
+
+    def mantener(self):
+        """Devolver a la cola los trabajos colgados y borrar los terminados viejos"""
+        ahora = datetime.utcnow()
+        colgados = Trabajo.query.filter(
+            Trabajo.estado == 'en_curso',
+            Trabajo.tomado_en < ahora - timedelta(seconds=self.app.config['TRABAJOS_TIEMPO_MAX'])
+        )
+        # El intento que quedó colgado (p. ej. el trabajador murió) ya se contó al tomarlo
+        colgados.filter(Trabajo.intentos >= Trabajo.max_intentos)\
+                .update({'estado': 'fallido', 'error': 'Tiempo máximo agotado'}, synchronize_session=False)
+        recuperados = colgados.update({'estado': 'pendiente', 'disponible_en': ahora}, synchronize_session=False)
+        Trabajo.query.filter(
+            Trabajo.estado == 'hecho',
+            Trabajo.fecha_actualizacion < ahora - timedelta(seconds=self.app.config['TRABAJOS_RETENCION'])
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return recuperados
+
+    def programar(self):
+        """Encolar las tareas periódicas que no se encolaron en su intervalo; devuelve los nombres
+
+        El último trabajo de cada tipo en la tabla hace de reloj compartido
+        entre trabajadores. Dos que programan a la vez pueden encolar la
+        misma tarea dos veces: las tareas periódicas tienen que tolerarlo.
+        """
+        ahora = datetime.utcnow()
+        encoladas = []
+        for nombre, clave_intervalo in self._periodicas.items():
+            intervalo = self.app.config[clave_intervalo]
+            if not intervalo:
+                continue
+            reciente = db.session.query(db.exists().where(
+                Trabajo.tipo == nombre,
+                (Trabajo.fecha_creacion > ahora - timedelta(seconds=intervalo)) |
+                Trabajo.estado.in_(('pendiente', 'en_curso'))
+            )).scalar()
+            if not reciente:
+                self.encolar(nombre)
+                encoladas.append(nombre)
+        db.session.commit()
+        return encoladas
+
+    def trabajar(self, detener=None, hasta_vaciar=False):
+        """Bucle del trabajador: tomar y ejecutar trabajos hasta que se pida parar
+
+        Devuelve la cantidad de trabajos ejecutados. Con `hasta_vaciar`
+        termina en cuanto no queda nada disponible.
+        """
+        detener = detener or threading.Event()
+        nombre = f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+        intervalo = self.app.config['TRABAJOS_INTERVALO']
+        ejecutados = 0
+        proximo_mantenimiento = datetime.min
+        while not detener.is_set():
+            with self.app.app_context():
+                try:
+                    if datetime.utcnow() >= proximo_mantenimiento:
+                        self.mantener()
+                        if self.app.config['TRABAJOS_PERIODICOS']:
+                            self.programar()
+                        proximo_mantenimiento = datetime.utcnow() + timedelta(seconds=60)
+                    trabajo = self.tomar(nombre)
+                    if trabajo is not None:
+                        self.ejecutar(trabajo)
+                        ejecutados += 1
+                        continue
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception('Error en el trabajador de la cola')
+            if hasta_vaciar:
+                break
+            detener.wait(intervalo)
+        return ejecutados
+
+    def trabajador(self, hasta_vaciar=False):
+        """Punto de entrada del proceso trabajador; SIGTERM termina el trabajo en curso y sale"""
+        detener = threading.Event()
+        for senal in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(senal, lambda *_: detener.set())
+        return self.trabajar(detener, hasta_vaciar=hasta_vaciar)
+
+    def _asegurar_hilo(self):
+        """Con TRABAJOS_EN_PROCESO, correr un trabajador en un hilo de este proceso"""
+        if self._pid == os.getpid() or not self.app.config['TRABAJOS_EN_PROCESO']:
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self.trabajar, name='cola-trabajos', daemon=True).start()
+
+    # --- Consulta ---------------------------------------------------------
+
+    def resumen(self):
+        """Cantidad de trabajos por (tipo, estado)"""
+        filas = db.session.query(Trabajo.tipo, Trabajo.estado, db.func.count(Trabajo.id))\
+                          .group_by(Trabajo.tipo, Trabajo.estado).all()
+        return {(tipo, estado): cantidad for tipo, estado, cantidad in filas}
+
+    def reintentar_fallidos(self):
+        """Volver a encolar los trabajos fallidos con los intentos en cero"""
+        total = Trabajo.query.filter_by(estado='fallido').update(
+            {'estado': 'pendiente', 'intentos': 0, 'disponible_en': datetime.utcnow()},
+            synchronize_session=False
+        )
+        db.session.commit()
+        return total
+
+
+trabajos = ColaTrabajos()
@@ -0,0 +1,285 @@
+"""
+Ingesta diferida (write-behind) de likes
+Cada clic se anota en un diario en disco y en un buffer en memoria y se
+responde de inmediato; un hilo aplica los cambios acumulados a la tabla
+`like` en una sola transacción cada pocos cientos de milisegundos
+"""
+
+import atexit
+import glob
+import os
+import threading
+from datetime import datetime
+from sqlalchemy import tuple_
+from models import db, Post, Like
+from ranking import ranking
+
+try:
+    import fcntl
+except ImportError:  # Windows: el modo diferido no está disponible
+    fcntl = None
+
+
+def _insertar_ignorando(filas):
+    """INSERT que ignora los pares (usuario, post) ya existentes (respeta unique_like)"""
+    # Solo se importa el dialecto en uso (el de Postgres tarda en cargarse y alarga el arranque)
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    db.session.execute(insert(Like).on_conflict_do_nothing(), filas)
+
+
+def aplicar_cambios(cambios):
+    """Llevar la tabla `like` al estado pedido y recontar los posts afectados
+
+    `cambios` es {(usuario_id, post_id): le_gusta}. Es idempotente: aplicar
+    dos veces el mismo lote (p. ej. al repetir un diario) deja el mismo estado
+    (salvo el puntaje de destacados, que es aproximado y se corrige con
+    `flask recalcular-ranking`).
+    """
+    if not cambios:
+        return
+    ahora = datetime.utcnow()
+    nuevos = [{'usuario_id': usuario_id, 'post_id': post_id, 'fecha_creacion': ahora}
+              for (usuario_id, post_id), le_gusta in cambios.items() if le_gusta]
+    quitados = [par for par, le_gusta in cambios.items() if not le_gusta]
+    if nuevos:
+        _insertar_ignorando(nuevos)
+    if quitados:
+        db.session.execute(
+            db.delete(Like).where(tuple_(Like.usuario_id, Like.post_id).in_(quitados))
+                           .execution_options(synchronize_session=False)
+        )
+
+    # Puntaje de destacados: cada like quitado resta el peso completo (no se sabe cuándo se dio)
+    peso = ranking.app.config['RANKING_PESO_LIKE']
+    pesos = {}
+    for (_, post_id), le_gusta in cambios.items():
+        pesos[post_id] = pesos.get(post_id, 0) + (peso if le_gusta else -peso)
+    ranking.sumar_lote(pesos)
+
+    post_ids = {post_id for _, post_id in cambios}
+    cantidad = db.select(db.func.count(Like.id)).where(Like.post_id == Post.id).scalar_subquery()
+    db.session.execute(
+        db.update(Post).where(Post.id.in_(post_ids))
+                       .values(likes_count=cantidad)
+                       .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def _orden_diario(ruta):
+    """Ordenar diarios por antigüedad y, dentro de un proceso, por número de segmento"""
+    _, pid, segmento = os.path.basename(ruta)[:-len('.journal')].split('-')
+    try:
+        modificado = os.path.getmtime(ruta)
+    except FileNotFoundError:
+        modificado = 0
+    return modificado, int(pid), int(segmento)
+
+
+def leer_diario(ruta):
+    """Estado final de cada par según un diario (la última línea gana)"""
+    cambios = {}
+    with open(ruta) as archivo:
+        for linea in archivo:
+            partes = linea.split()
+            # Una línea cortada por una caída a mitad de escritura se descarta
+            if len(partes) != 3 or not linea.endswith('\n'):
+                continue
+            usuario_id, post_id, le_gusta = partes
+            cambios[(int(usuario_id), int(post_id))] = le_gusta == '1'
+    return cambios
+
+
+class BufferLikes:
+    """Extensión de Flask que acumula likes en memoria y los escribe por lotes
+
+    Cada proceso escribe su propio diario (`likes-<pid>-<n>.journal`) y lo
+    mantiene bloqueado con flock mientras vive. Un diario sin bloqueo es de
+    un worker que murió antes de aplicarlo, y se repite al arrancar.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.activo = False
+        self._pendientes = {}
+        self._originales = {}
+        self._deltas = {}
+        self._en_vuelo = {}
+        self._deltas_en_vuelo = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._diario = None
+        self._segmento = 0
+        self._aplicando = []
+        self._hilo = None
+        self._detener = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LIKES_DIFERIDOS', False)
+        app.config.setdefault('LIKES_INTERVALO_MS', 250)
+        app.config.setdefault('LIKES_DIRECTORIO_DIARIO', os.path.join(app.instance_path, 'likes'))
+        # fsync de cada clic: sin él, un corte de luz o del sistema (no de un worker) pierde los últimos
+        app.config.setdefault('LIKES_FSYNC', True)
+        self.activo = app.config['LIKES_DIFERIDOS']
+        if self.activo and fcntl is None:
+            raise RuntimeError('LIKES_DIFERIDOS necesita fcntl (Linux o macOS)')
+        app.extensions['buffer_likes'] = self
+        self.app = app
+
+    # --- Diario ---------------------------------------------------------
+
+    def _abrir_segmento(self):
+        directorio = self.app.config['LIKES_DIRECTORIO_DIARIO']
+        os.makedirs(directorio, exist_ok=True)
+        self._segmento += 1
+        ruta = os.path.join(directorio, f'likes-{self._pid}-{self._segmento}.journal')
+        descriptor = os.open(ruta, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._diario = (ruta, descriptor)
+
+    def _anotar(self, usuario_id, post_id, le_gusta):
+        descriptor = self._diario[1]
+        os.write(descriptor, f'{usuario_id} {post_id} {int(le_gusta)}\n'.encode())
+        if self.app.config['LIKES_FSYNC']:
+            os.fsync(descriptor)
+
+    def recuperar(self):
+        """Aplicar los diarios que dejaron procesos caídos; devuelve cuántos"""
+        patron = os.path.join(self.app.config['LIKES_DIRECTORIO_DIARIO'], 'likes-*.journal')
+        recuperados = 0
+        for ruta in sorted(glob.glob(patron), key=_orden_diario):
+            try:
+                descriptor = os.open(ruta, os.O_RDONLY)
+            except FileNotFoundError:
+                continue  # otro proceso ya lo aplicó
+            try:
+                fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(descriptor)
+                continue  # lo tiene un proceso vivo
+            try:
+                if os.path.exists(ruta):
+                    aplicar_cambios(leer_diario(ruta))
+                    os.unlink(ruta)
+                    recuperados += 1
+            finally:
+                os.close(descriptor)
+        return recuperados
+
+    # --- Buffer ---------------------------------------------------------
+
+    def _iniciar(self):
+        """Preparar diario e hilo en el proceso actual (después del fork de gunicorn)"""
+        self._pid = os.getpid()
+        self._pendientes, self._originales, self._deltas = {}, {}, {}
+        self._en_vuelo, self._deltas_en_vuelo = {}, {}
+        self._aplicando = []
+        self._segmento = 0
+        self.recuperar()
+        self._abrir_segmento()
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name='buffer-likes', daemon=True)
+        self._hilo.start()
+        atexit.register(self.detener)
+
+    def alternar(self, usuario_id, post):
+        """Dar o quitar el like y devolver (le_gusta, cantidad optimista de likes)"""
+        par = (usuario_id, post.id)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._iniciar()
+            # Un lote que se está escribiendo todavía no se ve en la base de datos, y no se sabe
+            # si va a quedar: el valor de la base es desconocido (None) y el cambio se aplica siempre
+            actual = self._pendientes.get(par, self._en_vuelo.get(par))
+            original = self._originales.get(par, None if par in self._en_vuelo else actual)
+
+        if actual is None:
+            actual = original = db.session.query(
+                db.exists().where(Like.usuario_id == usuario_id, Like.post_id == post.id)
+            ).scalar()
+
+        with self._lock:
+            # Otra petición del mismo par (un doble clic) pudo anotarse mientras se consultaba la base
+            visto = self._pendientes.get(par, self._en_vuelo.get(par))
+            if visto is not None:
+                actual = visto
+            nuevo = not actual
+            self._anotar(usuario_id, post.id, nuevo)
+            self._originales.setdefault(par, original)
+            self._pendientes[par] = nuevo
+            delta = self._deltas.get(post.id, 0) + (1 if nuevo else -1)
+            self._deltas[post.id] = delta
+            en_vuelo = self._deltas_en_vuelo.get(post.id, 0)
+        return nuevo, max(0, post.likes_count + en_vuelo + delta)
+
+    def _bucle(self):
+        intervalo = self.app.config['LIKES_INTERVALO_MS'] / 1000
+        while not self._detener.wait(intervalo):
+            self.vaciar()
+
+    def vaciar(self):
+        """Aplicar ya los likes acumulados (lo llama el hilo periódicamente)"""
+        with self._lock:
+            if not self._pendientes:
+                return
+            cambios = {par: le_gusta for par, le_gusta in self._pendientes.items()
+                       if le_gusta != self._originales.get(par)}
+            originales, deltas = self._originales, self._deltas
+            self._en_vuelo, self._deltas_en_vuelo = dict(self._pendientes), deltas
+            self._pendientes, self._originales, self._deltas = {}, {}, {}
+            self._aplicando.append(self._diario)
+            self._abrir_segmento()
+
+        try:
+            with self.app.app_context():
+                aplicar_cambios(cambios)
+        except Exception:
+            self.app.logger.exception('No se pudieron aplicar %d likes; se reintentará', len(cambios))
+            with self._lock:
+                self._en_vuelo, self._deltas_en_vuelo = {}, {}
+                # Devolver al buffer lo que no fue reemplazado por clics más nuevos; los que sí, vuelven
+                # a comparar con el valor de la base de antes del lote fallido
+                for par, le_gusta in cambios.items():
+                    if par not in self._pendientes:
+                        self._pendientes[par] = le_gusta
+                        self._originales[par] = originales.get(par)
+                    elif self._originales.get(par) is None:
+                        self._originales[par] = originales.get(par)
+                for post_id, delta in deltas.items():
+                    self._deltas[post_id] = self._deltas.get(post_id, 0) + delta
+            return
+
+        with self._lock:
+            self._en_vuelo, self._deltas_en_vuelo = {}, {}
+            segmentos, self._aplicando = self._aplicando, []
+        for ruta, descriptor in segmentos:
+            os.unlink(ruta)
+            os.close(descriptor)
+
+    def detener(self):
+        """Parar el hilo y aplicar lo pendiente (al terminar el proceso)
+
+        Lo que no se pudo aplicar queda en el diario, que se repite al
+        arrancar. El próximo `alternar` vuelve a iniciar el buffer.
+        """
+        if self._hilo is None or self._pid != os.getpid():
+            return
+        self._detener.set()
+        self._hilo.join()
+        self._hilo = None
+        self.vaciar()
+        if not self._pendientes:
+            os.unlink(self._diario[0])
+        # Soltar el bloqueo de los diarios sin aplicar para que otro proceso (o el próximo arranque) los repita
+        for _, descriptor in self._aplicando + [self._diario]:
+            os.close(descriptor)
+        self._aplicando = []
+        self._pid = None
+
+
+buffer_likes = BufferLikes()
@@ -0,0 +1,479 @@
+"""
+Prueba de carga local: la app bajo gunicorn contra una base poblada con seed.py
+Cada usuario simulado es una tarea asyncio con su propia conexión keep-alive
+y sus cookies, que repite una mezcla de acciones (login, feed, perfil, likes,
+comentarios, seguimientos, publicaciones con imagen); el reporte da
+throughput, latencia y errores por acción para cada nivel de concurrencia
+y cantidad de workers
+"""
+
+import asyncio
+import os
+import random
+import re
+import socket
+import struct
+import subprocess
+import sys
+import time
+import urllib.request
+import zlib
+from collections import Counter
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+from models import db, Usuario, Post
+from benchmark import resumen_latencias
+from seed import PASSWORD
+
+MEZCLA_POR_DEFECTO = {
+    'feed': 40,
+    'perfil': 15,
+    'like': 20,
+    'comentario': 10,
+    'seguir': 5,
+    'publicar': 5,
+    'login': 5,
+}
+
+_TOKEN_CSRF = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+_POST_ID = re.compile(r'class="post-card" data-post-id="(\d+)"')
+
+# Acción a la que corresponde cada "Exception on <ruta> [<método>]" del log de gunicorn
+_RUTAS_ACCIONES = (
+    ('POST', re.compile(r'/post/\d+/like$'), 'like'),
+    ('POST', re.compile(r'/post/\d+/comentario$'), 'comentario'),
+    ('POST', re.compile(r'/usuario/[^/]+/seguir$'), 'seguir'),
+    ('POST', re.compile(r'/post/crear$'), 'publicar'),
+    (None, re.compile(r'/login$'), 'login'),
+    ('GET', re.compile(r'/feed$'), 'feed'),
+    ('GET', re.compile(r'/usuario/[^/]+$'), 'perfil'),
+)
+_EXCEPCION = re.compile(r'Exception on (\S+) \[(\w+)\]')
+BLOQUEO = 'database is locked'
+
+
+def leer_mezcla(texto):
+    """Convertir 'feed=40,like=20' en {'feed': 40, 'like': 20} validando las acciones"""
+    mezcla = {}
+    for parte in filter(None, (parte.strip() for parte in texto.split(','))):
+        accion, _, peso = parte.partition('=')
+        if accion not in MEZCLA_POR_DEFECTO:
+            raise ValueError(f'Acción desconocida: {accion} (válidas: {", ".join(MEZCLA_POR_DEFECTO)})')
+        mezcla[accion] = float(peso)
+    if not any(mezcla.values()):
+        raise ValueError('La mezcla no tiene ninguna acción con peso')
+    return mezcla
+
+
+def _png(lado=64):
+    """PNG RGB de `lado` x `lado` con un degradé (sin depender de Pillow)"""
+    filas = b''.join(
+        b'\x00' + bytes(valor for x in range(lado) for valor in (x * 4 % 256, y * 4 % 256, 160))
+        for y in range(lado)
+    )
+
+    def bloque(tipo, datos):
+        return struct.pack('>I', len(datos)) + tipo + datos + struct.pack('>I', zlib.crc32(tipo + datos))
+
+    return (b'\x89PNG\r\n\x1a\n' + bloque(b'IHDR', struct.pack('>IIBBBBB', lado, lado, 8, 2, 0, 0, 0))
+            + bloque(b'IDAT', zlib.compress(filas)) + bloque(b'IEND', b''))
+
+
+def _multipart(campos, archivos):
+    """Cuerpo multipart/form-data y su Content-Type"""
+    limite = f'----prueba-carga-{random.getrandbits(64):016x}'
+    partes = [f'--{limite}\r\nContent-Disposition: form-data; name="{nombre}"\r\n\r\n{valor}\r\n'.encode()
+              for nombre, valor in campos.items()]
+    for nombre, (archivo, tipo, datos) in archivos.items():
+        partes.append(f'--{limite}\r\nContent-Disposition: form-data; name="{nombre}"; filename="{archivo}"\r\n'
+                      f'Content-Type: {tipo}\r\n\r\n'.encode() + datos + b'\r\n')
+    partes.append(f'--{limite}--\r\n'.encode())
+    return b''.join(partes), f'multipart/form-data; boundary={limite}'
+
+
+class ClienteHTTP:
+    """Cliente HTTP/1.1 mínimo sobre asyncio: una conexión keep-alive y un jar de cookies"""
+
+    def __init__(self, host, puerto, timeout):
+        self.host = host
+        self.puerto = puerto
+        self.timeout = timeout
+        self.cookies = {}
+        self._lector = None
+        self._escritor = None
+
+    async def cerrar(self):
+        if self._escritor is not None:
+            self._escritor.close()
+        self._lector = self._escritor = None
+
+    async def pedir(self, metodo, ruta, cuerpo=b'', tipo=None, cabeceras=None):
+        """Hacer una petición y devolver (estado, cabeceras, cuerpo); no sigue redirecciones"""
+        return await asyncio.wait_for(self._pedir(metodo, ruta, cuerpo, tipo, cabeceras or {}), self.timeout)
+
+    async def _pedir(self, metodo, ruta, cuerpo, tipo, cabeceras):
+        lineas = [f'{metodo} {ruta} HTTP/1.1', f'Host: {self.host}:{self.puerto}',
+                  f'Content-Length: {len(cuerpo)}', 'Accept-Encoding: identity']
+        if tipo:
+            lineas.append(f'Content-Type: {tipo}')
+        if self.cookies:
+            lineas.append('Cookie: ' + '; '.join(f'{nombre}={valor}' for nombre, valor in self.cookies.items()))
+        lineas += [f'{nombre}: {valor}' for nombre, valor in cabeceras.items()]
+        peticion = ('\r\n'.join(lineas) + '\r\n\r\n').encode('latin-1') + cuerpo
+
+        reutilizada = self._escritor is not None
+        if not reutilizada:
+            self._lector, self._escritor = await asyncio.open_connection(self.host, self.puerto)
+        self._escritor.write(peticion)
+        await self._escritor.drain()
+        linea = await self._lector.readline()
+        if not linea and reutilizada:
+            # El servidor cerró la conexión ociosa antes de leer la petición: reintentar en una nueva
+            await self.cerrar()
+            return await self._pedir(metodo, ruta, cuerpo, tipo, cabeceras)
+        if not linea:
+            raise ConnectionResetError('El servidor cerró la conexión')
+        estado = int(linea.split(b' ', 2)[1])
+
+        respuesta = {}
+        while True:
+            linea = await self._lector.readline()
+            if linea in (b'\r\n', b'\n', b''):
+                break
+            nombre, _, valor = linea.decode('latin-1').partition(':')
+            nombre, valor = nombre.strip().lower(), valor.strip()
+            if nombre == 'set-cookie':
+                cookie = SimpleCookie()
+                cookie.load(valor)
+                self.cookies.update((clave, morsel.value) for clave, morsel in cookie.items())
+            else:
+                respuesta[nombre] = valor
+
+        if 'chunked' in respuesta.get('transfer-encoding', ''):
+            partes = []
+            while True:
+                tamano = int((await self._lector.readline()).split(b';')[0], 16)
+                if tamano == 0:
+                    await self._lector.readline()
+                    break
+                partes.append(await self._lector.readexactly(tamano))
+                await self._lector.readline()
+            contenido = b''.join(partes)
+        elif 'content-length' in respuesta:
+            contenido = await self._lector.readexactly(int(respuesta['content-length']))
+        elif estado in (204, 304):
+            contenido = b''
+        else:
+            contenido = await self._lector.read()
+            await self.cerrar()
+        if respuesta.get('connection', '').lower() == 'close':
+            await self.cerrar()
+        return estado, respuesta, contenido
+
+
+def _error(estado, esperados=None):
+    """None si la respuesta es la esperada; si no, la etiqueta del error"""
+    if esperados is not None and estado not in esperados:
+        return f'http_{estado}' if estado >= 400 else f'inesperado_{estado}'
+    return f'http_{estado}' if estado >= 400 else None
+
+
+class UsuarioSimulado:
+    """Un visitante: inicia sesión y repite acciones elegidas según los pesos de la mezcla"""
+
+    def __init__(self, prueba, rng, username):
+        self.prueba = prueba
+        self.rng = rng
+        self.username = username
+        self.http = ClienteHTTP(prueba.host, prueba.puerto, prueba.timeout)
+        self.token = None
+        self.posts = []
+        self.etags = {}
+
+    def _post_id(self):
+        return self.rng.choice(self.posts or self.prueba.post_ids)
+
+    def _otro_usuario(self):
+        username = self.rng.choice(self.prueba.usernames)
+        return username if username != self.username else self.rng.choice(self.prueba.usernames)
+
+    async def _pagina(self, ruta):
+        """GET condicional como el del navegador (If-None-Match con el ETag anterior)"""
+        cabeceras = {'If-None-Match': self.etags[ruta]} if ruta in self.etags else None
+        estado, respuesta, contenido = await self.http.pedir('GET', ruta, cabeceras=cabeceras)
+        if 'etag' in respuesta:
+            self.etags[ruta] = respuesta['etag']
+        return estado, contenido.decode('utf-8', 'replace')
+
+    async def login(self):
+        self.http.cookies.clear()
+        self.etags.clear()
+        estado, _, contenido = await self.http.pedir('GET', '/login')
+        token = _TOKEN_CSRF.search(contenido.decode('utf-8', 'replace'))
+        if estado != 200 or token is None:
+            return _error(estado, (200,))
+        self.token = token.group(1)
+        cuerpo = urlencode({'csrf_token': self.token, 'username': self.username, 'password': PASSWORD})
+        estado, _, _ = await self.http.pedir('POST', '/login', cuerpo.encode(), 'application/x-www-form-urlencoded')
+        # Un 200 es el formulario otra vez: usuario, contraseña o token rechazados
+        return 'login_rechazado' if estado == 200 else _error(estado, (302,))
+
+    async def feed(self):
+        estado, html = await self._pagina('/feed')
+        if estado == 200:
+            self.posts = [int(post_id) for post_id in _POST_ID.findall(html)] or self.posts
+            token = _TOKEN_CSRF.search(html)
+            if token is not None:
+                self.token = token.group(1)
+        return _error(estado, (200, 304))
+
+    async def perfil(self):
+        estado, _ = await self._pagina(f'/usuario/{self._otro_usuario()}')
+        return _error(estado, (200, 304))
+
+    async def like(self):
+        estado, _, _ = await self.http.pedir('POST', f'/post/{self._post_id()}/like')
+        return _error(estado, (200,))
+
+    async def comentario(self):
+        cuerpo = urlencode({'csrf_token': self.token or '', 'contenido': f'Comentario de prueba {self.rng.random():.6f}'})
+        estado, _, _ = await self.http.pedir('POST', f'/post/{self._post_id()}/comentario', cuerpo.encode(),
+                                             'application/x-www-form-urlencoded')
+        return _error(estado, (201,))
+
+    async def seguir(self):
+        estado, _, _ = await self.http.pedir('POST', f'/usuario/{self._otro_usuario()}/seguir')
+        return _error(estado, (200,))
+
+    async def publicar(self):
+        cuerpo, tipo = _multipart(
+            {'csrf_token': self.token or '', 'contenido': f'Publicación de prueba {self.rng.random():.6f}'},
+            {'imagen': ('prueba.png', 'image/png', self.prueba.imagen)}
+        )
+        estado, _, _ = await self.http.pedir('POST', '/post/crear', cuerpo, tipo)
+        return _error(estado, (302,))
+
+    async def ejecutar(self, accion):
+        inicio = time.perf_counter()
+        try:
+            error = await getattr(self, accion)()
+        except asyncio.TimeoutError:
+            error = 'timeout'
+            await self.http.cerrar()
+        except (OSError, asyncio.IncompleteReadError, ValueError) as excepcion:
+            error = type(excepcion).__name__
+            await self.http.cerrar()
+        self.prueba.registrar(accion, inicio, time.perf_counter() - inicio, error)
+
+    async def correr(self, hasta):
+        acciones, pesos = zip(*self.prueba.mezcla.items())
+        await self.ejecutar('login')
+        while time.perf_counter() < hasta:
+            await self.ejecutar(self.rng.choices(acciones, weights=pesos)[0])
+            if self.prueba.pausa:
+                await asyncio.sleep(self.rng.expovariate(1 / self.prueba.pausa))
+        await self.http.cerrar()
+
+
+class Nivel:
+    """Un nivel de concurrencia: lanza los usuarios simulados y junta las mediciones"""
+
+    def __init__(self, host, puerto, usernames, post_ids, mezcla, pausa, timeout, imagen):
+        self.host = host
+        self.puerto = puerto
+        self.usernames = usernames
+        self.post_ids = post_ids
+        self.mezcla = {accion: peso for accion, peso in mezcla.items() if peso}
+        self.pausa = pausa
+        self.timeout = timeout
+        self.imagen = imagen
+        self.desde = None
+        self.latencias = {}
+        self.errores = {}
+
+    def registrar(self, accion, inicio, duracion, error):
+        # Lo que empezó durante el calentamiento no se cuenta
+        if inicio < self.desde:
+            return
+        self.latencias.setdefault(accion, []).append(duracion * 1000)
+        if error is not None:
+            self.errores.setdefault(accion, Counter())[error] += 1
+
+    async def correr(self, concurrencia, duracion, calentamiento, semilla):
+        self.desde = time.perf_counter() + calentamiento
+        hasta = self.desde + duracion
+        rng = random.Random(semilla)
+        usuarios = [UsuarioSimulado(self, random.Random(rng.random()), rng.choice(self.usernames))
+                    for _ in range(concurrencia)]
+        await asyncio.gather(*(usuario.correr(hasta) for usuario in usuarios))
+        # Las últimas peticiones pueden terminar después de `hasta`: se mide hasta la última
+        return max(time.perf_counter(), hasta) - self.desde
+
+
+def _puerto_libre():
+    with socket.socket() as conexion:
+        conexion.bind(('127.0.0.1', 0))
+        return conexion.getsockname()[1]
+
+
+class Servidor:
+    """gunicorn con gunicorn.conf.py en un puerto libre; su log queda en un archivo para buscar errores"""
+
+    def __init__(self, directorio, workers, threads, base_de_datos, ruta_log):
+        self.directorio = directorio
+        self.workers = workers
+        self.threads = threads
+        self.base_de_datos = base_de_datos
+        self.ruta_log = ruta_log
+        self.puerto = _puerto_libre()
+        self._proceso = None
+        self._leido = 0
+
+    def __enter__(self):
+        # Por entorno y no con --workers/--threads: create_app también los lee (backend de eventos)
+        entorno = dict(os.environ, DATABASE_URL=self.base_de_datos,
+                       WEB_CONCURRENCY=str(self.workers), GUNICORN_THREADS=str(self.threads))
+        self._log = open(self.ruta_log, 'ab')
+        self._leido = self._log.tell()
+        self._proceso = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{self.puerto}'],
+            cwd=self.directorio, env=entorno, stdout=self._log, stderr=subprocess.STDOUT
+        )
+        limite = time.monotonic() + 60
+        while time.monotonic() < limite:
+            if self._proceso.poll() is not None:
+                raise RuntimeError(f'gunicorn terminó al arrancar; ver {self.ruta_log}')
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{self.puerto}/login', timeout=2) as respuesta:
+                    if respuesta.status == 200:
+                        return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__(None, None, None)
+        raise RuntimeError(f'gunicorn no respondió en 60 s; ver {self.ruta_log}')
+
+    def __exit__(self, *exc):
+        self._proceso.terminate()
+        try:
+            self._proceso.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self._proceso.kill()
+            self._proceso.wait()
+        self._log.close()
+
+    def errores_nuevos(self):
+        """Excepciones registradas desde la última llamada: {acción: Counter(tipo)}"""
+        self._log.flush()
+        with open(self.ruta_log, 'rb') as archivo:
+            archivo.seek(self._leido)
+            texto = archivo.read().decode('utf-8', 'replace')
+            self._leido = archivo.tell()
+        return contar_excepciones(texto)
+
+
+def contar_excepciones(log):
+    """Clasificar las trazas "Exception on <ruta> [<método>]" de Flask por acción
+
+    Cada traza cuenta como 'db_bloqueada' si la causa fue el lock de
+    escritura de SQLite y como 'excepcion' en cualquier otro caso.
+    """
+    conteos = {}
+    coincidencias = list(_EXCEPCION.finditer(log))
+    for indice, coincidencia in enumerate(coincidencias):
+        fin = coincidencias[indice + 1].start() if indice + 1 < len(coincidencias) else len(log)
+        ruta, metodo = coincidencia.groups()
+        accion = next((nombre for esperado, patron, nombre in _RUTAS_ACCIONES
+                       if esperado in (None, metodo) and patron.search(ruta.split('?')[0])), 'otras')
+        tipo = 'db_bloqueada' if BLOQUEO in log[coincidencia.end():fin] else 'excepcion'
+        conteos.setdefault(accion, Counter())[tipo] += 1
+    return conteos
+
+
+def _reporte_nivel(nivel, segundos, excepciones):
+    acciones = {}
+    for accion in sorted(set(nivel.latencias) | set(excepciones)):
+        latencias = nivel.latencias.get(accion, [])
+        errores = dict(nivel.errores.get(accion, {}))
+        errores.update(excepciones.get(accion, {}))
+        fallidas = sum(nivel.errores.get(accion, {}).values())
+        acciones[accion] = {
+            'peticiones': len(latencias),
+            'rps': round(len(latencias) / segundos, 2),
+            'latencia_ms': resumen_latencias(latencias) if latencias else None,
+            'tasa_error': round(fallidas / len(latencias), 4) if latencias else None,
+            'errores': errores,
+        }
+    total = sum(datos['peticiones'] for datos in acciones.values())
+    fallidas = sum(sum(contador.values()) for contador in nivel.errores.values())
+    return {
+        'segundos': round(segundos, 2),
+        'peticiones': total,
+        'rps': round(total / segundos, 2),
+        'tasa_error': round(fallidas / total, 4) if total else None,
+        'db_bloqueada': sum(contador.get('db_bloqueada', 0) for contador in excepciones.values()),
+        'acciones': acciones,
+    }
+
+
+def ejecutar_prueba_carga(app, concurrencias=(1, 8, 32), workers=(2,), threads=16, duracion=20.0,
+                          calentamiento=5.0, mezcla=None, pausa=0.0, timeout=30.0, url=None,
+                          semilla=42, muestra_usuarios=5000, al_terminar_nivel=None):
+    """Correr cada nivel de concurrencia contra gunicorn (uno por cantidad de workers) y devolver el reporte
+
+    Con `url` se usa un servidor ya levantado (no se arranca gunicorn ni se
+    leen sus errores). `al_terminar_nivel(resultado)` permite mostrar el
+    progreso. Las publicaciones suben imágenes de verdad: usar una base y
+    un UPLOAD_FOLDER descartables.
+    """
+    mezcla = mezcla or MEZCLA_POR_DEFECTO
+    with app.app_context():
+        usernames = [username for username, in db.session.query(Usuario.username)
+                                                          .order_by(Usuario.id).limit(muestra_usuarios)]
+        post_ids = [post_id for post_id, in db.session.query(Post.id).order_by(Post.id.desc()).limit(1000)]
+        base_de_datos = str(db.engine.url.render_as_string(hide_password=False))
+    if len(usernames) < 2 or not post_ids:
+        raise RuntimeError('La base de datos está vacía: ejecuta primero `flask sembrar`')
+
+    imagen = _png()
+    reporte = {'mezcla': mezcla, 'duracion_s': duracion, 'calentamiento_s': calentamiento,
+               'pausa_s': pausa, 'threads': threads, 'niveles': []}
+
+    def correr_niveles(host, puerto, servidor, cantidad_workers):
+        for concurrencia in concurrencias:
+            nivel = Nivel(host, puerto, usernames, post_ids, mezcla, pausa, timeout, imagen)
+            segundos = asyncio.run(nivel.correr(concurrencia, duracion, calentamiento, semilla))
+            excepciones = servidor.errores_nuevos() if servidor is not None else {}
+            resultado = dict(workers=cantidad_workers, concurrencia=concurrencia,
+                             **_reporte_nivel(nivel, segundos, excepciones))
+            reporte['niveles'].append(resultado)
+            if al_terminar_nivel is not None:
+                al_terminar_nivel(resultado)
+
+    if url is not None:
+        direccion = urllib.request.urlparse(url)
+        correr_niveles(direccion.hostname, direccion.port or 80, None, None)
+        return reporte
+
+    ruta_log = os.path.join(app.instance_path, 'prueba-carga.log')
+    os.makedirs(app.instance_path, exist_ok=True)
+    reporte['log'] = ruta_log
+    for cantidad_workers in workers:
+        with Servidor(app.root_path, cantidad_workers, threads, base_de_datos, ruta_log) as servidor:
+            correr_niveles('127.0.0.1', servidor.puerto, servidor, cantidad_workers)
+    return reporte
+
+
+def tabla_nivel(resultado):
+    """Resumen legible de un nivel para la consola"""
+    tasa = f'{resultado["tasa_error"]:.2%}' if resultado['tasa_error'] is not None else '-'
+    lineas = [f'workers={resultado["workers"] or "?"} concurrencia={resultado["concurrencia"]}: '
+              f'{resultado["rps"]} req/s, error {tasa}, '
+              f'database is locked: {resultado["db_bloqueada"]}',
+              f'  {"acción":<12}{"req/s":>9}{"p50 ms":>10}{"p90 ms":>10}{"p99 ms":>10}{"error":>9}  errores']
+    for accion, datos in resultado['acciones'].items():
+        latencia = datos['latencia_ms'] or {}
+        tasa = f'{datos["tasa_error"]:.1%}' if datos['tasa_error'] is not None else '-'
+        errores = ', '.join(f'{tipo}={cantidad}' for tipo, cantidad in sorted(datos['errores'].items()))
+        lineas.append(f'  {accion:<12}{datos["rps"]:>9}{latencia.get("p50", "-"):>10}'
+                      f'{latencia.get("p90", "-"):>10}{latencia.get("p99", "-"):>10}{tasa:>9}  {errores}')
+    return '\n'.join(lineas)
@@ -0,0 +1,109 @@
+"""
+Carga optimizada de publicaciones para el feed y los perfiles
+Evita consultas N+1 precargando autores, contadores y comentarios
+"""
+
+from flask import g, has_request_context
+from sqlalchemy.orm import joinedload
+from models import db, Post, Like
+from pagination import codificar_cursor, anteriores_a
+from timeline import timelines
+from comments import COMENTARIOS_POR_POST, cargar_recientes
+from ranking import ranking
+from archive import archivo
+
+# Tamaño de página del feed y de la grilla del perfil
+POSTS_POR_PAGINA = 20
+
+
+def cargar_posts(query, usuario_id=None, comentarios_por_post=COMENTARIOS_POR_POST):
+    """Ejecutar una consulta de posts precargando todo lo que muestran los templates
+
+    Cada post queda con su autor, el flag `le_gusta` para `usuario_id` y sus
+    últimos comentarios con sus autores (los contadores ya viven en el post).
+    Se realizan como máximo dos consultas, sin importar cuántos posts haya.
+    """
+    if usuario_id is not None:
+        le_gusta = db.exists().where(Like.post_id == Post.id, Like.usuario_id == usuario_id)
+    else:
+        le_gusta = db.false()
+
+    filas = query.options(joinedload(Post.usuario))\
+                 .add_columns(le_gusta)\
+                 .all()
+
+    posts = []
+    for post, gusta in filas:
+        post.le_gusta = bool(gusta)
+        post.comentarios_recientes = []
+        posts.append(post)
+
+    if posts and comentarios_por_post:
+        por_id = {post.id: post for post in posts}
+        for comentario in cargar_recientes(list(por_id), comentarios_por_post):
+            por_id[comentario.post_id].comentarios_recientes.append(comentario)
+
+    return posts
+
+
+def _paginar(filas, limite):
+    """Separar la página pedida y calcular el cursor de la siguiente"""
+    if len(filas) <= limite:
+        return filas, None
+    filas = filas[:limite]
+    return filas, codificar_cursor(filas[-1].fecha_creacion, filas[-1].id)
+
+
+def leer_timeline(usuario, cursor=None, limite=POSTS_POR_PAGINA):
+    """Ids de una página del feed (y uno más para saber si hay siguiente)
+
+    Quedan guardados en `g` para que pagina_feed no vuelva a leer el
+    timeline: la versión del ETag (conditional.py) y la vista de la misma
+    petición usan una sola consulta.
+    """
+    post_ids = timelines.leer(usuario, limite + 1, antes=cursor)
+    g.timeline_leido = ((usuario.id, cursor, limite), post_ids)
+    return post_ids
+
+
+def pagina_feed(usuario, cursor=None, limite=POSTS_POR_PAGINA):
+    """Página del feed de `usuario` a partir de `cursor` y el cursor siguiente"""
+    leido = g.pop('timeline_leido', None) if has_request_context() else None
+    if leido is not None and leido[0] == (usuario.id, cursor, limite):
+        post_ids = leido[1]
+    else:
+        post_ids = timelines.leer(usuario, limite + 1, antes=cursor)
+    posts = cargar_posts(Post.query.filter(Post.id.in_(post_ids[:limite]))
+                                   .order_by(Post.fecha_creacion.desc(), Post.id.desc()),
+                         usuario_id=usuario.id)
+    if len(post_ids) <= limite or not posts:
+        return posts, None
+    return posts, codificar_cursor(posts[-1].fecha_creacion, posts[-1].id)
+
+
+def pagina_destacados(usuario_id, cursor=None, limite=POSTS_POR_PAGINA, todos=False):
+    """Página de posts por puntaje: del feed de `usuario_id` o, con `todos`, de toda la red"""
+    query = ranking.consulta(None if todos else usuario_id, cursor)
+    posts = cargar_posts(query.limit(limite + 1), usuario_id=usuario_id)
+    if len(posts) <= limite:
+        return posts, None
+    posts = posts[:limite]
+    return posts, ranking.codificar_cursor(posts[-1])
+
+
+def pagina_perfil(autor, usuario_id, cursor=None, limite=POSTS_POR_PAGINA):
+    """Página de la grilla de posts de `autor` y el cursor siguiente
+
+    Si la página pasa del último post de la tabla caliente y el autor tiene
+    posts archivados, se mezcla con los del archivo en el mismo orden.
+    """
+    query = Post.query.filter(Post.usuario_id == autor.id)
+    if cursor is not None:
+        query = query.filter(anteriores_a(cursor))
+    posts = cargar_posts(query.order_by(Post.fecha_creacion.desc(), Post.id.desc()).limit(limite + 1),
+                         usuario_id=usuario_id,
+                         comentarios_por_post=0)
+    if len(posts) <= limite and autor.posts_archivados_count:
+        posts += archivo.pagina_perfil(autor.id, cursor, limite + 1)
+        posts = sorted(posts, key=lambda post: (post.fecha_creacion, post.id), reverse=True)[:limite + 1]
+    return _paginar(posts, limite)
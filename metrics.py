@@ -0,0 +1,261 @@
+"""
+Instrumentación por petición y endpoint /metrics en formato de texto Prometheus
+Mide latencia, tiempo y cantidad de consultas SQL y tiempo de render de
+plantillas; opcionalmente perfila con cProfile una muestra de las peticiones
+"""
+
+import cProfile
+import hmac
+import os
+import random
+import threading
+import time
+from flask import Response, abort, g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Límites (en segundos) de los buckets de los histogramas de tiempo
+BUCKETS_TIEMPO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Límites de los buckets del histograma de consultas por petición
+BUCKETS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(nombres, valores, extra=None):
+    pares = list(zip(nombres, valores))
+    if extra:
+        pares.append(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in pares) + '}'
+
+
+class Contador:
+    """Contador monótono con etiquetas"""
+
+    tipo = 'counter'
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, *etiquetas, cantidad=1):
+        with self._lock:
+            self._valores[etiquetas] = self._valores.get(etiquetas, 0) + cantidad
+
+    def lineas(self):
+        with self._lock:
+            valores = sorted(self._valores.items())
+        for etiquetas, valor in valores:
+            yield f'{self.nombre}{_etiquetas(self.etiquetas, etiquetas)} {valor}'
+
+
+class Histograma:
+    """Histograma acumulativo con etiquetas (buckets, suma y cantidad)"""
+
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_TIEMPO):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *etiquetas):
+        with self._lock:
+            serie = self._series.get(etiquetas)
+            if serie is None:
+                serie = self._series[etiquetas] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    def lineas(self):
+        with self._lock:
+            series = sorted((etiquetas, (list(conteos), suma, total))
+                            for etiquetas, (conteos, suma, total) in self._series.items())
+        for etiquetas, (conteos, suma, total) in series:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, conteos):
+                acumulado += conteo
+                yield f'{self.nombre}_bucket{_etiquetas(self.etiquetas, etiquetas, ("le", limite))} {acumulado}'
+            yield f'{self.nombre}_bucket{_etiquetas(self.etiquetas, etiquetas, ("le", "+Inf"))} {total}'
+            yield f'{self.nombre}_sum{_etiquetas(self.etiquetas, etiquetas)} {suma}'
+            yield f'{self.nombre}_count{_etiquetas(self.etiquetas, etiquetas)} {total}'
+
+
+class _Peticion:
+    """Lo que se va midiendo durante una petición (vive en `g`)"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tiempo_sql = 0.0
+        self.plantillas = []
+        self.renders = []
+        self.perfil = None
+
+
+class Metricas:
+    """Extensión de Flask que instrumenta cada petición y expone /metrics
+
+    Las métricas viven en la memoria de cada proceso: con varios workers de
+    gunicorn cada uno expone las suyas, y Prometheus las agrega por instancia.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.peticiones = Contador(
+            'redsocial_http_requests_total', 'Peticiones atendidas',
+            ('endpoint', 'metodo', 'estado'))
+        self.latencia = Histograma(
+            'redsocial_http_request_duration_seconds', 'Latencia de las peticiones',
+            ('endpoint', 'metodo'))
+        self.tiempo_sql = Histograma(
+            'redsocial_sql_duration_seconds', 'Tiempo total en consultas SQL por petición',
+            ('endpoint',))
+        self.consultas = Histograma(
+            'redsocial_sql_queries_per_request', 'Consultas SQL por petición',
+            ('endpoint',), buckets=BUCKETS_CONSULTAS)
+        self.render = Histograma(
+            'redsocial_template_render_seconds', 'Tiempo de render de cada plantilla',
+            ('plantilla',))
+        self.n_mas_uno = Contador(
+            'redsocial_n_plus_one_total', 'Peticiones que superaron el umbral de consultas SQL',
+            ('endpoint',))
+        self.perfiles = Contador(
+            'redsocial_profiles_dumped_total', 'Perfiles cProfile guardados por peticiones lentas',
+            ('endpoint',))
+        self.metricas = [self.peticiones, self.latencia, self.tiempo_sql, self.consultas,
+                         self.render, self.n_mas_uno, self.perfiles]
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICAS_UMBRAL_CONSULTAS', 30)
+        app.config.setdefault('METRICAS_PERFILADOR', False)
+        app.config.setdefault('METRICAS_MUESTREO', 0.05)
+        app.config.setdefault('METRICAS_LENTO_MS', 500)
+        app.config.setdefault('METRICAS_DIRECTORIO_PERFILES', 'perfiles')
+        # /metrics solo responde a estas IPs o con `Authorization: Bearer <METRICAS_TOKEN>`
+        app.config.setdefault('METRICAS_TOKEN', None)
+        app.config.setdefault('METRICAS_IPS', ('127.0.0.1', '::1'))
+
+        app.before_request(self._antes)
+        app.after_request(self._despues)
+        app.add_url_rule('/metrics', 'metricas', self.exponer)
+        before_render_template.connect(self._antes_de_render, app)
+        template_rendered.connect(self._despues_de_render, app)
+        if not event.contains(Engine, 'before_cursor_execute', _antes_de_consulta):
+            event.listen(Engine, 'before_cursor_execute', _antes_de_consulta)
+            event.listen(Engine, 'after_cursor_execute', _despues_de_consulta)
+
+        app.extensions['metricas'] = self
+        self.app = app
+
+    def _antes(self):
+        peticion = g._metricas = _Peticion()
+        config = self.app.config
+        if config['METRICAS_PERFILADOR'] and random.random() < config['METRICAS_MUESTREO']:
+            peticion.perfil = cProfile.Profile()
+            peticion.perfil.enable()
+
+    def _despues(self, response):
+        peticion = g.pop('_metricas', None)
+        if peticion is None:
+            return response
+        duracion = time.perf_counter() - peticion.inicio
+        endpoint = request.endpoint or 'ninguno'
+
+        self.peticiones.incrementar(endpoint, request.method, str(response.status_code))
+        self.latencia.observar(duracion, endpoint, request.method)
+        self.tiempo_sql.observar(peticion.tiempo_sql, endpoint)
+        self.consultas.observar(peticion.consultas, endpoint)
+        for plantilla, tiempo in peticion.plantillas:
+            self.render.observar(tiempo, plantilla)
+
+        if peticion.consultas > self.app.config['METRICAS_UMBRAL_CONSULTAS']:
+            self.n_mas_uno.incrementar(endpoint)
+            self.app.logger.warning('Posible N+1 en %s %s: %d consultas SQL',
+                                    request.method, request.path, peticion.consultas)
+
+        if peticion.perfil is not None:
+            peticion.perfil.disable()
+            if duracion * 1000 >= self.app.config['METRICAS_LENTO_MS']:
+                self._guardar_perfil(peticion.perfil, endpoint, duracion)
+        return response
+
+    def _guardar_perfil(self, perfil, endpoint, duracion):
+        """Escribir las estadísticas de cProfile (se leen con pstats o snakeviz)"""
+        directorio = self.app.config['METRICAS_DIRECTORIO_PERFILES']
+        os.makedirs(directorio, exist_ok=True)
+        nombre = f'{endpoint}_{int(time.time() * 1000)}_{os.getpid()}_{int(duracion * 1000)}ms.prof'
+        perfil.dump_stats(os.path.join(directorio, nombre))
+        self.perfiles.incrementar(endpoint)
+
+    def _antes_de_render(self, sender, template, context, **extra):
+        peticion = g.get('_metricas')
+        if peticion is not None:
+            peticion.renders.append(time.perf_counter())
+
+    def _despues_de_render(self, sender, template, context, **extra):
+        peticion = g.get('_metricas')
+        if peticion is not None and peticion.renders:
+            # Pila: un render_template puede ejecutarse dentro de otro
+            inicio = peticion.renders.pop()
+            peticion.plantillas.append((template.name, time.perf_counter() - inicio))
+
+    def _autorizado(self):
+        token = self.app.config['METRICAS_TOKEN']
+        if token and hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                         f'Bearer {token}'.encode()):
+            return True
+        return request.remote_addr in self.app.config['METRICAS_IPS']
+
+    def exponer(self):
+        """Todas las métricas en formato de texto de Prometheus (versión 0.0.4)
+
+        Revelan rutas, volumen de tráfico y tiempos internos: sin token
+        válido solo se atienden las IPs de METRICAS_IPS (por defecto, la
+        propia máquina); el resto recibe 404, como si no existieran.
+        """
+        if not self._autorizado():
+            abort(404)
+        lineas = []
+        for metrica in self.metricas:
+            lineas.append(f'# HELP {metrica.nombre} {metrica.ayuda}')
+            lineas.append(f'# TYPE {metrica.nombre} {metrica.tipo}')
+            lineas.extend(metrica.lineas())
+        return Response('\n'.join(lineas) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+def _antes_de_consulta(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metricas_inicio', []).append(time.perf_counter())
+
+
+def _despues_de_consulta(conn, cursor, statement, parameters, context, executemany):
+    inicios = conn.info.get('metricas_inicio')
+    if not inicios:
+        return
+    inicio = inicios.pop()
+    if not has_request_context():
+        return
+    peticion = g.get('_metricas')
+    if peticion is not None:
+        peticion.consultas += 1
+        peticion.tiempo_sql += time.perf_counter() - inicio
+
+
+metricas = Metricas()
@@ -5,10 +5,18 @@ Usando SQLAlchemy ORM
 
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy.exc import IntegrityError
 from werkzeug.security import generate_password_hash, check_password_hash
+from database import SesionEnrutada
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
 from datetime import datetime
+import threading
+import time
 
-db = SQLAlchemy()
+# La sesión enruta las lecturas de las vistas @solo_lectura a la réplica (database.py)
+db = SQLAlchemy(session_options={'class_': SesionEnrutada})
 
 
 class Usuario(UserMixin, db.Model):
@@ -23,9 +31,18 @@ class Usuario(UserMixin, db.Model):
     biografia = db.Column(db.Text, nullable=True, default='')
     password_hash = db.Column(db.String(255), nullable=False)
     avatar = db.Column(db.String(255), nullable=True, default='default_avatar.png')
+    avatar_variantes = db.Column(db.String(64), nullable=True)  # anchos generados por images.py
+    avatar_placeholder = db.Column(db.Text, nullable=True)
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
     fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Contadores desnormalizados (se reconstruyen con counters.recalcular_contadores)
+    seguidores_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    seguidos_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    posts_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Cuántos de esos posts están en las tablas de archivo (archive.py)
+    posts_archivados_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     # Relaciones
     posts = db.relationship('Post', backref='usuario', lazy=True, cascade='all, delete-orphan')
     comentarios = db.relationship('Comentario', backref='usuario', lazy=True, cascade='all, delete-orphan')
@@ -60,24 +77,30 @@ class Usuario(UserMixin, db.Model):
         if not self.esta_siguiendo(otro_usuario):
             seguimiento = Seguimiento(seguidor_id=self.id, seguido_id=otro_usuario.id)
             db.session.add(seguimiento)
-            db.session.commit()
+            self.seguidos_count = Usuario.seguidos_count + 1
+            otro_usuario.seguidores_count = Usuario.seguidores_count + 1
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Otro worker ya registró el seguimiento (caché desactualizada)
+                db.session.rollback()
+            grafo.invalidar(self.id, otro_usuario.id)
     
     def dejar_de_seguir(self, otro_usuario):
         """Dejar de seguir a otro usuario"""
-        seguimiento = Seguimiento.query.filter_by(
+        eliminados = Seguimiento.query.filter_by(
             seguidor_id=self.id,
             seguido_id=otro_usuario.id
-        ).first()
-        if seguimiento:
-            db.session.delete(seguimiento)
+        ).delete(synchronize_session=False)
+        if eliminados:
+            self.seguidos_count = Usuario.seguidos_count - 1
+            otro_usuario.seguidores_count = Usuario.seguidores_count - 1
             db.session.commit()
+        grafo.invalidar(self.id, otro_usuario.id)
     
     def esta_siguiendo(self, otro_usuario):
         """Verificar si está siguiendo a otro usuario"""
-        return Seguimiento.query.filter_by(
-            seguidor_id=self.id,
-            seguido_id=otro_usuario.id
-        ).first() is not None
+        return grafo.sigue_a(self.id, otro_usuario.id)
     
     def __repr__(self):
         return f'<Usuario {self.username}>'
@@ -91,14 +114,34 @@ class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     contenido = db.Column(db.Text, nullable=False)
     imagen = db.Column(db.String(255), nullable=True)
-    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False, index=True)
+    imagen_variantes = db.Column(db.String(64), nullable=True)  # anchos generados por images.py
+    imagen_placeholder = db.Column(db.Text, nullable=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
     fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Contadores desnormalizados (se reconstruyen con counters.recalcular_contadores)
+    likes_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    comentarios_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    # Interacción con decaimiento exponencial para el feed "Destacados" (ver ranking.py)
+    puntaje = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    
     # Relaciones
     comentarios = db.relationship('Comentario', backref='post', lazy=True, cascade='all, delete-orphan')
     likes = db.relationship('Like', backref='post', lazy=True, cascade='all, delete-orphan')
     
+    # Índices para paginar por cursor los posts de un usuario (perfil y feed)
+    # y los destacados por puntaje
+    __table_args__ = (
+        db.Index('ix_post_usuario_fecha', 'usuario_id', 'fecha_creacion', 'id'),
+        db.Index('ix_post_puntaje', 'puntaje', 'id'),
+    )
+    
+    # Valores precargados por loaders.cargar_posts (evitan consultas N+1)
+    le_gusta = False
+    comentarios_recientes = ()
+    
     # Alias para compatibilidad con templates
     @property
     def autor(self):
@@ -107,11 +150,11 @@ class Post(db.Model):
     
     def cantidad_likes(self):
         """Obtener cantidad de likes"""
-        return len(self.likes)
+        return self.likes_count
     
     def cantidad_comentarios(self):
         """Obtener cantidad de comentarios"""
-        return len(self.comentarios)
+        return self.comentarios_count
     
     def __repr__(self):
         return f'<Post {self.id}>'
@@ -125,9 +168,14 @@ class Comentario(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     contenido = db.Column(db.Text, nullable=False)
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False, index=True)
-    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False, index=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Índice para los últimos comentarios de cada post y su paginación por cursor
+    __table_args__ = (
+        db.Index('ix_comentario_post_fecha', 'post_id', 'fecha_creacion', 'id'),
+    )
+    
     # Alias para compatibilidad con templates
     @property
     def autor(self):
@@ -155,6 +203,81 @@ class Like(db.Model):
         return f'<Like {self.usuario_id} - {self.post_id}>'
 
 
+class PostArchivado(db.Model):
+    """Post viejo movido fuera de la tabla `post` por archive.py (mismas columnas, sin puntaje)"""
+    
+    __tablename__ = 'post_archivo'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    contenido = db.Column(db.Text, nullable=False)
+    imagen = db.Column(db.String(255), nullable=True)
+    imagen_variantes = db.Column(db.String(64), nullable=True)
+    imagen_placeholder = db.Column(db.Text, nullable=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
+    fecha_creacion = db.Column(db.DateTime)
+    fecha_actualizacion = db.Column(db.DateTime)
+    likes_count = db.Column(db.Integer, nullable=False, default=0)
+    comentarios_count = db.Column(db.Integer, nullable=False, default=0)
+    fecha_archivado = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    usuario = db.relationship('Usuario')
+    
+    # El perfil sigue paginando por (fecha_creacion, id) al pasar de la tabla caliente al archivo
+    __table_args__ = (
+        db.Index('ix_post_archivo_usuario_fecha', 'usuario_id', 'fecha_creacion', 'id'),
+    )
+    
+    le_gusta = False
+    comentarios_recientes = ()
+    
+    @property
+    def autor(self):
+        """Alias para usuario (compatibilidad con templates)"""
+        return self.usuario
+    
+    def cantidad_likes(self):
+        return self.likes_count
+    
+    def cantidad_comentarios(self):
+        return self.comentarios_count
+    
+    def __repr__(self):
+        return f'<PostArchivado {self.id}>'
+
+
+class ComentarioArchivado(db.Model):
+    """Comentario de un post archivado"""
+    
+    __tablename__ = 'comentario_archivo'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    contenido = db.Column(db.Text, nullable=False)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False, index=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('post_archivo.id'), nullable=False)
+    fecha_creacion = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_comentario_archivo_post_fecha', 'post_id', 'fecha_creacion', 'id'),
+    )
+    
+    def __repr__(self):
+        return f'<ComentarioArchivado {self.id}>'
+
+
+class LikeArchivado(db.Model):
+    """Like de un post archivado"""
+    
+    __tablename__ = 'like_archivo'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False, index=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('post_archivo.id'), nullable=False, index=True)
+    fecha_creacion = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<LikeArchivado {self.usuario_id} - {self.post_id}>'
+
+
 class Seguimiento(db.Model):
     """Modelo para relación de seguimiento entre usuarios"""
     
@@ -170,3 +293,187 @@ class Seguimiento(db.Model):
     
     def __repr__(self):
         return f'<Seguimiento {self.seguidor_id} -> {self.seguido_id}>'
+
+
+class EntradaTimeline(db.Model):
+    """Modelo para el timeline materializado de cada usuario (fan-out en escritura)"""
+    
+    __tablename__ = 'timeline'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
+    autor_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
+    fecha_creacion = db.Column(db.DateTime, nullable=False)
+    
+    # El feed se lee en orden (fecha_creacion, post_id) descendente por usuario
+    __table_args__ = (
+        db.UniqueConstraint('usuario_id', 'post_id', name='unique_timeline'),
+        db.Index('ix_timeline_usuario_fecha', 'usuario_id', 'fecha_creacion', 'post_id'),
+        db.Index('ix_timeline_usuario_autor', 'usuario_id', 'autor_id'),
+    )
+    
+    def __repr__(self):
+        return f'<EntradaTimeline {self.usuario_id} <- {self.post_id}>'
+
+
+class Recomendacion(db.Model):
+    """Modelo para sugerencias "personas que quizás conozcas" precalculadas"""
+    
+    __tablename__ = 'recomendacion'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
+    candidato_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
+    mutuos = db.Column(db.Integer, nullable=False)
+    puntaje = db.Column(db.Float, nullable=False)
+    fecha_calculo = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    candidato = db.relationship('Usuario', foreign_keys=[candidato_id])
+    
+    # El sidebar lee el top-K de un usuario con un único recorrido de este índice
+    __table_args__ = (
+        db.UniqueConstraint('usuario_id', 'candidato_id', name='unique_recomendacion'),
+        db.Index('ix_recomendacion_usuario_puntaje', 'usuario_id', 'puntaje'),
+    )
+    
+    def __repr__(self):
+        return f'<Recomendacion {self.usuario_id} -> {self.candidato_id}>'
+
+
+class Evento(db.Model):
+    """Eventos en tiempo real publicados por el backend SQL del bus (events.py)"""
+    
+    __tablename__ = 'evento'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(20), nullable=False)
+    datos = db.Column(db.Text, nullable=False)  # JSON
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<Evento {self.id} {self.tipo}>'
+
+
+class EstadoRanking(db.Model):
+    """Momento al que están referidos los puntajes de los posts (una sola fila)"""
+    
+    __tablename__ = 'ranking'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    referencia = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<EstadoRanking {self.referencia}>'
+
+
+class Trabajo(db.Model):
+    """Trabajos en segundo plano de la cola de jobs.py"""
+    
+    __tablename__ = 'trabajo'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    argumentos = db.Column(db.Text, nullable=False)  # JSON
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), index=True)
+    estado = db.Column(db.String(20), nullable=False, default='pendiente')
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    max_intentos = db.Column(db.Integer, nullable=False, default=5)
+    disponible_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    tomado_por = db.Column(db.String(100))
+    tomado_en = db.Column(db.DateTime)
+    error = db.Column(db.Text)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Los trabajadores buscan el próximo pendiente ya disponible; las tareas periódicas, su última vez
+    __table_args__ = (
+        db.Index('ix_trabajo_estado_disponible', 'estado', 'disponible_en', 'id'),
+        db.Index('ix_trabajo_tipo_fecha', 'tipo', 'fecha_creacion'),
+    )
+    
+    def __repr__(self):
+        return f'<Trabajo {self.id} {self.tipo} {self.estado}>'
+
+
+class GrafoSeguimiento:
+    """Caché en memoria del grafo de seguimiento
+    
+    Guarda, por usuario, los ids de seguidos y seguidores como arrays de
+    enteros ordenados (4 bytes por id) y responde con búsqueda binaria.
+    Es un LRU acotado con TTL: las escrituras de este proceso invalidan al
+    instante y las de otros workers se ven a lo sumo `ttl` segundos tarde.
+    """
+    
+    def __init__(self, maximo=20000, ttl=60):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _cargar(self, clave):
+        tipo, usuario_id = clave
+        if tipo == 'seguidos':
+            columna, filtro = Seguimiento.seguido_id, Seguimiento.seguidor_id == usuario_id
+        else:
+            columna, filtro = Seguimiento.seguidor_id, Seguimiento.seguido_id == usuario_id
+        ids = db.session.query(columna).filter(filtro).order_by(columna)
+        return array('i', (valor for valor, in ids))
+    
+    def _obtener(self, tipo, usuario_id):
+        clave = (tipo, usuario_id)
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[0] > ahora:
+                self._entradas.move_to_end(clave)
+                return entrada[1]
+        
+        ids = self._cargar(clave)
+        with self._lock:
+            self._entradas[clave] = (ahora + self.ttl, ids)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.maximo:
+                self._entradas.popitem(last=False)
+        return ids
+    
+    @staticmethod
+    def _contiene(ids, valor):
+        posicion = bisect_left(ids, valor)
+        return posicion < len(ids) and ids[posicion] == valor
+    
+    def seguidos(self, usuario_id):
+        """Ids (ordenados) de los usuarios que sigue `usuario_id`"""
+        return self._obtener('seguidos', usuario_id)
+    
+    def seguidores(self, usuario_id):
+        """Ids (ordenados) de los seguidores de `usuario_id`"""
+        return self._obtener('seguidores', usuario_id)
+    
+    def sigue_a(self, seguidor_id, seguido_id):
+        """Verificar si `seguidor_id` sigue a `seguido_id`"""
+        return self._contiene(self.seguidos(seguidor_id), seguido_id)
+    
+    def cuales_sigue(self, usuario_id, candidatos):
+        """Subconjunto de `candidatos` que sigue `usuario_id`, sin consultas por fila"""
+        seguidos = self.seguidos(usuario_id)
+        return {candidato for candidato in candidatos if self._contiene(seguidos, candidato)}
+    
+    def mutuos(self, usuario_id, otro_id):
+        """Verificar si ambos usuarios se siguen mutuamente"""
+        return self.sigue_a(usuario_id, otro_id) and self.sigue_a(otro_id, usuario_id)
+    
+    def invalidar(self, *usuario_ids):
+        """Descartar las entradas de los usuarios cuyo grafo cambió"""
+        with self._lock:
+            for usuario_id in usuario_ids:
+                self._entradas.pop(('seguidos', usuario_id), None)
+                self._entradas.pop(('seguidores', usuario_id), None)
+    
+    def limpiar(self):
+        """Vaciar la caché completa"""
+        with self._lock:
+            self._entradas.clear()
+
+
+grafo = GrafoSeguimiento()
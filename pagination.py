@@ -0,0 +1,24 @@
+"""
+Paginación por cursor (keyset) sobre (fecha_creacion, id)
+A diferencia de OFFSET, cada página cuesta lo mismo sin importar qué tan atrás esté
+"""
+
+from datetime import datetime
+from models import Post
+
+
+def codificar_cursor(fecha, post_id):
+    """Cursor opaco que apunta a la posición (fecha_creacion, id) de un post"""
+    return f'{fecha.isoformat()}_{post_id}'
+
+
+def decodificar_cursor(cursor):
+    """Convertir un cursor en (fecha, id); lanza ValueError si es inválido"""
+    fecha, post_id = cursor.rsplit('_', 1)
+    return datetime.fromisoformat(fecha), int(post_id)
+
+
+def anteriores_a(cursor, columna_fecha=Post.fecha_creacion, columna_id=Post.id):
+    """Filtro keyset: filas estrictamente más viejas que el cursor en (fecha, id)"""
+    fecha, post_id = cursor
+    return (columna_fecha < fecha) | ((columna_fecha == fecha) & (columna_id < post_id))
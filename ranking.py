@@ -0,0 +1,222 @@
+"""
+Puntaje de interacción con decaimiento para los feeds "Destacados" y "Tendencias"
+Cada post guarda su interacción ponderada (publicación, likes, comentarios)
+referida a un mismo momento: los likes y comentarios suman al instante y un
+trabajo periódico multiplica todos los puntajes activos por e^(-Δt/τ), así
+el orden sale del índice (puntaje, id) sin calcular nada al leer
+"""
+
+import math
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam
+from models import db, Post, Like, Comentario, Seguimiento, EstadoRanking
+from jobs import trabajos
+
+# Las actualizaciones con varios juegos de parámetros van sobre la tabla (executemany de Core)
+_POSTS = Post.__table__
+
+
+class Ranking:
+    """Extensión de Flask que mantiene la columna `puntaje` de los posts
+
+    Los puntajes por debajo de RANKING_MINIMO pasan a 0: dejan de decaer y
+    quedan fuera del rango que recorren las consultas (puntaje > 0).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RANKING_VIDA_MEDIA_HORAS', 12)
+        app.config.setdefault('RANKING_PESO_POST', 2.0)
+        app.config.setdefault('RANKING_PESO_LIKE', 1.0)
+        app.config.setdefault('RANKING_PESO_COMENTARIO', 3.0)
+        app.config.setdefault('RANKING_MINIMO', 0.05)
+        # Intervalos (segundos) de las tareas periódicas de la cola; None para programarlas aparte
+        app.config.setdefault('RANKING_DECAER_CADA', 600)
+        app.config.setdefault('RANKING_RECALCULAR_CADA', 24 * 3600)
+        app.extensions['ranking'] = self
+        self.app = app
+
+    @property
+    def tau(self):
+        """Constante de tiempo del decaimiento en segundos"""
+        return self.app.config['RANKING_VIDA_MEDIA_HORAS'] * 3600 / math.log(2)
+
+    def _factor(self, desde, hasta):
+        return math.exp(-(hasta - desde).total_seconds() / self.tau)
+
+    def referencia(self):
+        """Momento al que están referidos los puntajes (el último decaimiento)"""
+        estado = db.session.get(EstadoRanking, 1)
+        return estado.referencia if estado is not None else None
+
+    # --- Escritura (incremental) -------------------------------------------
+
+    def puntaje_inicial(self):
+        return self.app.config['RANKING_PESO_POST']
+
+    def sumar(self, post_id, peso):
+        """Sumar `peso` al puntaje de un post (en la transacción actual, sin leerlo)
+
+        Entre dos decaimientos el peso se suma sin ajustar: el error es a lo
+        sumo e^(intervalo/τ), un 1% con un decaimiento cada 10 minutos.
+        """
+        self.sumar_lote({post_id: peso})
+
+    def sumar_lote(self, pesos):
+        """Sumar a varios posts a la vez: {post_id: peso}; nunca baja de 0"""
+        pesos = {post_id: peso for post_id, peso in pesos.items() if peso}
+        if not pesos:
+            return
+        nuevo = _POSTS.c.puntaje + bindparam('peso')
+        db.session.execute(
+            db.update(_POSTS).where(_POSTS.c.id == bindparam('id_post'))
+                             .values(puntaje=db.case((nuevo > 0, nuevo), else_=0),
+                                     fecha_actualizacion=_POSTS.c.fecha_actualizacion),
+            [{'id_post': post_id, 'peso': peso} for post_id, peso in pesos.items()]
+        )
+
+    def al_dar_like(self, post_id):
+        self.sumar(post_id, self.app.config['RANKING_PESO_LIKE'])
+
+    def al_quitar_like(self, post_id, fecha_like):
+        """Restar lo que aporta todavía un like dado en `fecha_like`"""
+        referencia = self.referencia() or datetime.utcnow()
+        aporte = self.app.config['RANKING_PESO_LIKE'] * min(1.0, self._factor(fecha_like, referencia))
+        self.sumar(post_id, -aporte)
+
+    def al_comentar(self, post_id):
+        self.sumar(post_id, self.app.config['RANKING_PESO_COMENTARIO'])
+
+    # --- Mantenimiento periódico -------------------------------------------
+
+    def decaer(self):
+        """Llevar todos los puntajes activos al momento actual; devuelve (activos, enfriados)
+
+        Es un UPDATE masivo sobre los posts con puntaje > 0 (los recientes o
+        con interacción reciente); los que quedan bajo RANKING_MINIMO se
+        pasan a 0 y no vuelven a tocarse hasta que alguien interactúe.
+        """
+        ahora = datetime.utcnow()
+        estado = db.session.get(EstadoRanking, 1, with_for_update=True)
+        if estado is None:
+            estado = EstadoRanking(id=1, referencia=ahora)
+            db.session.add(estado)
+        factor = self._factor(estado.referencia, ahora)
+
+        activos = db.session.execute(
+            db.update(Post).where(Post.puntaje > 0)
+                           .values(puntaje=Post.puntaje * factor, fecha_actualizacion=Post.fecha_actualizacion)
+                           .execution_options(synchronize_session=False)
+        ).rowcount
+        enfriados = db.session.execute(
+            db.update(Post).where(Post.puntaje > 0, Post.puntaje < self.app.config['RANKING_MINIMO'])
+                           .values(puntaje=0, fecha_actualizacion=Post.fecha_actualizacion)
+                           .execution_options(synchronize_session=False)
+        ).rowcount
+        estado.referencia = ahora
+        db.session.commit()
+        return activos, enfriados
+
+    def recalcular(self, lote=5000):
+        """Recalcular todos los puntajes desde los posts, likes y comentarios
+
+        Solo cuentan los eventos dentro del horizonte en el que un aporte
+        todavía supera RANKING_MINIMO; el resto de los posts queda en 0.
+        """
+        config = self.app.config
+        ahora = datetime.utcnow()
+        maximo = max(config['RANKING_PESO_POST'], config['RANKING_PESO_LIKE'], config['RANKING_PESO_COMENTARIO'])
+        desde = ahora - timedelta(seconds=self.tau * math.log(maximo / config['RANKING_MINIMO']))
+
+        puntajes = {}
+        eventos = (
+            (db.select(Post.id, Post.fecha_creacion), Post.fecha_creacion, config['RANKING_PESO_POST']),
+            (db.select(Like.post_id, Like.fecha_creacion), Like.fecha_creacion, config['RANKING_PESO_LIKE']),
+            (db.select(Comentario.post_id, Comentario.fecha_creacion), Comentario.fecha_creacion,
+             config['RANKING_PESO_COMENTARIO']),
+        )
+        for consulta, columna_fecha, peso in eventos:
+            filas = db.session.execute(consulta.where(columna_fecha >= desde)
+                                               .execution_options(yield_per=lote))
+            for post_id, fecha in filas:
+                puntajes[post_id] = puntajes.get(post_id, 0) + peso * self._factor(fecha, ahora)
+
+        db.session.execute(db.update(Post).where(Post.puntaje != 0)
+                                          .values(puntaje=0, fecha_actualizacion=Post.fecha_actualizacion)
+                                          .execution_options(synchronize_session=False))
+        filas = [{'id_post': post_id, 'valor': puntaje}
+                 for post_id, puntaje in puntajes.items() if puntaje >= config['RANKING_MINIMO']]
+        for inicio in range(0, len(filas), lote):
+            db.session.execute(
+                db.update(_POSTS).where(_POSTS.c.id == bindparam('id_post'))
+                                 .values(puntaje=bindparam('valor'), fecha_actualizacion=_POSTS.c.fecha_actualizacion),
+                filas[inicio:inicio + lote]
+            )
+
+        estado = db.session.get(EstadoRanking, 1)
+        if estado is None:
+            db.session.add(EstadoRanking(id=1, referencia=ahora))
+        else:
+            estado.referencia = ahora
+        db.session.commit()
+        return len(filas)
+
+    # --- Lectura -------------------------------------------------------------
+
+    def codificar_cursor(self, post):
+        """Cursor (puntaje, id) junto con la referencia de los puntajes"""
+        referencia = self.referencia() or datetime.utcnow()
+        return f'{post.puntaje!r}_{referencia.isoformat()}_{post.id}'
+
+    def decodificar_cursor(self, cursor):
+        """Convertir un cursor en (puntaje, id); lanza ValueError si es inválido
+
+        Si hubo un decaimiento desde que se generó, el puntaje del cursor se
+        decae igual que los de la tabla y la página siguiente sigue valiendo.
+        El decaído en Python y el de la tabla (uno o varios UPDATE) pueden
+        diferir en el último bit, y entonces la igualdad del desempate por id
+        no se cumple y se saltean o repiten posts: si el post del cursor
+        conserva ese puntaje se usa el valor exacto guardado.
+        """
+        puntaje, referencia, post_id = cursor.split('_')
+        puntaje, referencia, post_id = float(puntaje), datetime.fromisoformat(referencia), int(post_id)
+        actual = self.referencia()
+        if actual is not None and actual > referencia:
+            puntaje *= self._factor(referencia, actual)
+            guardado = db.session.query(Post.puntaje).filter(Post.id == post_id).scalar()
+            if guardado is not None and math.isclose(guardado, puntaje, rel_tol=1e-9):
+                puntaje = guardado
+        return puntaje, post_id
+
+    def consulta(self, usuario_id=None, cursor=None):
+        """Posts activos del más destacado al menos (del feed de `usuario_id` o de todos)
+
+        Recorre el índice (puntaje, id) de mayor a menor y se detiene al
+        juntar la página; los posts que no tienen puntaje no se leen.
+        """
+        query = Post.query.filter(Post.puntaje > 0)
+        if usuario_id is not None:
+            seguidos = db.select(Seguimiento.seguido_id).where(Seguimiento.seguidor_id == usuario_id)
+            query = query.filter((Post.usuario_id == usuario_id) | Post.usuario_id.in_(seguidos))
+        if cursor is not None:
+            puntaje, post_id = cursor
+            query = query.filter((Post.puntaje < puntaje) | ((Post.puntaje == puntaje) & (Post.id < post_id)))
+        return query.order_by(Post.puntaje.desc(), Post.id.desc())
+
+
+ranking = Ranking()
+
+
+@trabajos.periodica('ranking.decaer', 'RANKING_DECAER_CADA')
+def _tarea_decaer():
+    ranking.decaer()
+
+
+@trabajos.periodica('ranking.recalcular', 'RANKING_RECALCULAR_CADA')
+def _tarea_recalcular():
+    # Corrige la deriva de las sumas entre decaimientos
+    ranking.recalcular()
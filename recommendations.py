@@ -0,0 +1,99 @@
+"""
+Sugerencias "personas que quizás conozcas" a partir del grafo de seguimiento
+Se calculan por lotes (amigos de amigos con un único JOIN agregado por lote)
+y se guardan en la tabla `recomendacion`; el feed solo lee el top-K
+"""
+
+import heapq
+import math
+from datetime import datetime, timedelta
+from sqlalchemy.orm import aliased, joinedload
+from models import db, Usuario, Post, Seguimiento, Recomendacion, grafo
+
+# Sugerencias que se guardan por usuario
+TOP_K = 10
+
+# Ventana de actividad reciente que suma puntaje a un candidato
+DIAS_ACTIVIDAD = 14
+
+
+def _actividad_reciente(dias):
+    """Posts publicados en los últimos `dias` por cada autor activo"""
+    desde = datetime.utcnow() - timedelta(days=dias)
+    filas = db.session.query(Post.usuario_id, db.func.count(Post.id))\
+                      .filter(Post.fecha_creacion >= desde)\
+                      .group_by(Post.usuario_id)
+    return dict(filas.all())
+
+
+def _amigos_de_amigos(desde_id, hasta_id):
+    """(usuario, candidato, mutuos) para los usuarios con id en [desde_id, hasta_id)
+
+    `mutuos` es la cantidad de cuentas seguidas por el usuario que a su vez
+    siguen al candidato. Excluye al propio usuario y a quienes ya sigue.
+    """
+    primero = aliased(Seguimiento)
+    segundo = aliased(Seguimiento)
+    existente = aliased(Seguimiento)
+    ya_sigue = db.session.query(existente.id)\
+                         .filter(existente.seguidor_id == primero.seguidor_id,
+                                 existente.seguido_id == segundo.seguido_id)\
+                         .exists()
+    return db.session.query(primero.seguidor_id, segundo.seguido_id, db.func.count())\
+                     .join(segundo, segundo.seguidor_id == primero.seguido_id)\
+                     .filter(primero.seguidor_id >= desde_id,
+                             primero.seguidor_id < hasta_id,
+                             segundo.seguido_id != primero.seguidor_id,
+                             ~ya_sigue)\
+                     .group_by(primero.seguidor_id, segundo.seguido_id)\
+                     .all()
+
+
+def calcular_recomendaciones(top_k=TOP_K, lote=1000, dias=DIAS_ACTIVIDAD):
+    """Recalcular las sugerencias de todos los usuarios, un lote de ids a la vez
+
+    El puntaje es la cantidad de conexiones en común, potenciada por la
+    actividad reciente del candidato. Devuelve cuántas sugerencias se guardaron.
+    """
+    actividad = _actividad_reciente(dias)
+    maximo_id = db.session.query(db.func.max(Usuario.id)).scalar() or 0
+    ahora = datetime.utcnow()
+    total = 0
+
+    for desde_id in range(1, maximo_id + 1, lote):
+        hasta_id = desde_id + lote
+        candidatos = {}
+        for usuario_id, candidato_id, mutuos in _amigos_de_amigos(desde_id, hasta_id):
+            puntaje = mutuos * (1 + 0.5 * math.log1p(actividad.get(candidato_id, 0)))
+            candidatos.setdefault(usuario_id, []).append((puntaje, mutuos, candidato_id))
+
+        filas = [
+            {'usuario_id': usuario_id, 'candidato_id': candidato_id, 'mutuos': mutuos,
+             'puntaje': puntaje, 'fecha_calculo': ahora}
+            for usuario_id, opciones in candidatos.items()
+            for puntaje, mutuos, candidato_id in heapq.nlargest(top_k, opciones)
+        ]
+
+        Recomendacion.query.filter(Recomendacion.usuario_id >= desde_id,
+                                   Recomendacion.usuario_id < hasta_id)\
+                           .delete(synchronize_session=False)
+        if filas:
+            db.session.execute(db.insert(Recomendacion), filas)
+        db.session.commit()
+        total += len(filas)
+
+    return total
+
+
+def sugerencias(usuario, limite=5):
+    """Top de sugerencias precalculadas para `usuario` (una consulta indexada)
+
+    Descarta en memoria a quienes el usuario empezó a seguir después del
+    último cálculo.
+    """
+    recomendaciones = Recomendacion.query.options(joinedload(Recomendacion.candidato))\
+                                         .filter(Recomendacion.usuario_id == usuario.id)\
+                                         .order_by(Recomendacion.puntaje.desc())\
+                                         .limit(limite * 2).all()
+    seguidos = grafo.cuales_sigue(usuario.id, [r.candidato_id for r in recomendaciones])
+    return [r for r in recomendaciones if r.candidato_id not in seguidos][:limite]
@@ -0,0 +1,46 @@
+"""
+Actualización del esquema de bases ya existentes
+db.create_all crea las tablas que faltan pero no toca las que ya están: aquí
+se les agregan las columnas e índices nuevos de los modelos (ALTER TABLE ...
+ADD COLUMN, CREATE INDEX). Nunca borra ni modifica columnas existentes, así
+que se puede ejecutar en cada deploy
+"""
+
+from sqlalchemy.schema import CreateColumn
+from models import db
+
+
+def _agregar_columna(conexion, tabla, columna):
+    # CreateColumn da "nombre TIPO DEFAULT ... NOT NULL" en el dialecto de la base;
+    # las columnas NOT NULL nuevas tienen server_default para las filas existentes
+    definicion = CreateColumn(columna).compile(dialect=conexion.dialect)
+    nombre = conexion.dialect.identifier_preparer.format_table(tabla)
+    conexion.exec_driver_sql(f'ALTER TABLE {nombre} ADD COLUMN {definicion}')
+
+
+def actualizar_esquema():
+    """Crear las tablas que faltan y completar las existentes
+
+    Devuelve el conjunto de columnas agregadas ('tabla.columna'), para que
+    quien llama pueda rellenarlas (por ejemplo, recalcular los contadores).
+    """
+    existentes = set(db.inspect(db.engine).get_table_names())
+    # Solo el primario: la réplica de lectura (SQLALCHEMY_REPLICA_URI) recibe el esquema por replicación
+    db.create_all(bind_key=None)
+
+    agregadas = set()
+    with db.engine.begin() as conexion:
+        inspector = db.inspect(conexion)
+        for tabla in db.metadata.sorted_tables:
+            if tabla.name not in existentes:
+                continue
+            columnas = {columna['name'] for columna in inspector.get_columns(tabla.name)}
+            for columna in tabla.columns:
+                if columna.name not in columnas:
+                    _agregar_columna(conexion, tabla, columna)
+                    agregadas.add(f'{tabla.name}.{columna.name}')
+            indices = {indice['name'] for indice in inspector.get_indexes(tabla.name)}
+            for indice in tabla.indexes:
+                if indice.name not in indices:
+                    indice.create(conexion)
+    return agregadas
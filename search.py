@@ -0,0 +1,173 @@
+"""
+Búsqueda de usuarios con índice de texto completo
+SQLite usa una tabla virtual FTS5 y Postgres tsvector + trigramas; ambos
+indexan texto normalizado (minúsculas, sin acentos) y buscan por prefijo
+"""
+
+import math
+import re
+import unicodedata
+from models import db, Usuario
+
+# Peso de la cantidad de seguidores frente a la relevancia textual
+PESO_SEGUIDORES = 0.1
+
+# Candidatos que se piden al índice antes de reordenar por seguidores
+CANDIDATOS = 100
+
+_DDL_SQLITE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS usuario_busqueda USING fts5("
+    "username, nombre, biografia, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+]
+
+_DDL_POSTGRES = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE TABLE IF NOT EXISTS usuario_busqueda ("
+    "usuario_id INTEGER PRIMARY KEY REFERENCES usuario(id) ON DELETE CASCADE, "
+    "username TEXT NOT NULL, nombre TEXT NOT NULL, biografia TEXT NOT NULL, "
+    "vector TSVECTOR GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', username), 'A') || "
+    "setweight(to_tsvector('simple', nombre), 'B') || "
+    "setweight(to_tsvector('simple', biografia), 'C')) STORED)",
+    "CREATE INDEX IF NOT EXISTS ix_usuario_busqueda_vector ON usuario_busqueda USING gin (vector)",
+    "CREATE INDEX IF NOT EXISTS ix_usuario_busqueda_trgm ON usuario_busqueda "
+    "USING gin ((username || ' ' || nombre) gin_trgm_ops)",
+]
+
+
+def normalizar(texto):
+    """Pasar a minúsculas y quitar acentos: 'José Núñez' -> 'jose nunez'"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def terminos(consulta):
+    """Palabras de la consulta ya normalizadas (sin operadores ni comillas)"""
+    return re.findall(r'\w+', normalizar(consulta))
+
+
+class _SQLiteIndice:
+    """Índice FTS5: rowid de la tabla virtual = id del usuario"""
+
+    def indexar(self, usuario):
+        db.session.execute(db.text('DELETE FROM usuario_busqueda WHERE rowid = :id'), {'id': usuario.id})
+        db.session.execute(
+            db.text('INSERT INTO usuario_busqueda (rowid, username, nombre, biografia) '
+                    'VALUES (:id, :username, :nombre, :biografia)'),
+            _documento(usuario)
+        )
+
+    def vaciar(self):
+        db.session.execute(db.text('DELETE FROM usuario_busqueda'))
+
+    def candidatos(self, palabras, limite):
+        # Todas las palabras deben aparecer; la última puede estar incompleta
+        consulta = ' '.join(f'"{palabra}"*' for palabra in palabras)
+        filas = db.session.execute(
+            db.text('SELECT rowid, bm25(usuario_busqueda, 10.0, 5.0, 1.0) AS rango '
+                    'FROM usuario_busqueda WHERE usuario_busqueda MATCH :consulta '
+                    'ORDER BY rango LIMIT :limite'),
+            {'consulta': consulta, 'limite': limite}
+        )
+        return [(usuario_id, -rango) for usuario_id, rango in filas]
+
+
+class _PostgresIndice:
+    """Índice tsvector con prefijos y trigramas para tolerar errores de tipeo"""
+
+    def indexar(self, usuario):
+        db.session.execute(
+            db.text('INSERT INTO usuario_busqueda (usuario_id, username, nombre, biografia) '
+                    'VALUES (:id, :username, :nombre, :biografia) '
+                    'ON CONFLICT (usuario_id) DO UPDATE SET username = EXCLUDED.username, '
+                    'nombre = EXCLUDED.nombre, biografia = EXCLUDED.biografia'),
+            _documento(usuario)
+        )
+
+    def vaciar(self):
+        db.session.execute(db.text('DELETE FROM usuario_busqueda'))
+
+    def candidatos(self, palabras, limite):
+        filas = db.session.execute(
+            db.text("SELECT usuario_id, ts_rank(vector, consulta) + similarity(username || ' ' || nombre, :texto) AS rango "
+                    "FROM usuario_busqueda, to_tsquery('simple', :consulta) consulta "
+                    "WHERE vector @@ consulta OR (username || ' ' || nombre) % :texto "
+                    "ORDER BY rango DESC LIMIT :limite"),
+            {'consulta': ' & '.join(f'{palabra}:*' for palabra in palabras),
+             'texto': ' '.join(palabras),
+             'limite': limite}
+        )
+        return list(filas)
+
+
+def _documento(usuario):
+    return {
+        'id': usuario.id,
+        'username': normalizar(usuario.username),
+        'nombre': normalizar(usuario.nombre),
+        'biografia': normalizar(usuario.biografia),
+    }
+
+
+class Buscador:
+    """Extensión de Flask para buscar usuarios por username, nombre y biografía"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['buscador'] = self
+
+    def _indice(self):
+        if db.engine.dialect.name == 'postgresql':
+            return _PostgresIndice()
+        return _SQLiteIndice()
+
+    def crear_indice(self):
+        """Crear la tabla del índice si falta (también en bases que ya tenían usuarios)
+
+        Devuelve True si la creó: en ese caso hay que reindexar.
+        """
+        existia = db.inspect(db.engine).has_table('usuario_busqueda')
+        sentencias = _DDL_POSTGRES if db.engine.dialect.name == 'postgresql' else _DDL_SQLITE
+        with db.engine.begin() as conexion:
+            for sentencia in sentencias:
+                conexion.exec_driver_sql(sentencia)
+        return not existia
+
+    def indexar(self, usuario):
+        """Actualizar la entrada del usuario (en la misma transacción que el cambio)"""
+        self._indice().indexar(usuario)
+
+    def buscar(self, consulta, limite=20):
+        """Usuarios que coinciden con la consulta, por relevancia y seguidores"""
+        palabras = terminos(consulta)
+        if not palabras:
+            return []
+
+        relevancia = dict(self._indice().candidatos(palabras, CANDIDATOS))
+        if not relevancia:
+            return []
+
+        usuarios = Usuario.query.filter(Usuario.id.in_(relevancia)).all()
+        usuarios.sort(
+            key=lambda usuario: relevancia[usuario.id] * (1 + PESO_SEGUIDORES * math.log1p(usuario.seguidores_count)),
+            reverse=True
+        )
+        return usuarios[:limite]
+
+    def reindexar(self, lote=500):
+        """Reconstruir el índice completo a partir de la tabla de usuarios"""
+        self.crear_indice()
+        indice = self._indice()
+        indice.vaciar()
+        total = 0
+        for usuario in Usuario.query.order_by(Usuario.id).yield_per(lote):
+            indice.indexar(usuario)
+            total += 1
+        db.session.commit()
+        return total
+
+
+buscador = Buscador()
@@ -0,0 +1,121 @@
+"""
+Generador reproducible de datos sintéticos para pruebas de rendimiento
+Inserta usuarios, posts, comentarios, likes y seguimientos en bloque, con
+una distribución de seguidores tipo ley de potencias (como una red real)
+"""
+
+import itertools
+import random
+from datetime import datetime, timedelta
+from werkzeug.security import generate_password_hash
+from models import db, Usuario, Post, Comentario, Like, Seguimiento
+
+# Contraseña de todos los usuarios sintéticos (usuario0001 / password123)
+PASSWORD = 'password123'
+
+# Filas por sentencia INSERT
+TAMANO_LOTE = 10000
+
+PALABRAS = ('hola', 'hoy', 'café', 'playa', 'foto', 'música', 'viaje', 'amigos', 'trabajo',
+            'feliz', 'ciudad', 'noche', 'libro', 'partido', 'comida', 'lluvia', 'sol', 'fin de semana')
+
+
+def _texto(rng, minimo, maximo):
+    return ' '.join(rng.choice(PALABRAS) for _ in range(rng.randint(minimo, maximo)))
+
+
+def _insertar(modelo, filas):
+    """Insertar filas (dicts) en bloques con executemany"""
+    filas = iter(filas)
+    total = 0
+    while True:
+        lote = list(itertools.islice(filas, TAMANO_LOTE))
+        if not lote:
+            return total
+        db.session.execute(db.insert(modelo), lote)
+        total += len(lote)
+
+
+def _pares_unicos(rng, cantidad, origenes, destinos, pesos, excluir_iguales=False):
+    """Pares (origen, destino) sin repetir; el destino se elige según `pesos`"""
+    acumulados = list(itertools.accumulate(pesos))
+    maximo = len(origenes) * len(destinos)
+    cantidad = min(cantidad, maximo - (len(origenes) if excluir_iguales else 0))
+    pares = set()
+    while len(pares) < cantidad:
+        faltan = cantidad - len(pares)
+        elegidos = rng.choices(destinos, cum_weights=acumulados, k=faltan)
+        for destino in elegidos:
+            origen = rng.choice(origenes)
+            if excluir_iguales and origen == destino:
+                continue
+            pares.add((origen, destino))
+    return pares
+
+
+def sembrar(usuarios=1000, posts=10000, comentarios=20000, likes=50000, seguimientos=20000,
+            semilla=42, dias=90, alfa=1.1):
+    """Poblar la base de datos y devolver cuántas filas se insertaron por tabla
+
+    Los seguidores y los likes siguen una ley de potencias con exponente
+    `alfa`: pocas cuentas y posts concentran la mayoría de la actividad.
+    Con la misma `semilla` se generan exactamente los mismos datos.
+    """
+    rng = random.Random(semilla)
+    ahora = datetime.utcnow()
+    password_hash = generate_password_hash(PASSWORD)
+    inicio_id = (db.session.query(db.func.max(Usuario.id)).scalar() or 0) + 1
+
+    def fecha():
+        return ahora - timedelta(seconds=rng.randint(0, dias * 86400))
+
+    _insertar(Usuario, (
+        {'id': inicio_id + i, 'username': f'usuario{inicio_id + i:04d}',
+         'email': f'usuario{inicio_id + i:04d}@example.com',
+         'nombre': f'Usuario {inicio_id + i}', 'biografia': _texto(rng, 3, 12),
+         'password_hash': password_hash, 'fecha_creacion': fecha()}
+        for i in range(usuarios)
+    ))
+    usuario_ids = list(range(inicio_id, inicio_id + usuarios))
+    # Ley de potencias: el usuario en la posición k recibe peso 1 / k^alfa
+    popularidad = [1 / (rango ** alfa) for rango in range(1, usuarios + 1)]
+
+    inicio_post = (db.session.query(db.func.max(Post.id)).scalar() or 0) + 1
+    autores = rng.choices(usuario_ids, weights=popularidad, k=posts)
+    _insertar(Post, (
+        {'id': inicio_post + i, 'contenido': _texto(rng, 5, 40), 'usuario_id': autor,
+         'fecha_creacion': fecha()}
+        for i, autor in enumerate(autores)
+    ))
+    post_ids = list(range(inicio_post, inicio_post + posts))
+    popularidad_posts = [1 / (rango ** alfa) for rango in range(1, posts + 1)]
+    rng.shuffle(popularidad_posts)
+
+    comentados = rng.choices(post_ids, weights=popularidad_posts, k=comentarios) if post_ids else []
+    _insertar(Comentario, (
+        {'contenido': _texto(rng, 2, 15), 'usuario_id': rng.choice(usuario_ids), 'post_id': post_id,
+         'fecha_creacion': fecha()}
+        for post_id in comentados
+    ))
+
+    pares_likes = _pares_unicos(rng, likes, usuario_ids, post_ids, popularidad_posts) if post_ids else set()
+    _insertar(Like, (
+        {'usuario_id': usuario_id, 'post_id': post_id, 'fecha_creacion': fecha()}
+        for usuario_id, post_id in pares_likes
+    ))
+
+    pares_seguimiento = _pares_unicos(rng, seguimientos, usuario_ids, usuario_ids, popularidad,
+                                      excluir_iguales=True)
+    _insertar(Seguimiento, (
+        {'seguidor_id': seguidor, 'seguido_id': seguido, 'fecha_creacion': fecha()}
+        for seguidor, seguido in pares_seguimiento
+    ))
+
+    db.session.commit()
+    return {
+        'usuarios': usuarios,
+        'posts': posts,
+        'comentarios': len(comentados),
+        'likes': len(pares_likes),
+        'seguimientos': len(pares_seguimiento),
+    }
@@ -59,6 +59,36 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    // Scroll infinito: cargar la siguiente página cuando el sentinel entra en pantalla
+    document.querySelectorAll('.scroll-sentinel').forEach(sentinel => {
+        const container = document.querySelector(sentinel.dataset.target);
+        let cargando = false;
+        
+        const observer = new IntersectionObserver(entries => {
+            if (!entries[0].isIntersecting || cargando || !sentinel.dataset.cursor) {
+                return;
+            }
+            cargando = true;
+            fetch(`${sentinel.dataset.url}?cursor=${encodeURIComponent(sentinel.dataset.cursor)}`)
+                .then(response => response.json())
+                .then(data => {
+                    container.insertAdjacentHTML('beforeend', data.html);
+                    sentinel.dataset.cursor = data.siguiente || '';
+                    observer.unobserve(sentinel);
+                    if (data.siguiente) {
+                        // Volver a observar por si el sentinel sigue visible
+                        observer.observe(sentinel);
+                    }
+                })
+                .catch(error => console.error('Error:', error))
+                .finally(() => {
+                    cargando = false;
+                });
+        }, { rootMargin: '400px' });
+        
+        observer.observe(sentinel);
+    });
+
     // Smooth scroll para enlaces internos
     document.querySelectorAll('a[href^="#"]').forEach(anchor => {
         anchor.addEventListener('click', function(e) {
@@ -1,13 +1,21 @@
 // Service Worker para Red Social PWA
+// `flask --app app construir-assets` reemplaza estas dos líneas con la versión
+// del build y los assets con hash (ver assets.py); cada build nuevo es un cache nuevo
+const ASSETS_VERSION = 'dev';
+const PRECACHE_ASSETS = ['/static/css/style.css', '/static/js/main.js'];
+
 // Versión del cache
-const CACHE_NAME = 'red-social-v1';
+const CACHE_NAME = 'red-social-' + ASSETS_VERSION;
 const RUNTIME_CACHE = 'red-social-runtime-v1';
 
+// Páginas que el servidor responde con ETag (ver conditional.py)
+const PAGES_CACHE = 'red-social-pages-v1';
+const REVALIDATE_PATHS = ['/feed', '/usuario/', '/api/feed', '/api/usuario/'];
+
 // Archivos estáticos para cachear al instalar
 const STATIC_CACHE_URLS = [
   '/',
-  '/static/css/style.css',
-  '/static/js/main.js',
+  ...PRECACHE_ASSETS,
   '/static/uploads/default_avatar.png',
   '/login',
   '/register'
@@ -45,7 +53,7 @@ self.addEventListener('activate', (event) => {
       return Promise.all(
         cacheNames
           .filter((cacheName) => {
-            return cacheName !== CACHE_NAME && cacheName !== RUNTIME_CACHE;
+            return cacheName !== CACHE_NAME && cacheName !== RUNTIME_CACHE && cacheName !== PAGES_CACHE;
           })
           .map((cacheName) => {
             console.log('[Service Worker] Eliminando cache antiguo:', cacheName);
@@ -66,6 +74,20 @@ self.addEventListener('fetch', (event) => {
     return;
   }
 
+  const url = new URL(event.request.url);
+
+  // Al cerrar sesión, olvidar las páginas del usuario
+  if (url.pathname === '/logout') {
+    event.waitUntil(caches.delete(PAGES_CACHE));
+    return;
+  }
+
+  // Feed y perfiles: revalidar con ETag y servir la copia guardada si no cambió
+  if (REVALIDATE_PATHS.some((path) => url.pathname.startsWith(path))) {
+    event.respondWith(revalidate(event.request));
+    return;
+  }
+
   // No cachear peticiones a rutas de API
   if (event.request.url.includes('/api/') || 
       event.request.url.includes('/post/') && !event.request.url.includes('/static/')) {
@@ -118,6 +140,47 @@ self.addEventListener('fetch', (event) => {
   );
 });
 
+// Petición condicional con el ETag de la copia guardada: un 304 no trae cuerpo,
+// así que se responde con la copia; sin red también se usa la copia
+function revalidate(request) {
+  return caches.open(PAGES_CACHE).then((cache) => {
+    return cache.match(request).then((cachedResponse) => {
+      const etag = cachedResponse && cachedResponse.headers.get('ETag');
+      let conditional = request;
+      if (etag) {
+        conditional = new Request(request.url, {
+          headers: { 'If-None-Match': etag, 'Accept': request.headers.get('Accept') || '*/*' },
+          credentials: 'same-origin',
+          // Una navegación no puede recibir una respuesta ya redirigida (p. ej. al login)
+          redirect: request.mode === 'navigate' ? 'manual' : 'follow'
+        });
+      }
+
+      return fetch(conditional)
+        .then((response) => {
+          if (response.status === 304 && cachedResponse) {
+            return cachedResponse;
+          }
+          if (response.status === 200 && !response.redirected && response.headers.get('ETag')) {
+            cache.put(request, response.clone());
+          }
+          return response;
+        })
+        .catch(() => {
+          if (cachedResponse) {
+            return cachedResponse;
+          }
+          return caches.match('/').then((response) => {
+            return response || new Response('Sin conexión', {
+              status: 503,
+              headers: { 'Content-Type': 'text/html' }
+            });
+          });
+        });
+    });
+  });
+}
+
 // Manejo de mensajes desde la app
 self.addEventListener('message', (event) => {
   if (event.data && event.data.type === 'SKIP_WAITING') {
@@ -0,0 +1,116 @@
+"""
+Fixtures compartidas por las pruebas
+Cada prueba usa una app nueva con su propia base SQLite en tmp_path; las
+cachés del proceso (usuarios, tarjetas, grafo) no pasan datos de una
+prueba a la siguiente
+"""
+
+import os
+import sys
+
+# Los módulos de la app están en la raíz del repositorio (no es un paquete)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from werkzeug.security import generate_password_hash
+from app import create_app, init_db
+from models import db, grafo, Usuario, Post, Seguimiento
+from seed import PASSWORD
+
+# Un solo hash para todos los usuarios de prueba (calcularlo es lento a propósito)
+_PASSWORD_HASH = generate_password_hash(PASSWORD)
+
+
+@pytest.fixture
+def crear_app(tmp_path):
+    """Fábrica de apps: crear_app(nombre, **config) con las tablas ya creadas"""
+    apps = []
+
+    def crear(nombre='prueba', **configuracion):
+        config = {
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / nombre}.db',
+            'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+            'LIKES_DIRECTORIO_DIARIO': str(tmp_path / 'likes'),
+            'WTF_CSRF_ENABLED': False,
+            'EVENTOS_BACKEND': 'memoria',
+            'USUARIO_CACHE_TTL': 0,
+            'FRAGMENTOS_HABILITADOS': False,
+            # Las tareas periódicas (poda de eventos, ranking) solo en las pruebas que las piden
+            'TRABAJOS_PERIODICOS': False,
+        }
+        config.update(configuracion)
+        app = create_app(config)
+        with app.app_context():
+            init_db()
+        apps.append(app)
+        return app
+
+    grafo.limpiar()
+    yield crear
+    grafo.limpiar()
+    for app in apps:
+        with app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+
+
+@pytest.fixture
+def configuracion():
+    """Config extra de la app de `app`; una prueba la cambia con
+    @pytest.mark.parametrize('configuracion', [{...}])"""
+    return {}
+
+
+@pytest.fixture
+def app(crear_app, configuracion):
+    """App de prueba con un contexto activo durante toda la prueba"""
+    app = crear_app(**configuracion)
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def cliente(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def crear_usuario(app):
+    """Fábrica de usuarios: crear_usuario('ana', seguidos=[beto]) (contraseña de seed.PASSWORD)"""
+    def crear(username, seguidos=(), **datos):
+        datos.setdefault('nombre', username.title())
+        usuario = Usuario(username=username, email=f'{username}@example.com',
+                          password_hash=_PASSWORD_HASH, **datos)
+        db.session.add(usuario)
+        db.session.flush()
+        for seguido in seguidos:
+            db.session.add(Seguimiento(seguidor_id=usuario.id, seguido_id=seguido.id))
+            usuario.seguidos_count += 1
+            seguido.seguidores_count += 1
+        db.session.commit()
+        return usuario
+    return crear
+
+
+@pytest.fixture
+def crear_post(app):
+    """Fábrica de posts que mantiene el contador del autor: crear_post(autor, fecha_creacion=...)"""
+    def crear(autor, contenido='Hola', **datos):
+        post = Post(contenido=contenido, usuario_id=autor.id, **datos)
+        db.session.add(post)
+        autor.posts_count += 1
+        db.session.commit()
+        return post
+    return crear
+
+
+@pytest.fixture
+def iniciar_sesion(cliente):
+    """Iniciar sesión en el cliente de prueba con un usuario creado por crear_usuario"""
+    def iniciar(usuario):
+        respuesta = cliente.post('/login', data={'username': usuario.username, 'password': PASSWORD})
+        assert respuesta.status_code == 302
+        return cliente
+    return iniciar
@@ -0,0 +1,84 @@
+"""
+Archivo de posts viejos: movimiento por lotes y perfil que mezcla caliente y archivo
+"""
+
+from datetime import datetime, timedelta
+import pytest
+from archive import archivo
+from loaders import pagina_perfil
+from models import db, Post, Comentario, Like, PostArchivado, EntradaTimeline
+from pagination import decodificar_cursor
+from timeline import timelines
+
+
+def _perfil_completo(autor, visitante, limite):
+    """Ids de todos los posts del perfil recorriendo las páginas con el cursor"""
+    db.session.refresh(autor)
+    ids, cursor = [], None
+    while True:
+        posts, siguiente = pagina_perfil(autor, visitante.id, cursor, limite=limite)
+        assert len(posts) <= limite
+        ids += [post.id for post in posts]
+        if siguiente is None:
+            return ids
+        cursor = decodificar_cursor(siguiente)
+
+
+def _publicar(crear_post, autor, dias):
+    return crear_post(autor, f'Hace {dias} días', fecha_creacion=datetime.utcnow() - timedelta(days=dias))
+
+
+def test_archivar_mueve_posts_viejos_con_comentarios_y_likes(app, crear_usuario, crear_post):
+    autor = crear_usuario('autor')
+    lector = crear_usuario('lector', seguidos=[autor])
+    viejos = [_publicar(crear_post, autor, dias) for dias in (400, 300, 250, 200, 190)]
+    nuevos = [_publicar(crear_post, autor, dias) for dias in (10, 5, 1)]
+    for post in viejos:
+        db.session.add(Comentario(contenido='Viejo', usuario_id=lector.id, post_id=post.id))
+        db.session.add(Like(usuario_id=lector.id, post_id=post.id))
+    # Los ids más altos de comentario y like quedan en posts recientes
+    db.session.add(Comentario(contenido='Nuevo', usuario_id=lector.id, post_id=nuevos[0].id))
+    db.session.add(Like(usuario_id=lector.id, post_id=nuevos[0].id))
+    db.session.commit()
+    viejos, nuevos = [post.id for post in viejos], [post.id for post in nuevos]
+    esperado = list(reversed(viejos + nuevos))
+
+    movidas = archivo.archivar(edad_dias=180, lote=2)
+
+    assert movidas == {'post': 5, 'comentario': 5, 'like': 5}
+    assert archivo.resumen() == {'post': (3, 5), 'comentario': (1, 5), 'like': (1, 5)}
+    assert {post.id for post in Post.query} == set(nuevos)
+    assert {post.id for post in PostArchivado.query} == set(viejos)
+    db.session.refresh(autor)
+    assert (autor.posts_count, autor.posts_archivados_count) == (8, 5)
+
+    # Volver a ejecutar no mueve nada más
+    assert archivo.archivar(edad_dias=180) == {'post': 0, 'comentario': 0, 'like': 0}
+
+    for limite in (2, 3, 8, 20):
+        assert _perfil_completo(autor, lector, limite) == esperado
+
+
+def test_archivar_conserva_los_posts_con_ids_maximos(app, crear_usuario, crear_post):
+    autor = crear_usuario('autor')
+    ultimo = [_publicar(crear_post, autor, dias) for dias in (400, 300)][-1].id
+
+    assert archivo.archivar(edad_dias=180)['post'] == 1
+    # El post con el id más alto queda en caliente aunque sea viejo
+    assert [post.id for post in Post.query] == [ultimo]
+
+
+@pytest.mark.parametrize('configuracion', [{'SQLITE_PRAGMAS': {'foreign_keys': 'ON'}}])
+def test_archivar_con_claves_foraneas_y_timelines(app, crear_usuario, crear_post):
+    assert db.session.execute(db.text('PRAGMA foreign_keys')).scalar() == 1
+    autor = crear_usuario('autor')
+    seguidor = crear_usuario('seguidor', seguidos=[autor])
+    posts = [_publicar(crear_post, autor, dias).id for dias in (300, 250, 200, 2, 1)]
+    timelines.reconstruir()
+    assert EntradaTimeline.query.filter_by(usuario_id=seguidor.id).count() == 5
+
+    assert archivo.archivar(edad_dias=180, lote=2)['post'] == 3
+
+    assert {entrada.post_id for entrada in EntradaTimeline.query} == set(posts[3:])
+    for limite in (1, 2, 20):
+        assert _perfil_completo(autor, seguidor, limite) == list(reversed(posts))
@@ -0,0 +1,76 @@
+"""
+Exportación e importación: una importación cortada se retoma sin duplicar filas
+"""
+
+import json
+import os
+import pytest
+import backup
+from counters import recalcular_contadores
+from models import db
+from seed import sembrar
+
+
+class Corte(Exception):
+    pass
+
+
+def _filas(app):
+    with app.app_context():
+        return {tabla.name: db.session.execute(db.select(tabla).order_by(tabla.c.id)).all()
+                for tabla in backup.TABLAS}
+
+
+def _cortar_en(monkeypatch, nombre, tabla_de, tabla, llamada):
+    """Hacer fallar backup.<nombre> en su `llamada`-ésima invocación para `tabla`
+
+    `tabla_de(*argumentos)` dice a qué tabla corresponde cada invocación.
+    """
+    original = getattr(backup, nombre)
+    llamadas = []
+
+    def envoltura(*argumentos):
+        if tabla_de(*argumentos) == tabla:
+            llamadas.append(tabla)
+            if len(llamadas) == llamada:
+                raise Corte(f'{nombre} en {tabla}')
+        return original(*argumentos)
+
+    monkeypatch.setattr(backup, nombre, envoltura)
+
+
+def test_importacion_cortada_se_retoma(crear_app, tmp_path, monkeypatch):
+    directorio = str(tmp_path / 'respaldo')
+    origen = crear_app('origen')
+    with origen.app_context():
+        sembrar(usuarios=30, posts=120, comentarios=200, likes=300, seguimientos=150)
+        recalcular_contadores()
+        exportados = backup.exportar(directorio)
+    esperado = _filas(origen)
+    assert exportados['like'] > 100
+
+    destino = crear_app('destino')
+    with destino.app_context():
+        # 1º corte: el lote de likes ya se confirmó pero el punto de control no se escribió
+        # (el punto de control agrega la tabla en curso al final)
+        _cortar_en(monkeypatch, '_escribir_json', lambda ruta, control: list(control)[-1], 'like', 2)
+        with pytest.raises(Corte):
+            backup.importar(directorio, lote=50)
+        db.session.rollback()
+        with open(os.path.join(directorio, backup.PUNTO_CONTROL)) as archivo:
+            assert json.load(archivo)['like'] == 50
+        monkeypatch.undo()
+
+        # 2º corte: a mitad de un lote de seguimientos, antes de confirmarlo
+        _cortar_en(monkeypatch, '_insertar_ignorando', lambda tabla, filas: tabla.name, 'seguimiento', 2)
+        with pytest.raises(Corte):
+            backup.importar(directorio, lote=50)
+        db.session.rollback()
+        monkeypatch.undo()
+
+        assert backup.importar(directorio, lote=50) == exportados
+        assert not os.path.exists(os.path.join(directorio, backup.PUNTO_CONTROL))
+        # Los contadores importados coinciden con las tablas: nada que corregir
+        assert recalcular_contadores() == (0, 0)
+
+    assert _filas(destino) == esperado
@@ -0,0 +1,78 @@
+"""
+Motor de base de datos: pragmas por app y réplica de lectura
+"""
+
+import sqlite3
+import pytest
+from sqlalchemy import event
+from models import db
+from seed import PASSWORD
+
+
+@pytest.fixture
+def configuracion(tmp_path):
+    return {'SQLALCHEMY_REPLICA_URI': f'sqlite:///{tmp_path / "replica"}.db', 'DB_REPLICA_PEGAJOSA': 60}
+
+
+def _pragma(app, nombre):
+    with app.app_context():
+        return db.session.execute(db.text(f'PRAGMA {nombre}')).scalar()
+
+
+def test_pragmas_por_app(crear_app):
+    con_claves = crear_app('con-claves', SQLITE_PRAGMAS={'foreign_keys': 'ON', 'cache_size': -1000})
+    sin_claves = crear_app('sin-claves')
+
+    assert (_pragma(con_claves, 'foreign_keys'), _pragma(con_claves, 'cache_size')) == (1, -1000)
+    assert (_pragma(sin_claves, 'foreign_keys'), _pragma(sin_claves, 'cache_size')) == (0, -20000)
+    assert _pragma(sin_claves, 'journal_mode') == 'wal'
+
+
+def _consultas(engine):
+    """Lista que acumula la primera palabra de cada sentencia ejecutada en `engine`"""
+    sentencias = []
+
+    def registrar(conexion, cursor, sql, parametros, contexto, varias):
+        sentencias.append(sql.split(None, 1)[0].upper())
+
+    event.listen(engine, 'before_cursor_execute', registrar)
+    return sentencias
+
+
+def test_lecturas_a_la_replica_y_escrituras_al_primario(app, cliente, crear_usuario, tmp_path):
+    ana = crear_usuario('ana')
+    crear_usuario('beto')
+    # La réplica arranca como copia del primario
+    with sqlite3.connect(tmp_path / 'prueba.db') as origen, sqlite3.connect(tmp_path / 'replica.db') as destino:
+        origen.backup(destino)
+    en_primario, en_replica = _consultas(db.engines[None]), _consultas(db.engines['replica'])
+
+    def pedir(metodo, url, **opciones):
+        del en_primario[:], en_replica[:]
+        respuesta = cliente.open(url, method=metodo, **opciones)
+        assert respuesta.status_code < 400
+        return respuesta
+
+    def olvidar_escritura():
+        with cliente.session_transaction() as sesion:
+            sesion.pop('ultima_escritura', None)
+
+    # Las vistas que escriben van al primario
+    pedir('POST', '/login', data={'username': ana.username, 'password': PASSWORD})
+    assert en_primario and not en_replica
+    olvidar_escritura()
+
+    # Las vistas de solo lectura van a la réplica
+    pedir('GET', '/usuario/beto')
+    assert en_replica and 'SELECT' not in en_primario
+
+    pedir('POST', '/usuario/beto/seguir')
+    assert 'INSERT' in en_primario and not en_replica
+
+    # Lectura después de escribir: el primario durante DB_REPLICA_PEGAJOSA segundos
+    pedir('GET', '/usuario/beto')
+    assert en_primario and not en_replica
+
+    olvidar_escritura()
+    pedir('GET', '/usuario/beto')
+    assert en_replica and 'SELECT' not in en_primario
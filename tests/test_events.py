@@ -0,0 +1,109 @@
+"""
+Bus de eventos en la base: envío por lotes, lectura con ventana y poda desde la cola
+"""
+
+from datetime import datetime, timedelta
+import pytest
+from events import eventos
+from jobs import trabajos
+from models import db, Evento
+
+SQL = {'EVENTOS_BACKEND': 'sql', 'EVENTOS_INTERVALO_MS': 3600 * 1000}
+
+
+@pytest.fixture
+def configuracion():
+    # El hilo del bus no envía ni lee solo: cada prueba llama a enviar() y leer()
+    return dict(SQL)
+
+
+@pytest.fixture
+def despachados(app):
+    lista = []
+    eventos.bus.iniciar(lambda tipo, datos: lista.append((tipo, datos)))
+    return lista
+
+
+def test_publicar_no_escribe_y_envia_fusionado(app):
+    for cantidad in range(1, 6):
+        eventos.publicar('like', post_id=1, autor_id=2, cantidad_likes=cantidad)
+    eventos.publicar('comentario', post_id=1, autor_id=2, contenido='Hola')
+    eventos.publicar('like', post_id=3, autor_id=2, cantidad_likes=1)
+    assert Evento.query.count() == 0
+
+    assert eventos.bus.enviar() == 3
+    assert eventos.bus.enviar() == 0
+    filas = [(evento.tipo, evento.datos) for evento in Evento.query.order_by(Evento.id)]
+    # Cada evento fusionado queda en el lugar de su última publicación
+    assert [tipo for tipo, _ in filas] == ['like', 'comentario', 'like']
+    assert '"cantidad_likes": 5' in filas[0][1]
+
+
+def _insertar(id_evento, hace=0):
+    db.session.add(Evento(id=id_evento, tipo='post', datos=f'{{"post_id": {id_evento}, "autor_id": 1}}',
+                          fecha_creacion=datetime.utcnow() - timedelta(seconds=hace)))
+    db.session.commit()
+
+
+def _ids(despachados):
+    ids = [datos['post_id'] for _, datos in despachados]
+    del despachados[:]
+    return ids
+
+
+def test_leer_con_ventana_no_saltea_confirmaciones_fuera_de_orden(app, despachados):
+    _insertar(1, hace=60)
+    eventos.bus.asegurar_lector()
+    eventos.bus.leer()
+    assert _ids(despachados) == []
+
+    _insertar(3)
+    eventos.bus.leer()
+    assert _ids(despachados) == [3]
+
+    # El 2 se asignó antes que el 3 pero confirmó después
+    _insertar(2)
+    eventos.bus.leer()
+    assert _ids(despachados) == [2]
+    eventos.bus.leer()
+    assert _ids(despachados) == []
+
+    # Fuera de la ventana el piso avanza y ya no se releen
+    Evento.query.update({'fecha_creacion': datetime.utcnow() - timedelta(seconds=10)})
+    db.session.commit()
+    eventos.bus.leer()
+    assert _ids(despachados) == []
+    assert eventos.bus._piso == 3 and not eventos.bus._entregados
+
+    _insertar(4)
+    eventos.bus.leer()
+    assert _ids(despachados) == [4]
+
+
+@pytest.mark.parametrize('configuracion', [dict(SQL, TRABAJOS_PERIODICOS=True)])
+def test_la_cola_poda_los_eventos(app):
+    _insertar(1, hace=3600)
+    _insertar(2)
+
+    trabajos.trabajar(hasta_vaciar=True)
+    assert [evento.id for evento in Evento.query] == [2]
+    # Ya corrió en este intervalo: no se vuelve a encolar
+    assert 'eventos.podar' not in trabajos.programar()
+
+
+@pytest.mark.parametrize('configuracion', [dict(SQL, EVENTOS_INTERVALO_MS=20)])
+def test_hilo_del_bus_entrega_a_las_conexiones(app, crear_usuario):
+    autor = crear_usuario('autor')
+    lector = crear_usuario('lector', seguidos=[autor])
+    conexion = eventos.suscribir(lector.id)
+    try:
+        eventos.publicar('like', post_id=1, autor_id=autor.id, cantidad_likes=1)
+        eventos.publicar('like', post_id=1, autor_id=autor.id, cantidad_likes=2)
+        recibidos = []
+        for _ in range(50):
+            recibidos += conexion.esperar(timeout=0.1)
+            if recibidos and recibidos[-1][1]['cantidad_likes'] == 2:
+                break
+        assert recibidos[-1] == ('like', {'post_id': 1, 'autor_id': autor.id, 'cantidad_likes': 2})
+    finally:
+        eventos.desuscribir(conexion)
@@ -0,0 +1,80 @@
+"""
+Regresión de consultas del feed
+GET /feed tiene que hacer las mismas consultas SQL con N posts que con 4N:
+cargar_posts trae autores, contadores, likes y comentarios de toda la
+página en una cantidad fija de consultas
+"""
+
+import pytest
+from sqlalchemy import event
+from models import db
+from seed import sembrar, PASSWORD
+from counters import recalcular_contadores
+from timeline import timelines
+from loaders import POSTS_POR_PAGINA
+
+N = 300
+
+
+@pytest.fixture
+def consultas_feed(crear_app):
+    """Sembrar una base con `posts` posts y contar las consultas de un GET /feed"""
+    def medir(posts):
+        # crear_app desactiva la caché de tarjetas: cada post pasa por cargar_posts y la plantilla
+        app = crear_app(f'feed-{posts}', TIMELINE_BACKEND='memoria')
+        with app.app_context():
+            sembrar(usuarios=100, posts=posts, comentarios=posts * 5, likes=posts * 10, seguimientos=2000)
+            recalcular_contadores()
+            timelines.reconstruir()
+
+            cliente = app.test_client()
+            respuesta = cliente.post('/login', data={'username': 'usuario0001', 'password': PASSWORD})
+            assert respuesta.status_code == 302
+            # La primera petición llena las cachés del proceso (usuario, grafo); se mide la segunda
+            assert cliente.get('/feed').status_code == 200
+
+            sentencias = []
+            def contar(conexion, cursor, sentencia, *args):
+                sentencias.append(sentencia)
+            event.listen(db.engine, 'before_cursor_execute', contar)
+            try:
+                respuesta = cliente.get('/feed')
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', contar)
+            assert respuesta.status_code == 200
+            assert respuesta.get_data(as_text=True).count('class="post-card"') == POSTS_POR_PAGINA
+        return sentencias
+    return medir
+
+
+def test_feed_consultas_constantes(consultas_feed):
+    pocas = consultas_feed(N)
+    muchas = consultas_feed(4 * N)
+    assert len(pocas) == len(muchas), '\n'.join(muchas)
+    # La página tiene tamaño fijo: una consulta por tarjeta daría lo mismo con N y 4N
+    assert len(muchas) < POSTS_POR_PAGINA, '\n'.join(muchas)
+
+
+def test_etag_y_vista_leen_el_timeline_una_vez(app, cliente, crear_usuario, crear_post, iniciar_sesion, monkeypatch):
+    autor = crear_usuario('autor')
+    lector = crear_usuario('lector', seguidos=[autor])
+    for numero in range(POSTS_POR_PAGINA + 5):
+        timelines.publicar(crear_post(autor, f'Post {numero}'), autor)
+    timelines.reconstruir()
+    iniciar_sesion(lector)
+    # La primera página crea el token CSRF de la sesión, que forma parte del ETag
+    assert cliente.get('/feed').status_code == 200
+
+    lecturas = []
+    leer = timelines.leer
+    monkeypatch.setattr(timelines, 'leer', lambda *args, **kwargs: lecturas.append(args) or leer(*args, **kwargs))
+
+    for url in ('/feed', '/api/feed'):
+        del lecturas[:]
+        respuesta = cliente.get(url)
+        assert respuesta.status_code == 200 and respuesta.headers['ETag']
+        assert len(lecturas) == 1, url
+        # Sin cambios: 304 con la misma única lectura
+        del lecturas[:]
+        assert cliente.get(url, headers={'If-None-Match': respuesta.headers['ETag']}).status_code == 304
+        assert len(lecturas) == 1, url
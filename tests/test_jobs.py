@@ -0,0 +1,94 @@
+"""
+Cola de trabajos: ejecución, reintentos con espera y recuperación de trabajos colgados
+"""
+
+from datetime import datetime, timedelta
+import pytest
+from jobs import trabajos
+from models import db, Trabajo
+
+LLAMADAS = []
+
+
+@trabajos.tarea('prueba.anotar')
+def _anotar(valor):
+    LLAMADAS.append(valor)
+
+
+@trabajos.tarea('prueba.fallar')
+def _fallar(valor):
+    LLAMADAS.append(valor)
+    raise RuntimeError(f'falla {valor}')
+
+
+@pytest.fixture(autouse=True)
+def _limpiar_llamadas():
+    LLAMADAS.clear()
+
+
+def _disponible_ya(trabajo):
+    """Saltear la espera del reintento"""
+    trabajo.disponible_en = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+
+def test_trabajo_exitoso(app):
+    trabajo = trabajos.encolar('prueba.anotar', valor=7)
+    db.session.commit()
+
+    assert trabajos.trabajar(hasta_vaciar=True) == 1
+    assert LLAMADAS == [7]
+    db.session.refresh(trabajo)
+    assert (trabajo.estado, trabajo.intentos, trabajo.error) == ('hecho', 1, None)
+
+
+def test_reintentos_con_espera_hasta_fallido(app):
+    app.config['TRABAJOS_ESPERA_BASE'] = 60
+    trabajo = trabajos.encolar('prueba.fallar', valor='x')
+    trabajo.max_intentos = 3
+    db.session.commit()
+
+    tomado = trabajos.tomar('prueba')
+    assert trabajos.ejecutar(tomado) is False
+    db.session.refresh(trabajo)
+    assert (trabajo.estado, trabajo.intentos) == ('pendiente', 1)
+    assert 'RuntimeError: falla x' in trabajo.error
+    # Espera exponencial con jitter: entre la mitad y el total de TRABAJOS_ESPERA_BASE
+    espera = (trabajo.disponible_en - datetime.utcnow()).total_seconds()
+    assert 25 < espera <= 60
+    assert trabajos.tomar('prueba') is None
+
+    for intento in (2, 3):
+        _disponible_ya(trabajo)
+        assert trabajos.ejecutar(trabajos.tomar('prueba')) is False
+        db.session.refresh(trabajo)
+        assert trabajo.intentos == intento
+
+    assert trabajo.estado == 'fallido'
+    assert LLAMADAS == ['x', 'x', 'x']
+    assert trabajos.tomar('prueba') is None
+
+    assert trabajos.reintentar_fallidos() == 1
+    db.session.refresh(trabajo)
+    assert (trabajo.estado, trabajo.intentos) == ('pendiente', 0)
+
+
+def test_mantener_recupera_trabajos_colgados(app):
+    colgado = trabajos.encolar('prueba.anotar', valor=1)
+    agotado = trabajos.encolar('prueba.anotar', valor=2)
+    agotado.max_intentos = 1
+    db.session.commit()
+    for trabajo in (colgado, agotado):
+        trabajos.tomar('trabajador-caido')
+    hace_rato = datetime.utcnow() - timedelta(seconds=app.config['TRABAJOS_TIEMPO_MAX'] + 1)
+    Trabajo.query.update({'tomado_en': hace_rato})
+    db.session.commit()
+
+    assert trabajos.mantener() == 1
+    db.session.refresh(colgado)
+    db.session.refresh(agotado)
+    assert colgado.estado == 'pendiente'
+    assert (agotado.estado, agotado.error) == ('fallido', 'Tiempo máximo agotado')
+
+    assert trabajos.trabajar(hasta_vaciar=True) == 1
+    assert LLAMADAS == [1]
@@ -0,0 +1,114 @@
+"""
+Likes diferidos: clics durante un lote en vuelo y repetición del diario de un proceso caído
+"""
+
+import glob
+import os
+import subprocess
+import sys
+import pytest
+import like_buffer
+from like_buffer import buffer_likes
+from models import db, Like
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# El hilo del buffer no vacía solo: cada prueba llama a vaciar() cuando quiere
+DIFERIDOS = {'LIKES_DIFERIDOS': True, 'LIKES_INTERVALO_MS': 3600 * 1000}
+
+
+@pytest.fixture
+def configuracion():
+    return dict(DIFERIDOS)
+
+
+@pytest.fixture
+def buffer(app):
+    yield buffer_likes
+    buffer_likes.detener()
+
+
+def _likes(post):
+    db.session.expire_all()
+    return sorted(usuario_id for usuario_id, in db.session.query(Like.usuario_id).filter_by(post_id=post.id)), \
+        post.likes_count
+
+
+@pytest.mark.parametrize('falla', [True, False])
+@pytest.mark.parametrize('clics', [1, 2, 3])
+def test_clics_durante_un_lote_en_vuelo(app, buffer, crear_usuario, crear_post, monkeypatch, falla, clics):
+    lector = crear_usuario('lector')
+    post = crear_post(crear_usuario('autor'))
+    assert buffer.alternar(lector.id, post) == (True, 1)
+
+    aplicar = like_buffer.aplicar_cambios
+
+    def aplicar_con_clics(cambios):
+        # Mientras se escribe el lote (sin el lock del buffer) el usuario sigue haciendo clic
+        for _ in range(clics):
+            buffer.alternar(lector.id, post)
+        if falla:
+            raise RuntimeError('la base no responde')
+        aplicar(cambios)
+
+    monkeypatch.setattr(like_buffer, 'aplicar_cambios', aplicar_con_clics)
+    buffer.vaciar()
+    monkeypatch.setattr(like_buffer, 'aplicar_cambios', aplicar)
+    buffer.vaciar()
+
+    # Un clic inicial más `clics`: con un total par el like no queda
+    le_gusta = (1 + clics) % 2 == 1
+    assert _likes(post) == (([lector.id], 1) if le_gusta else ([], 0))
+    assert buffer.alternar(lector.id, post)[0] is not le_gusta
+
+
+# Worker que anota likes en su diario y queda vivo (con el diario bloqueado) hasta que lo matan
+WORKER = '''
+import sys
+sys.path.insert(0, {raiz!r})
+from app import create_app
+from like_buffer import buffer_likes
+from models import db, Post
+
+app = create_app({config!r})
+with app.app_context():
+    for usuario_id, post_id in {clics!r}:
+        buffer_likes.alternar(usuario_id, db.session.get(Post, post_id))
+print('listo', flush=True)
+sys.stdin.read()
+'''
+
+
+def test_repetir_el_diario_de_un_worker_caido(app, crear_usuario, crear_post):
+    ana, beto = crear_usuario('ana'), crear_usuario('beto')
+    autor = crear_usuario('autor')
+    uno, dos = crear_post(autor), crear_post(autor)
+    config = dict(TESTING=True, SQLALCHEMY_DATABASE_URI=app.config['SQLALCHEMY_DATABASE_URI'],
+                  LIKES_DIRECTORIO_DIARIO=app.config['LIKES_DIRECTORIO_DIARIO'],
+                  UPLOAD_FOLDER=app.config['UPLOAD_FOLDER'], EVENTOS_BACKEND='memoria', **DIFERIDOS)
+    clics = [(ana.id, uno.id), (ana.id, dos.id), (beto.id, uno.id), (ana.id, dos.id)]
+    worker = subprocess.Popen([sys.executable, '-c', WORKER.format(raiz=RAIZ, config=config, clics=clics)],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        assert worker.stdout.readline() == 'listo\n'
+        diarios = glob.glob(os.path.join(app.config['LIKES_DIRECTORIO_DIARIO'], 'likes-*.journal'))
+        assert len(diarios) == 1
+
+        # El diario de un proceso vivo está bloqueado: nadie más lo aplica
+        assert buffer_likes.recuperar() == 0
+        assert _likes(uno) == ([], 0)
+    finally:
+        worker.kill()
+        worker.wait()
+        worker.stdout.close()
+        worker.stdin.close()
+
+    # Una caída a mitad de escritura deja una línea cortada, que se descarta
+    with open(diarios[0], 'a') as diario:
+        diario.write(f'{beto.id} {dos.id} 1')
+
+    assert buffer_likes.recuperar() == 1
+    assert _likes(uno) == (sorted([ana.id, beto.id]), 2)
+    assert _likes(dos) == ([], 0)
+    assert not os.path.exists(diarios[0])
+    assert buffer_likes.recuperar() == 0
@@ -0,0 +1,30 @@
+"""
+/metrics: solo desde METRICAS_IPS o con el token de METRICAS_TOKEN
+"""
+
+import pytest
+
+REMOTA = {'REMOTE_ADDR': '203.0.113.7'}
+
+
+def _estado(cliente, environ=None, token=None):
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    return cliente.get('/metrics', headers=headers, environ_overrides=environ or {}).status_code
+
+
+def test_metricas_solo_desde_la_maquina(cliente):
+    respuesta = cliente.get('/metrics')
+    assert respuesta.status_code == 200
+    assert 'redsocial_http_requests_total' in respuesta.get_data(as_text=True)
+    assert _estado(cliente, REMOTA) == 404
+    assert _estado(cliente, REMOTA, token='cualquiera') == 404
+
+
+@pytest.mark.parametrize('configuracion', [{'METRICAS_TOKEN': 'secreto', 'METRICAS_IPS': ('10.0.0.2',)}])
+def test_metricas_con_token_o_ip_permitida(cliente):
+    assert _estado(cliente, REMOTA, token='secreto') == 200
+    assert _estado(cliente, REMOTA, token='otro') == 404
+    assert _estado(cliente, REMOTA) == 404
+    assert _estado(cliente, {'REMOTE_ADDR': '10.0.0.2'}) == 200
+    # La lista reemplaza a la de por defecto
+    assert _estado(cliente) == 404
@@ -0,0 +1,73 @@
+"""
+Destacados: decaimiento programado en la cola y paginación estable entre decaimientos
+"""
+
+from datetime import datetime, timedelta
+import pytest
+import ranking as modulo_ranking
+from jobs import trabajos
+from loaders import pagina_destacados
+from models import db, Post, EstadoRanking
+from ranking import ranking
+
+INICIO = datetime(2026, 1, 1, 12, 0, 0)
+
+
+class Reloj(datetime):
+    """datetime con utcnow controlado por la prueba"""
+
+    ahora = INICIO
+
+    @classmethod
+    def utcnow(cls):
+        return cls.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    Reloj.ahora = INICIO
+    monkeypatch.setattr(modulo_ranking, 'datetime', Reloj)
+    return Reloj
+
+
+def test_paginar_entre_decaimientos_no_saltea_ni_repite(app, reloj, crear_usuario, crear_post):
+    lector = crear_usuario('lector')
+    autor = crear_usuario('autor')
+    # Muchos empates (todos los posts sin interacción tienen el mismo puntaje) y valores sueltos
+    puntajes = [3.7] * 12 + [1.0 + numero * 0.7318 for numero in range(18)] + [2.0] * 10
+    for puntaje in puntajes:
+        crear_post(autor, puntaje=puntaje)
+    db.session.add(EstadoRanking(id=1, referencia=INICIO))
+    db.session.commit()
+    esperado = [post_id for post_id, in db.session.query(Post.id).order_by(Post.puntaje.desc(), Post.id.desc())]
+
+    vistos, cursor = [], None
+    while True:
+        posts, siguiente = pagina_destacados(lector.id, cursor, limite=7, todos=True)
+        vistos += [post.id for post in posts]
+        if siguiente is None:
+            break
+        # Entre página y página pasan dos decaimientos
+        for minutos in (37, 53):
+            reloj.ahora += timedelta(minutes=minutos)
+            ranking.decaer()
+        cursor = ranking.decodificar_cursor(siguiente)
+
+    assert vistos == esperado
+
+
+@pytest.mark.parametrize('configuracion', [{'RANKING_RECALCULAR_CADA': None}])
+def test_decaer_se_programa_en_la_cola(app, reloj, crear_usuario, crear_post):
+    post = crear_post(crear_usuario('autor'), puntaje=4.0)
+    db.session.add(EstadoRanking(id=1, referencia=INICIO))
+    db.session.commit()
+
+    encoladas = trabajos.programar()
+    assert 'ranking.decaer' in encoladas and 'ranking.recalcular' not in encoladas
+    # Ya encolado: no se vuelve a encolar dentro del intervalo
+    assert trabajos.programar() == []
+
+    reloj.ahora += timedelta(hours=app.config['RANKING_VIDA_MEDIA_HORAS'])
+    assert trabajos.trabajar(hasta_vaciar=True) == len(encoladas)
+    db.session.expire_all()
+    assert post.puntaje == pytest.approx(2.0)
@@ -0,0 +1,54 @@
+"""
+Búsqueda de usuarios: prefijos, acentos, orden por seguidores e indexado
+"""
+
+from search import buscador, normalizar, terminos
+
+
+def _nombres(usuarios):
+    return [usuario.username for usuario in usuarios]
+
+
+def test_normalizar_y_terminos():
+    assert normalizar('José Núñez') == 'jose nunez'
+    assert terminos('  "Ñandú"  OR  josé* ') == ['nandu', 'or', 'jose']
+
+
+def test_busca_por_prefijo_sin_acentos(app, crear_usuario):
+    crear_usuario('jose', nombre='José Núñez', biografia='Fotógrafo en Córdoba')
+    crear_usuario('maria', nombre='María Pérez', biografia='Ilustradora')
+    buscador.reindexar()
+
+    assert _nombres(buscador.buscar('Jos')) == ['jose']
+    assert _nombres(buscador.buscar('NUÑEZ')) == ['jose']
+    assert _nombres(buscador.buscar('cordoba')) == ['jose']
+    assert _nombres(buscador.buscar('perez maría')) == ['maria']
+    # Todas las palabras deben coincidir
+    assert buscador.buscar('jose perez') == []
+    assert buscador.buscar('"* OR') == []
+    assert buscador.buscar('') == []
+
+
+def test_desempata_por_seguidores(app, crear_usuario):
+    poco = crear_usuario('ana_poco', nombre='Ana')
+    mucho = crear_usuario('ana_mucho', nombre='Ana')
+    for numero in range(5):
+        crear_usuario(f'fan{numero}', seguidos=[mucho])
+    crear_usuario('fan_poco', seguidos=[poco])
+    buscador.reindexar()
+
+    assert _nombres(buscador.buscar('ana')) == ['ana_mucho', 'ana_poco']
+    assert _nombres(buscador.buscar('ana', limite=1)) == ['ana_mucho']
+
+
+def test_registro_actualiza_el_indice(app, cliente):
+    respuesta = cliente.post('/register', data={
+        'username': 'lucia', 'email': 'lucia@example.com', 'nombre': 'Lucía Gómez',
+        'password': 'secreto123', 'confirmar_password': 'secreto123',
+    })
+    assert respuesta.status_code == 302
+    assert _nombres(buscador.buscar('gomez')) == ['lucia']
+
+    cliente.post('/login', data={'username': 'lucia', 'password': 'secreto123'})
+    respuesta = cliente.get('/api/usuarios/buscar', query_string={'q': 'luc'})
+    assert [usuario['username'] for usuario in respuesta.get_json()['usuarios']] == ['lucia']
@@ -0,0 +1,64 @@
+"""
+Timelines en SQL: cada escritura deja a lo sumo TIMELINE_MAX entradas por usuario
+"""
+
+from datetime import datetime, timedelta
+import pytest
+from models import db, EntradaTimeline
+from timeline import timelines
+
+MAXIMO = 5
+
+
+@pytest.fixture
+def configuracion():
+    return {'TIMELINE_BACKEND': 'sql', 'TIMELINE_MAX': MAXIMO}
+
+
+def _timeline(usuario):
+    """post_ids guardados en el timeline del usuario, del más nuevo al más viejo"""
+    return [post_id for post_id, in db.session.query(EntradaTimeline.post_id)
+                                              .filter_by(usuario_id=usuario.id)
+                                              .order_by(EntradaTimeline.fecha_creacion.desc(),
+                                                        EntradaTimeline.post_id.desc())]
+
+
+def _mas_nuevos(posts, cantidad=MAXIMO):
+    return [post.id for post in sorted(posts, key=lambda post: (post.fecha_creacion, post.id), reverse=True)][:cantidad]
+
+
+def test_publicar_y_repartir_recortan_al_maximo(app, crear_usuario, crear_post):
+    autor = crear_usuario('autor')
+    seguidores = [crear_usuario(f'seguidor{numero}', seguidos=[autor]) for numero in range(3)]
+    ahora = datetime.utcnow()
+    posts = []
+    # Más posts que el máximo, y no en orden de fecha: quedan los más nuevos por fecha
+    for horas in (5, 1, 9, 3, 7, 2, 8, 4, 6, 0):
+        post = crear_post(autor, fecha_creacion=ahora - timedelta(hours=horas))
+        timelines.publicar(post, autor)
+        timelines.repartir(post.id)
+        db.session.commit()
+        posts.append(post)
+
+    for usuario in [autor] + seguidores:
+        assert _timeline(usuario) == _mas_nuevos(posts)
+
+
+def test_rellenar_y_recortar(app, crear_usuario, crear_post):
+    lector = crear_usuario('lector')
+    autores = [crear_usuario(f'autor{numero}') for numero in range(2)]
+    ahora = datetime.utcnow()
+    posts = [crear_post(autor, fecha_creacion=ahora - timedelta(minutes=minutos))
+             for minutos in range(8) for autor in autores]
+
+    for autor in autores:
+        lector.seguir(autor)
+        timelines.rellenar(lector, autor)
+        db.session.commit()
+    assert _timeline(lector) == _mas_nuevos(posts)
+
+    # Bajar el máximo y recortar lo que ya estaba guardado
+    timelines.store.maximo = 2
+    assert timelines.store.recortar() == MAXIMO - 2
+    db.session.commit()
+    assert _timeline(lector) == _mas_nuevos(posts, 2)
@@ -0,0 +1,317 @@
+"""
+Timelines materializados para el feed (fan-out en escritura)
+Cada publicación se copia al timeline de los seguidores de su autor desde
+la cola de trabajos; las cuentas con muchísimos seguidores se mezclan al
+leer (fan-out en lectura)
+"""
+
+import heapq
+import threading
+from models import db, Usuario, Post, Seguimiento, EntradaTimeline
+from pagination import anteriores_a
+from jobs import trabajos
+
+
+class SQLTimelineStore:
+    """Timelines guardados en la tabla `timeline` de la base de datos principal
+
+    Como el backend en memoria, cada escritura deja los timelines que toca
+    con a lo sumo `maximo` entradas.
+    """
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+
+    def _recortar_usuario(self, usuario_id):
+        """Borrar las entradas de un timeline que pasan de `maximo`"""
+        sobrantes = db.select(EntradaTimeline.id)\
+                      .where(EntradaTimeline.usuario_id == usuario_id)\
+                      .order_by(EntradaTimeline.fecha_creacion.desc(), EntradaTimeline.post_id.desc())\
+                      .offset(self.maximo)
+        EntradaTimeline.query.filter(EntradaTimeline.id.in_(sobrantes)).delete(synchronize_session=False)
+
+    def _recortar_seguidores(self, autor_id):
+        """Quitar a cada seguidor del autor la entrada que quedó de más al sumarle un post
+
+        Cada reparto agrega una sola entrada por timeline, así que basta con
+        borrar la que quedó en la posición maximo + 1 (una búsqueda por
+        índice por seguidor, sin ordenar los timelines enteros).
+        """
+        entrada = db.aliased(EntradaTimeline)
+        sobrante = db.select(entrada.id)\
+                     .where(entrada.usuario_id == Seguimiento.seguidor_id)\
+                     .order_by(entrada.fecha_creacion.desc(), entrada.post_id.desc())\
+                     .limit(1).offset(self.maximo)\
+                     .scalar_subquery()
+        sobrantes = db.select(sobrante).where(Seguimiento.seguido_id == autor_id)
+        EntradaTimeline.query.filter(EntradaTimeline.id.in_(sobrantes)).delete(synchronize_session=False)
+
+    def publicar(self, autor_id, post_id, fecha, fan_out=True):
+        """Agregar un post al timeline del autor y, si corresponde, al de sus seguidores"""
+        filas = [db.select(db.literal(autor_id))]
+        if fan_out:
+            filas.append(db.select(Seguimiento.seguidor_id).where(Seguimiento.seguido_id == autor_id))
+        destinatarios = db.union_all(*filas).subquery()
+        db.session.execute(
+            db.insert(EntradaTimeline).from_select(
+                ['usuario_id', 'post_id', 'autor_id', 'fecha_creacion'],
+                db.select(destinatarios.c[0], db.literal(post_id), db.literal(autor_id), db.literal(fecha))
+            )
+        )
+        self._recortar_usuario(autor_id)
+        if fan_out:
+            self._recortar_seguidores(autor_id)
+
+    def repartir(self, autor_id, post_id, fecha):
+        """Agregar un post al timeline de los seguidores de su autor que aún no lo tienen"""
+        ya_lo_tiene = db.select(EntradaTimeline.id).where(
+            EntradaTimeline.usuario_id == Seguimiento.seguidor_id,
+            EntradaTimeline.post_id == post_id
+        ).exists()
+        db.session.execute(
+            db.insert(EntradaTimeline).from_select(
+                ['usuario_id', 'post_id', 'autor_id', 'fecha_creacion'],
+                db.select(Seguimiento.seguidor_id, db.literal(post_id), db.literal(autor_id), db.literal(fecha))
+                  .where(Seguimiento.seguido_id == autor_id, ~ya_lo_tiene)
+            )
+        )
+        self._recortar_seguidores(autor_id)
+
+    def rellenar(self, usuario_id, entradas):
+        """Agregar (fecha, post_id, autor_id) al timeline de un usuario, ignorando duplicados"""
+        existentes = {post_id for post_id, in db.session.query(EntradaTimeline.post_id).filter(
+            EntradaTimeline.usuario_id == usuario_id,
+            EntradaTimeline.post_id.in_([post_id for _, post_id, _ in entradas])
+        )}
+        filas = [
+            {'usuario_id': usuario_id, 'post_id': post_id, 'autor_id': autor_id, 'fecha_creacion': fecha}
+            for fecha, post_id, autor_id in entradas if post_id not in existentes
+        ]
+        if filas:
+            db.session.execute(db.insert(EntradaTimeline), filas)
+            self._recortar_usuario(usuario_id)
+
+    def podar(self, usuario_id, autor_id):
+        """Quitar del timeline de un usuario todos los posts de un autor"""
+        EntradaTimeline.query.filter_by(usuario_id=usuario_id, autor_id=autor_id)\
+                             .delete(synchronize_session=False)
+
+    def leer(self, usuario_id, limite, antes=None):
+        """Obtener las últimas entradas (fecha, post_id) del timeline, ya ordenadas"""
+        query = db.session.query(EntradaTimeline.fecha_creacion, EntradaTimeline.post_id)\
+                          .filter(EntradaTimeline.usuario_id == usuario_id)
+        if antes is not None:
+            query = query.filter(anteriores_a(antes, EntradaTimeline.fecha_creacion, EntradaTimeline.post_id))
+        return query.order_by(EntradaTimeline.fecha_creacion.desc(), EntradaTimeline.post_id.desc())\
+                    .limit(limite).all()
+
+    def recortar(self):
+        """Dejar cada timeline con a lo sumo `maximo` entradas
+
+        Las escrituras ya recortan lo que tocan; esto sirve para bases
+        anteriores a eso o después de bajar TIMELINE_MAX.
+        """
+        posicion = db.func.row_number().over(
+            partition_by=EntradaTimeline.usuario_id,
+            order_by=(EntradaTimeline.fecha_creacion.desc(), EntradaTimeline.post_id.desc())
+        ).label('posicion')
+        ranking = db.session.query(EntradaTimeline.id.label('id'), posicion).subquery()
+        sobrantes = db.select(ranking.c.id).where(ranking.c.posicion > self.maximo)
+        return EntradaTimeline.query.filter(EntradaTimeline.id.in_(sobrantes))\
+                                    .delete(synchronize_session=False)
+
+    def vaciar(self):
+        """Eliminar todas las entradas de todos los timelines"""
+        EntradaTimeline.query.delete(synchronize_session=False)
+
+
+class MemoriaTimelineStore:
+    """Timelines en memoria del proceso, pensados para pruebas y desarrollo"""
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self._timelines = {}
+        self._lock = threading.Lock()
+
+    def _agregar(self, usuario_id, entradas):
+        timeline = self._timelines.setdefault(usuario_id, {})
+        timeline.update((post_id, (fecha, autor_id)) for fecha, post_id, autor_id in entradas)
+        if len(timeline) > self.maximo:
+            conservar = heapq.nlargest(self.maximo, timeline.items(), key=lambda item: (item[1][0], item[0]))
+            self._timelines[usuario_id] = dict(conservar)
+
+    def publicar(self, autor_id, post_id, fecha, fan_out=True):
+        """Agregar un post al timeline del autor y, si corresponde, al de sus seguidores"""
+        destinatarios = [autor_id]
+        if fan_out:
+            destinatarios += [seguidor_id for seguidor_id, in db.session.query(Seguimiento.seguidor_id)
+                                                                  .filter_by(seguido_id=autor_id)]
+        with self._lock:
+            for usuario_id in destinatarios:
+                self._agregar(usuario_id, [(fecha, post_id, autor_id)])
+
+    def repartir(self, autor_id, post_id, fecha):
+        """Agregar un post al timeline de los seguidores de su autor"""
+        seguidores = db.session.query(Seguimiento.seguidor_id).filter_by(seguido_id=autor_id)
+        with self._lock:
+            for seguidor_id, in seguidores:
+                self._agregar(seguidor_id, [(fecha, post_id, autor_id)])
+
+    def rellenar(self, usuario_id, entradas):
+        """Agregar (fecha, post_id, autor_id) al timeline de un usuario, ignorando duplicados"""
+        with self._lock:
+            self._agregar(usuario_id, entradas)
+
+    def podar(self, usuario_id, autor_id):
+        """Quitar del timeline de un usuario todos los posts de un autor"""
+        with self._lock:
+            timeline = self._timelines.get(usuario_id, {})
+            for post_id in [post_id for post_id, (_, autor) in timeline.items() if autor == autor_id]:
+                del timeline[post_id]
+
+    def leer(self, usuario_id, limite, antes=None):
+        """Obtener las últimas entradas (fecha, post_id) del timeline, ya ordenadas"""
+        with self._lock:
+            timeline = self._timelines.get(usuario_id, {})
+            entradas = [(fecha, post_id) for post_id, (fecha, _) in timeline.items()
+                        if antes is None or (fecha, post_id) < antes]
+        return heapq.nlargest(limite, entradas)
+
+    def recortar(self):
+        """Los timelines en memoria se recortan al escribir"""
+        return 0
+
+    def vaciar(self):
+        """Eliminar todas las entradas de todos los timelines"""
+        with self._lock:
+            self._timelines.clear()
+
+
+BACKENDS = {
+    'sql': SQLTimelineStore,
+    'memoria': MemoriaTimelineStore,
+}
+
+
+class Timelines:
+    """Extensión de Flask que mantiene los timelines del feed"""
+
+    def __init__(self, app=None):
+        self.store = None
+        self.umbral_fan_out = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TIMELINE_BACKEND', 'sql')
+        app.config.setdefault('TIMELINE_MAX', 800)
+        app.config.setdefault('TIMELINE_UMBRAL_FAN_OUT', 10000)
+
+        backend = BACKENDS[app.config['TIMELINE_BACKEND']]
+        self.store = backend(app.config['TIMELINE_MAX'])
+        self.umbral_fan_out = app.config['TIMELINE_UMBRAL_FAN_OUT']
+        app.extensions['timelines'] = self
+
+    def _es_celebridad(self, usuario):
+        return usuario.seguidores_count >= self.umbral_fan_out
+
+    def publicar(self, post, autor):
+        """Agregar un post nuevo (ya con id) al timeline del autor y encolar el de sus seguidores"""
+        self.store.publicar(autor.id, post.id, post.fecha_creacion, fan_out=False)
+        if not self._es_celebridad(autor):
+            trabajos.encolar('timeline.repartir', usuario_id=autor.id, post_id=post.id)
+
+    def repartir(self, post_id):
+        """Copiar un post a los timelines de los seguidores de su autor"""
+        post = db.session.get(Post, post_id)
+        if post is not None:
+            self.store.repartir(post.usuario_id, post.id, post.fecha_creacion)
+
+    def seguir(self, seguidor, seguido):
+        """Encolar el relleno del timeline de `seguidor` con los posts de `seguido`"""
+        if not self._es_celebridad(seguido):
+            trabajos.encolar('timeline.seguir', usuario_id=seguidor.id,
+                             seguidor_id=seguidor.id, seguido_id=seguido.id)
+
+    def rellenar(self, seguidor, seguido):
+        """Rellenar el timeline de `seguidor` con los posts recientes de `seguido`"""
+        if self._es_celebridad(seguido):
+            return
+        recientes = db.session.query(Post.fecha_creacion, Post.id, Post.usuario_id)\
+                              .filter(Post.usuario_id == seguido.id)\
+                              .order_by(Post.fecha_creacion.desc(), Post.id.desc())\
+                              .limit(self.store.maximo).all()
+        if recientes:
+            self.store.rellenar(seguidor.id, recientes)
+
+    def dejar_de_seguir(self, seguidor, seguido):
+        """Quitar del timeline de `seguidor` los posts de `seguido`"""
+        self.store.podar(seguidor.id, seguido.id)
+
+    def leer(self, usuario, limite, antes=None):
+        """Ids de los posts del feed de `usuario`, del más nuevo al más viejo
+
+        Mezcla el timeline materializado con los posts recientes de las
+        cuentas seguidas que superan el umbral de fan-out. `antes` es un
+        cursor (fecha, post_id) para leer páginas más viejas.
+        """
+        entradas = self.store.leer(usuario.id, limite, antes=antes)
+
+        seguidos = db.session.query(Seguimiento.seguido_id)\
+                             .filter(Seguimiento.seguidor_id == usuario.id)
+        if len(entradas) < limite:
+            # El timeline está acotado a TIMELINE_MAX: más atrás se lee en el momento
+            autores = (Post.usuario_id == usuario.id) | Post.usuario_id.in_(seguidos.scalar_subquery())
+        else:
+            celebridades = seguidos.join(Usuario, Usuario.id == Seguimiento.seguido_id)\
+                                   .filter(Usuario.seguidores_count >= self.umbral_fan_out)
+            autores = Post.usuario_id.in_(celebridades.scalar_subquery())
+
+        query = db.session.query(Post.fecha_creacion, Post.id).filter(autores)
+        if antes is not None:
+            query = query.filter(anteriores_a(antes))
+        entradas += query.order_by(Post.fecha_creacion.desc(), Post.id.desc())\
+                         .limit(limite).all()
+
+        ids = []
+        vistos = set()
+        for _, post_id in sorted(entradas, reverse=True):
+            if post_id not in vistos:
+                vistos.add(post_id)
+                ids.append(post_id)
+        return ids[:limite]
+
+    def reconstruir(self):
+        """Regenerar todos los timelines a partir de los seguimientos y posts existentes"""
+        self.store.vaciar()
+        usuario_ids = [usuario_id for usuario_id, in db.session.query(Usuario.id).order_by(Usuario.id)]
+        for usuario_id in usuario_ids:
+            seguidos = db.session.query(Seguimiento.seguido_id)\
+                                 .join(Usuario, Usuario.id == Seguimiento.seguido_id)\
+                                 .filter(Seguimiento.seguidor_id == usuario_id,
+                                         Usuario.seguidores_count < self.umbral_fan_out)
+            recientes = db.session.query(Post.fecha_creacion, Post.id, Post.usuario_id)\
+                                  .filter((Post.usuario_id == usuario_id) |
+                                          Post.usuario_id.in_(seguidos.scalar_subquery()))\
+                                  .order_by(Post.fecha_creacion.desc(), Post.id.desc())\
+                                  .limit(self.store.maximo).all()
+            if recientes:
+                self.store.rellenar(usuario_id, recientes)
+            db.session.commit()
+        return len(usuario_ids)
+
+
+timelines = Timelines()
+
+
+@trabajos.tarea('timeline.repartir')
+def _tarea_repartir(post_id):
+    timelines.repartir(post_id)
+
+
+@trabajos.tarea('timeline.seguir')
+def _tarea_seguir(seguidor_id, seguido_id):
+    # Si dejó de seguirlo antes de que corriera el trabajo, no hay nada que rellenar
+    seguimiento = Seguimiento.query.filter_by(seguidor_id=seguidor_id, seguido_id=seguido_id).first()
+    if seguimiento is not None:
+        timelines.rellenar(db.session.get(Usuario, seguidor_id), db.session.get(Usuario, seguido_id))
@@ -0,0 +1,85 @@
+"""
+Caché de usuarios para el user_loader de Flask-Login
+Evita el SELECT por clave primaria de `current_user` en cada petición
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+from models import db, Usuario
+
+
+class CacheUsuarios:
+    """LRU acotado con TTL que guarda las columnas de cada Usuario
+
+    Un acierto reconstruye la instancia y la une a la sesión actual con
+    `merge(load=False)`, así que `current_user` sigue funcionando para
+    escrituras sin ir a la base de datos. Los cambios de otros workers se
+    ven a lo sumo `ttl` segundos tarde.
+    """
+
+    def __init__(self, app=None):
+        self.maximo = 10000
+        self.ttl = 30
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self._columnas = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('USUARIO_CACHE_MAX', 10000)
+        app.config.setdefault('USUARIO_CACHE_TTL', 30)
+        self.maximo = app.config['USUARIO_CACHE_MAX']
+        self.ttl = app.config['USUARIO_CACHE_TTL']
+        app.extensions['cache_usuarios'] = self
+
+    def _valores(self, usuario):
+        if self._columnas is None:
+            self._columnas = [atributo.key for atributo in inspect(Usuario).column_attrs]
+        return {columna: getattr(usuario, columna) for columna in self._columnas}
+
+    def cargar(self, usuario_id):
+        """Obtener el usuario desde la caché o, si no está, desde la base de datos"""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(usuario_id)
+            if entrada is not None and entrada[0] > ahora:
+                self._entradas.move_to_end(usuario_id)
+                self.aciertos += 1
+                valores = entrada[1]
+            else:
+                self.fallos += 1
+                valores = None
+
+        if valores is not None:
+            usuario = Usuario(**valores)
+            make_transient_to_detached(usuario)
+            return db.session.merge(usuario, load=False)
+
+        usuario = db.session.get(Usuario, usuario_id)
+        if usuario is not None:
+            with self._lock:
+                self._entradas[usuario_id] = (ahora + self.ttl, self._valores(usuario))
+                self._entradas.move_to_end(usuario_id)
+                while len(self._entradas) > self.maximo:
+                    self._entradas.popitem(last=False)
+        return usuario
+
+    def invalidar(self, *usuario_ids):
+        """Descartar usuarios cuyos datos cambiaron"""
+        with self._lock:
+            for usuario_id in usuario_ids:
+                self._entradas.pop(usuario_id, None)
+
+    def estadisticas(self):
+        """Aciertos, fallos y tamaño actual de la caché"""
+        with self._lock:
+            return {'aciertos': self.aciertos, 'fallos': self.fallos, 'tamano': len(self._entradas)}
+
+
+cache_usuarios = CacheUsuarios()